@@ -0,0 +1,92 @@
+from playwright.sync_api import sync_playwright
+import argparse
+import statistics
+import time
+
+from extract import ROWS_JS, DOM_ROWS_JS, INNER_TEXT_ROWS_JS
+from standin_server import StandinSite, render_table, page as render_page
+
+# Time row extraction for one polling centre's table, old innerText walk vs
+# textContent walk vs the DataTables row data. The table is a stand-in
+# centre of --rows voters; jQuery + DataTables are loaded from --jquery-url /
+# --datatables-url (skipped if they cannot be fetched) and initialised on it
+# client-side with "All" rows drawn, the way the scrapers leave the page.
+
+JQUERY_URL = "https://code.jquery.com/jquery-3.7.1.min.js"
+DATATABLES_URL = "https://cdn.datatables.net/1.13.8/js/jquery.dataTables.min.js"
+
+INIT_DATATABLES_JS = """() => {
+    jQuery('.dataTables_length, .dataTables_info').remove();
+    jQuery('#tbl_data').DataTable({lengthMenu: [[10, 25, 50, 100, -1], [10, 25, 50, 100, 'All']]});
+    jQuery('#tbl_data').DataTable().page.len(-1).draw();
+}"""
+
+METHODS = [
+    ("innerText (old)", INNER_TEXT_ROWS_JS),
+    ("textContent", DOM_ROWS_JS),
+    ("DataTables API", ROWS_JS),
+]
+
+
+def time_method(page, js, repeat):
+    times = []
+    rows = None
+    for _ in range(repeat):
+        # Any cached layout would flatter innerText; dirty it before each run
+        page.evaluate("() => { document.body.style.fontSize = document.body.style.fontSize === '15px' ? '16px' : '15px'; }")
+        started = time.perf_counter()
+        rows = page.evaluate(js)
+        times.append(time.perf_counter() - started)
+    if isinstance(rows, dict):
+        rows = rows["rows"]
+    return times, rows
+
+
+def run(rows, repeat, jquery_url, datatables_url, headless=True):
+    site = StandinSite(rows=rows)
+    html = render_page(render_table(site.voters("2701010101")))
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        page = browser.new_page()
+        page.set_content(html)
+
+        has_datatables = False
+        if jquery_url and datatables_url:
+            try:
+                page.add_script_tag(url=jquery_url)
+                page.add_script_tag(url=datatables_url)
+                page.evaluate(INIT_DATATABLES_JS)
+                has_datatables = True
+            except Exception as e:
+                print(f"DataTables not loaded ({e}); timing the DOM paths only")
+
+        print(f"{rows} rows per centre, {repeat} runs each")
+        baseline = None
+        reference = None
+        for name, js in METHODS:
+            times, extracted = time_method(page, js, repeat)
+            if name == "DataTables API" and not has_datatables:
+                name = "DataTables API (fell back to DOM)"
+            median = statistics.median(times) * 1000
+            if baseline is None:
+                baseline = median
+                reference = extracted
+            same = "same rows" if extracted == [[c.strip() for c in r] for r in reference] else "ROWS DIFFER"
+            print(f"  {name:<34} {median:8.1f} ms/centre  ({baseline - median:+.1f} ms saved, {same})")
+
+        browser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-centre row extraction.")
+    parser.add_argument("--rows", type=int, default=2000, help="Voters in the centre's table")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--jquery-url", default=JQUERY_URL)
+    parser.add_argument("--datatables-url", default=DATATABLES_URL)
+    parser.add_argument("--no-datatables", action="store_true", help="Only time the DOM paths")
+    parser.add_argument("--headed", action="store_true")
+    args = parser.parse_args()
+    if args.no_datatables:
+        args.jquery_url = args.datatables_url = None
+    run(args.rows, args.repeat, args.jquery_url, args.datatables_url, not args.headed)
@@ -0,0 +1,153 @@
+import numpy as np
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from journal import DONE, FAILED
+from standin_server import DEFAULT_CONFIG, start
+
+# End-to-end benchmark of every scraper entry point against standin_server.py,
+# so a change can be measured without touching the live site.
+#
+# Each run gets a fresh folder as its working directory (output, journals,
+# asset cache) and a fresh stand-in, and runs the scraper in its own process.
+# The numbers come from the journal the scraper wrote:
+#   centres/min, rows/s   done centres and their rows over the run's wall time
+#   p50 / p99             per-centre seconds, from the journal entries
+#   peak RSS              largest single process of the run (Python or one of
+#                         the browser's), from wait4()
+# The browser entry points are started headless. work_queue.py needs a
+# coordinator and workers and is not benchmarked here.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TIMEOUT = 3600  # seconds per run
+
+# Scripts that only read module constants are started through this, with
+# SITE_URL pointed at the stand-in and the window hidden
+BOOTSTRAP = "import sys, {module} as m; m.SITE_URL = sys.argv[1]; m.HEADLESS = True; m.run()"
+
+ENTRY_POINTS = {
+    "http": lambda url: [os.path.join(REPO_DIR, "http_scraper.py"), "--base-url", url, "--output-dir", "data"],
+    "async": lambda url: [os.path.join(REPO_DIR, "crawl_async.py"), "--site-url", url, "--output-dir", "data"],
+    "districts": lambda url: ["-c", BOOTSTRAP.format(module="scrape_districts"), url],
+    "all": lambda url: ["-c", BOOTSTRAP.format(module="scrape_all"), url],
+    "lalitpur": lambda url: ["-c", BOOTSTRAP.format(module="scrape_lalitpur"), url],
+}
+
+
+def read_journals(run_dir):
+    # Latest entry per centre, from every journal the run wrote
+    entries = {}
+    for path in glob.glob(os.path.join(run_dir, "**", "*journal.jsonl"), recursive=True):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[(path, entry["key"])] = entry
+    return list(entries.values())
+
+
+def run_once(name, config, keep=False):
+    server, base_url = start(**config)
+    run_dir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_DIR, os.environ.get("PYTHONPATH", "")]))
+    log_path = os.path.join(run_dir, "output.log")
+    try:
+        with open(log_path, "w", encoding="utf-8") as log:
+            started = time.perf_counter()
+            proc = subprocess.Popen([sys.executable] + ENTRY_POINTS[name](base_url), cwd=run_dir, env=env,
+                                    stdout=log, stderr=subprocess.STDOUT)
+            # wait4 rather than wait(): it also returns the process' resource usage
+            while True:
+                pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    break
+                if time.perf_counter() - started > TIMEOUT:
+                    proc.kill()
+                    pid, status, usage = os.wait4(proc.pid, 0)
+                    break
+                time.sleep(0.05)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            elapsed = time.perf_counter() - started
+
+        entries = read_journals(run_dir)
+        done = [e for e in entries if e["status"] == DONE]
+        seconds = [e["seconds"] for e in done if e.get("seconds") is not None]
+        rows = sum(e["rows"] for e in done)
+        result = {
+            "entry": name,
+            "exit": proc.returncode,
+            "seconds": round(elapsed, 2),
+            "centres": len(done),
+            "failed": sum(1 for e in entries if e["status"] == FAILED),
+            "rows": rows,
+            "centres_per_min": round(len(done) / elapsed * 60, 1),
+            "rows_per_sec": round(rows / elapsed, 1),
+            "p50": round(float(np.percentile(seconds, 50)), 3) if seconds else None,
+            "p99": round(float(np.percentile(seconds, 99)), 3) if seconds else None,
+            "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),  # KiB on Linux
+        }
+        if proc.returncode != 0:
+            with open(log_path, encoding="utf-8", errors="replace") as f:
+                result["log_tail"] = f.read()[-2000:]
+        return result
+    finally:
+        server.shutdown()
+        server.server_close()
+        if keep:
+            print(f"  [{name}] run folder kept: {run_dir}")
+        else:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def report(results):
+    print(f"\n{'entry':<10} {'exit':>4} {'centres':>7} {'failed':>6} {'rows':>7} {'centres/min':>11} "
+          f"{'rows/s':>8} {'p50 s':>7} {'p99 s':>7} {'peak RSS':>9}")
+    for r in results:
+        p50 = f"{r['p50']:.3f}" if r["p50"] is not None else "-"
+        p99 = f"{r['p99']:.3f}" if r["p99"] is not None else "-"
+        print(f"{r['entry']:<10} {str(r['exit']):>4} {r['centres']:>7} {r['failed']:>6} {r['rows']:>7} "
+              f"{r['centres_per_min']:>11} {r['rows_per_sec']:>8} {p50:>7} {p99:>7} {r['peak_rss_mb']:>6} MB")
+    for r in results:
+        if "log_tail" in r:
+            print(f"\n--- {r['entry']} exited with {r['exit']}; end of its output:\n{r['log_tail']}")
+
+
+def run(entries, config, repeat=1, keep=False, json_path=None):
+    print(f"Stand-in: {json.dumps(config)}")
+    results = []
+    for name in entries:
+        for i in range(repeat):
+            print(f"Running {name} ({i + 1}/{repeat})...")
+            result = run_once(name, config, keep)
+            print(f"  {result['centres']} centres, {result['rows']} rows in {result['seconds']}s")
+            results.append(result)
+    report(results)
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\nSaved results to {json_path}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers end to end against a local stand-in site.")
+    parser.add_argument("--entry", action="append", choices=list(ENTRY_POINTS),
+                        help="Entry point to run; repeat for several (default: all)")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per entry point")
+    parser.add_argument("--keep", action="store_true", help="Keep each run's folder (output, journals, log)")
+    parser.add_argument("--json", help="Also write the results to this file")
+    for key, value in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value,
+                            help=f"Stand-in {key} (default: {value})")
+    args = parser.parse_args()
+    config = {key: getattr(args, key) for key in DEFAULT_CONFIG}
+    run(args.entry or list(ENTRY_POINTS), config, args.repeat, args.keep, args.json)
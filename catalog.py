@@ -0,0 +1,179 @@
+from playwright.sync_api import sync_playwright
+import argparse
+import sqlite3
+import time
+
+from waits import Waiter
+
+# Local SQLite cache of the administrative hierarchy (the dropdown options of
+# every level). The hierarchy barely changes, so crawlers plan from here and
+# only go back to the live dropdowns when an entry is missing, expired, or a
+# selection made from it fails.
+
+CATALOG_PATH = "catalog.sqlite"
+TTL_SECONDS = 7 * 24 * 3600
+SITE_URL = "https://voterlist.election.gov.np/"
+
+# Cascade order; a level's parent key is the values selected above it
+LEVELS = ["state", "district", "vdc_mun", "ward", "reg_centre"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fetches (
+    level TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (level, parent)
+);
+CREATE TABLE IF NOT EXISTS options (
+    level TEXT NOT NULL,
+    parent TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (level, parent, value)
+);
+"""
+
+
+def parent_key(parents):
+    return "/".join(parents)
+
+
+class Catalog:
+    def __init__(self, path=CATALOG_PATH, ttl=TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def get(self, level, parents):
+        # Cached [(value, text), ...] or None when missing or expired
+        key = parent_key(parents)
+        row = self.conn.execute(
+            "SELECT fetched_at FROM fetches WHERE level = ? AND parent = ?", (level, key)
+        ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            return None
+        return self.conn.execute(
+            "SELECT value, text FROM options WHERE level = ? AND parent = ? ORDER BY position",
+            (level, key),
+        ).fetchall()
+
+    def put(self, level, parents, options):
+        key = parent_key(parents)
+        with self.conn:
+            self.conn.execute("DELETE FROM options WHERE level = ? AND parent = ?", (level, key))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO options VALUES (?, ?, ?, ?, ?)",
+                [(level, key, i, value, text) for i, (value, text) in enumerate(options)],
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO fetches VALUES (?, ?, ?)", (level, key, time.time())
+            )
+
+    def options(self, level, parents, fetch):
+        # Cached options, or fetch() -> [(value, text), ...] and remember them
+        cached = self.get(level, parents)
+        if cached is not None:
+            return cached
+        options = [tuple(o) for o in fetch()]
+        self.put(level, parents, options)
+        return options
+
+    def invalidate(self, level, parents):
+        # Drop one level's entry and everything cached below it
+        key = parent_key(parents)
+        depth = LEVELS.index(level)
+        with self.conn:
+            for lower in LEVELS[depth:]:
+                for table in ("fetches", "options"):
+                    if lower == level:
+                        self.conn.execute(f"DELETE FROM {table} WHERE level = ? AND parent = ?", (lower, key))
+                    else:
+                        self.conn.execute(
+                            f"DELETE FROM {table} WHERE level = ? AND (parent = ? OR parent LIKE ?)",
+                            (lower, key, key + "/%") if key else (lower, "", "%"),
+                        )
+
+    def stats(self):
+        rows = self.conn.execute(
+            "SELECT f.level, COUNT(DISTINCT f.parent), COUNT(o.value), MIN(f.fetched_at) "
+            "FROM fetches f LEFT JOIN options o ON o.level = f.level AND o.parent = f.parent "
+            "GROUP BY f.level"
+        ).fetchall()
+        return sorted(rows, key=lambda r: LEVELS.index(r[0]))
+
+    def close(self):
+        self.conn.close()
+
+
+def get_options(page, selector):
+    select = page.query_selector(selector)
+    if not select:
+        return []
+    results = []
+    for opt in select.query_selector_all("option"):
+        val = opt.get_attribute("value")
+        if val:
+            results.append((val, opt.inner_text().strip()))
+    return results
+
+
+def refresh(catalog, state_ids=None, district_ids=None, site_url=SITE_URL, headless=True):
+    # Re-enumerate the live dropdowns (optionally only some states/districts)
+    waits = Waiter()
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        page = browser.new_page()
+        page.goto(site_url, timeout=60000)
+
+        states = get_options(page, "select#state")
+        catalog.put("state", [], states)
+
+        for state_val, state_text in states:
+            if state_ids and state_val not in state_ids:
+                continue
+            waits.select(page, "select#state", state_val)
+            districts = get_options(page, "select#district")
+            catalog.put("district", [state_val], districts)
+            print(f"{state_text}: {len(districts)} districts")
+
+            for dist_val, dist_text in districts:
+                if district_ids and dist_val not in district_ids:
+                    continue
+                waits.select(page, "select#district", dist_val)
+                muns = get_options(page, "select#vdc_mun")
+                catalog.put("vdc_mun", [state_val, dist_val], muns)
+
+                for mun_val, mun_text in muns:
+                    waits.select(page, "select#vdc_mun", mun_val)
+                    wards = get_options(page, "select#ward")
+                    catalog.put("ward", [state_val, dist_val, mun_val], wards)
+
+                    for ward_val, ward_text in wards:
+                        waits.select(page, "select#ward", ward_val)
+                        centres = get_options(page, "select#reg_centre")
+                        catalog.put("reg_centre", [state_val, dist_val, mun_val, ward_val], centres)
+                    print(f"  {dist_text} -> {mun_text}: {len(wards)} wards")
+
+        browser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the cached State/District/Municipality/Ward/Centre catalog.")
+    parser.add_argument("command", choices=["refresh", "show", "clear"])
+    parser.add_argument("--db", default=CATALOG_PATH)
+    parser.add_argument("--state", action="append", help="Only refresh this state id (repeatable)")
+    parser.add_argument("--district", action="append", help="Only refresh this district id (repeatable)")
+    parser.add_argument("--site-url", default=SITE_URL)
+    args = parser.parse_args()
+
+    catalog = Catalog(args.db)
+    if args.command == "refresh":
+        refresh(catalog, args.state, args.district, args.site_url)
+    elif args.command == "clear":
+        catalog.invalidate("state", [])
+    for level, parents, count, oldest in catalog.stats():
+        age_hours = (time.time() - oldest) / 3600
+        print(f"{level:>10}: {count} options under {parents} parents, oldest {age_hours:.1f} h")
+    catalog.close()
@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from journal import DONE
+from records import VOTER_COLUMNS
+from merge_data import read_output
+from voter_index import DETAILS, normalize_id
+
+# Change detection for re-crawls.
+#
+# Every saved centre keeps a fingerprint in its journal entry: the row count,
+# a hash of its voters ("content") and when its rows were last pulled
+# ("pulled"). Voter rolls change slowly, so a re-crawl does not read every
+# centre again. After Submit it takes the "of N entries" total from the
+# table's first draw and pulls the rows only when
+#   - the total differs from the journal's row count, or
+#   - the rows were last pulled more than REFRESH_DAYS ago.
+# Otherwise the old file stands and only the journal entry is renewed.
+#
+# A centre that is pulled again is compared with the file saved for it last
+# time, before that file is overwritten. Voters added, removed, or with
+# changed details (same Voter ID) are appended to changes.jsonl in the
+# output folder, one line per centre that changed.
+
+REFRESH_DAYS = 30
+CHANGES_NAME = "changes.jsonl"
+UNCHANGED = "unchanged"  # returned by the scrapers instead of rows when the probe matched
+
+
+def row_hashes(frame):
+    # One 64-bit hash per voter of a records.SCHEMA frame (or a piece of one)
+    return pd.util.hash_pandas_object(frame[VOTER_COLUMNS], index=False).to_numpy()
+
+
+def content_hash(frame=None, hashes=None):
+    # Order-independent hash of a centre's voters, from its frame or from
+    # the row_hashes() of its pieces
+    rows = row_hashes(frame) if hashes is None else np.concatenate(hashes) if hashes else np.zeros(0, np.uint64)
+    return hashlib.sha256(np.sort(rows).tobytes()).hexdigest()
+
+
+def voter_frame(df):
+    # Just the voter columns, as stripped strings
+    df = df.reindex(columns=VOTER_COLUMNS).astype("string").fillna("")
+    return df.apply(lambda col: col.str.strip())
+
+
+def diff(old, new):
+    # (added, removed, changed) between two snapshots of one centre. Voters
+    # are matched on Voter ID, or on their details when either side has no
+    # IDs (a file saved in the old layout).
+    old, new = voter_frame(old), voter_frame(new)
+    by_id = (old["Voter ID"] != "").all() and (new["Voter ID"] != "").all()
+    if by_id:
+        old_keys = old["Voter ID"].map(normalize_id)
+        new_keys = new["Voter ID"].map(normalize_id)
+    else:
+        old_keys = old[DETAILS].agg("\t".join, axis=1)
+        new_keys = new[DETAILS].agg("\t".join, axis=1)
+    added = new[~new_keys.isin(old_keys)]
+    removed = old[~old_keys.isin(new_keys)]
+
+    changed = []
+    if by_id:
+        before = old.assign(_key=old_keys).drop_duplicates("_key").set_index("_key")
+        after = new.assign(_key=new_keys).drop_duplicates("_key").set_index("_key")
+        both = before.index.intersection(after.index)
+        before, after = before.loc[both, DETAILS], after.loc[both, DETAILS]
+        for key in both[(before != after).any(axis=1).to_numpy()]:
+            changed.append({
+                "Voter ID": key,
+                "before": before.loc[key].to_dict(),
+                "after": after.loc[key].to_dict(),
+            })
+    return added.to_dict("records"), removed.to_dict("records"), changed
+
+
+class ChangeTracker:
+    def __init__(self, journal, output_dir, refresh_days=REFRESH_DAYS):
+        self.journal = journal
+        self.refresh = refresh_days * 86400
+        self.path = os.path.join(output_dir, CHANGES_NAME)
+        self.stats = {"probed": 0, "unchanged": 0, "pulled": 0, "changed": 0,
+                      "added": 0, "removed": 0, "updated": 0}
+
+    def previous(self, key):
+        # The centre's last successful journal entry, if any
+        entry = self.journal.entries.get(key)
+        return entry if entry is not None and entry["status"] == DONE else None
+
+    def due(self, key, count):
+        # Whether the centre's rows have to be pulled, given the probed total
+        # (None when the page shows no total)
+        self.stats["probed"] += 1
+        entry = self.previous(key)
+        if entry is None or count is None or count != entry["rows"]:
+            return True
+        return time.time() - entry.get("pulled", entry["at"]) >= self.refresh
+
+    def unchanged(self, key, seconds):
+        # Keep the old file and fingerprint; the new entry says when it was checked
+        entry = self.previous(key)
+        self.stats["unchanged"] += 1
+        return self.journal.record(
+            key, DONE, entry["rows"], entry["path"], entry["sha256"], seconds,
+            content=entry.get("content"), pulled=entry.get("pulled", entry["at"]),
+        )
+
+    def fingerprint(self, key, data, content=None):
+        # Call before the new rows overwrite the old file. Logs what changed
+        # and returns the fields to journal with the new file. data is the
+        # centre's frame, or a function reading it back (a centre written in
+        # pages, with its content hash already known), called only for a diff.
+        self.stats["pulled"] += 1
+        if content is None:
+            content = content_hash(data)
+        entry = self.previous(key)
+        if entry is not None and entry.get("content") != content:
+            self.compare(key, entry, data() if callable(data) else data)
+        return {"content": content, "pulled": time.time()}
+
+    def compare(self, key, entry, data):
+        if not entry["path"] or not os.path.exists(entry["path"]):
+            return
+        try:
+            old = read_output(entry["path"])
+        except Exception as e:
+            print(f"      !! Could not read the previous snapshot {entry['path']}: {e}")
+            return
+        added, removed, changed = diff(old, data)
+        if not (added or removed or changed):
+            return  # same voters, only formatting (e.g. ages) differs
+        self.stats["changed"] += 1
+        self.stats["added"] += len(added)
+        self.stats["removed"] += len(removed)
+        self.stats["updated"] += len(changed)
+        print(f"      Changed since last pull: +{len(added)} -{len(removed)} ~{len(changed)} voters")
+        line = {
+            "key": key,
+            "at": time.time(),
+            "previous_at": entry.get("pulled", entry["at"]),
+            "path": entry["path"],
+            "before": len(old),
+            "after": len(data),
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def summary(self):
+        s = self.stats
+        return (f"Change detection: {s['probed']} centres probed, {s['unchanged']} unchanged, "
+                f"{s['pulled']} pulled; {s['changed']} changed (+{s['added']} -{s['removed']} "
+                f"~{s['updated']} voters, see {self.path})")
+
+
+def show(path, since=None):
+    # Print the change log, newest last
+    if not os.path.exists(path):
+        print(f"No changes recorded in {path}.")
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                change = json.loads(line)
+            except ValueError:
+                continue
+            if since is not None and change["at"] < since:
+                continue
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(change["at"]))
+            print(f"{when} {change['key']} ({change['path']}): {change['before']} -> {change['after']} voters")
+            for record in change["added"]:
+                print(f"    + {record['Voter ID']} {record['Name']}")
+            for record in change["removed"]:
+                print(f"    - {record['Voter ID']} {record['Name']}")
+            for record in change["changed"]:
+                print(f"    ~ {record['Voter ID']} {record['before']['Name']} -> {record['after']['Name']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Show the voters added and removed between crawls.")
+    parser.add_argument("--output-dir", default="data", help="Folder holding changes.jsonl")
+    parser.add_argument("--days", type=float, default=None, help="Only changes from the last N days")
+    args = parser.parse_args()
+    since = time.time() - args.days * 86400 if args.days is not None else None
+    show(os.path.join(args.output_dir, CHANGES_NAME), since)
@@ -0,0 +1,266 @@
+from collections import defaultdict
+import psutil
+import asyncio
+import statistics
+
+from catalog import LEVELS
+from metrics import METRICS
+
+# Browser contexts that are replaced before they grow too big.
+#
+# Chromium keeps memory from every "All"-rows table a context has drawn, so a
+# context serving thousands of centres slowly fills up. The pool hands out
+# pages and replaces a context (close, open a fresh one with the same
+# RequestPolicy) when
+#   - it has served MAX_CENTRES centres,
+#   - the browser's processes use more than MAX_RSS_MB together (checked every
+#     CHECK_EVERY centres, once the context has served MIN_CENTRES), or
+#   - a centre failed in it, when the caller says so (crawl_async does, so
+#     the retry starts clean).
+# A planned replacement puts the Navigator back on the ward it was on, so
+# the next centre is one select away as before.
+#
+# Memory per context is the JS heap and DOM node count of its page (CDP
+# Performance.getMetrics). The browser's RSS covers every process under this
+# one (the Playwright driver and all of Chromium's), via psutil. Each
+# replaced context is logged to metrics.jsonl ("context" events), and
+# summary() gives the peaks for tuning the limits.
+
+MAX_CENTRES = 250
+MAX_RSS_MB = 2048
+MIN_CENTRES = 25
+CHECK_EVERY = 10
+PAGE_METRICS = {"JSHeapUsedSize": "heap_mb", "JSHeapTotalSize": "heap_total_mb", "Nodes": "nodes",
+                "Documents": "documents"}
+
+
+def browser_rss_mb():
+    # Resident memory of every process started under this one, in MB
+    total = 0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass  # exited meanwhile
+    return total / 2 ** 20
+
+
+def page_usage(metrics):
+    # CDP Performance.getMetrics result -> {"heap_mb": ..., "nodes": ..., ...}
+    values = {m["name"]: m["value"] for m in metrics["metrics"]}
+    usage = {}
+    for name, key in PAGE_METRICS.items():
+        value = values.get(name, 0)
+        usage[key] = round(value / 2 ** 20, 1) if key.endswith("_mb") else int(value)
+    return usage
+
+
+class PooledContext:
+    # One context, its page and what it has cost so far
+    def __init__(self, serial, context, page, cdp):
+        self.serial = serial
+        self.context = context
+        self.page = page
+        self.cdp = cdp
+        self.nav = None  # set by whoever drives the page (AsyncContextPool users)
+        self.centres = 0
+        self.peak = {"heap_mb": 0.0, "nodes": 0}
+
+    def seen(self, usage):
+        for key in self.peak:
+            self.peak[key] = max(self.peak[key], usage.get(key, 0))
+
+
+class ContextPool:
+    # One context at a time, for the sync scripts: use pool.page and call
+    # pool.release(nav) after every centre
+    def __init__(self, browser, policy, max_centres=MAX_CENTRES, max_rss_mb=MAX_RSS_MB,
+                 check_every=CHECK_EVERY, min_centres=MIN_CENTRES):
+        self.setup(browser, policy, max_centres, max_rss_mb, check_every, min_centres)
+        self.slot = self.open()
+
+    def setup(self, browser, policy, max_centres, max_rss_mb, check_every, min_centres):
+        # Limits and counters, shared with AsyncContextPool (which opens its
+        # contexts later, in start())
+        self.browser = browser
+        self.policy = policy
+        self.max_centres = max_centres
+        self.max_rss_mb = max_rss_mb
+        self.check_every = check_every
+        self.min_centres = min_centres
+        self.opened = 0
+        self.recycled = defaultdict(int)  # reason -> count
+        self.retired = []  # one dict per closed context
+        self.peak_rss = 0.0
+
+    @property
+    def page(self):
+        return self.slot.page
+
+    def open(self):
+        context = self.browser.new_context()
+        self.policy.attach(context)
+        page = context.new_page()
+        cdp = context.new_cdp_session(page)
+        cdp.send("Performance.enable")
+        self.opened += 1
+        return PooledContext(self.opened, context, page, cdp)
+
+    def usage(self, slot):
+        try:
+            usage = page_usage(slot.cdp.send("Performance.getMetrics"))
+        except Exception:
+            usage = {}  # page closed or crashed
+        return self.note(slot, usage)
+
+    def note(self, slot, usage):
+        usage["rss_mb"] = round(browser_rss_mb(), 1)
+        self.peak_rss = max(self.peak_rss, usage["rss_mb"])
+        slot.seen(usage)
+        return usage
+
+    def reason(self, slot, failed, check):
+        # Why slot has to be replaced now, or None. check: a memory reading
+        # taken by the caller (every check_every centres)
+        if failed:
+            return "error"
+        if slot.centres >= self.max_centres:
+            return "centres"
+        if check is not None and slot.centres >= self.min_centres and check["rss_mb"] > self.max_rss_mb:
+            return "rss"
+        return None
+
+    def record(self, slot, reason, usage):
+        return dict(context=slot.serial, centres=slot.centres, reason=reason,
+                    peak_heap_mb=slot.peak["heap_mb"], peak_nodes=slot.peak["nodes"],
+                    rss_mb=usage.get("rss_mb"))
+
+    def retire(self, slot, reason, usage):
+        record = self.record(slot, reason, usage)
+        self.retired.append(record)
+        self.recycled[reason] += 1
+        METRICS.count("recycles", reason=reason)
+        METRICS.event("context", **record)
+        print(f"  ~~ Replacing context {slot.serial} ({reason}) after {slot.centres} centres: "
+              f"heap {usage.get('heap_mb', '?')} MB, {usage.get('nodes', '?')} DOM nodes, "
+              f"browser {usage.get('rss_mb', '?')} MB")
+
+    def release(self, nav=None, failed=False):
+        # After each centre; True when pool.page is a new page
+        slot = self.slot
+        slot.centres += 1
+        check = self.usage(slot) if slot.centres % self.check_every == 0 else None
+        reason = self.reason(slot, failed, check)
+        if reason is None:
+            return False
+        self.recycle(reason, nav)
+        return True
+
+    def recycle(self, reason, nav=None):
+        old = self.slot
+        usage = self.usage(old)
+        # Where the form was, down to the ward (the next centre is selected anyway)
+        selection = []
+        if nav is not None and reason != "error":
+            try:
+                selection = nav.selection()[:len(LEVELS) - 1]
+            except Exception:
+                pass
+        self.retire(old, reason, usage)
+        try:
+            old.context.close()
+        except Exception:
+            pass
+        self.slot = self.open()
+        if nav is not None:
+            try:
+                nav.move_to(self.page, selection)
+            except Exception as e:
+                print(f"  !! Could not restore the form after replacing the context: {e}")
+
+    def close(self):
+        self.retired.append(self.record(self.slot, "end", self.usage(self.slot)))
+        self.slot.context.close()
+
+    def summary(self):
+        heaps = [r["peak_heap_mb"] for r in self.retired] or [0]
+        nodes = [r["peak_nodes"] for r in self.retired] or [0]
+        centres = [r["centres"] for r in self.retired] or [0]
+        reasons = ", ".join(f"{k}={v}" for k, v in sorted(self.recycled.items())) or "none"
+        return (
+            f"contexts: {self.opened} opened, replaced: {reasons}; per context: "
+            f"{statistics.median(centres):.0f} centres, peak heap median {statistics.median(heaps):.0f} MB "
+            f"max {max(heaps):.0f} MB, peak DOM nodes max {max(nodes)}; browser RSS peak {self.peak_rss:.0f} MB"
+        )
+
+
+class AsyncContextPool(ContextPool):
+    # size contexts shared by crawl_async workers. acquire() hands out an
+    # idle one (its page and its slot.nav), release() puts it back, replaced
+    # if it is due. Call await pool.start() first.
+    def __init__(self, browser, policy, size, max_centres=MAX_CENTRES, max_rss_mb=MAX_RSS_MB,
+                 check_every=CHECK_EVERY, min_centres=MIN_CENTRES):
+        self.setup(browser, policy, max_centres, max_rss_mb, check_every, min_centres)
+        self.size = size
+        self.idle = asyncio.Queue()
+        self.slots = []
+
+    async def start(self):
+        for _ in range(self.size):
+            slot = await self.open()
+            self.slots.append(slot)
+            self.idle.put_nowait(slot)
+
+    async def open(self):
+        context = await self.policy.attach(await self.browser.new_context())
+        page = await context.new_page()
+        cdp = await context.new_cdp_session(page)
+        await cdp.send("Performance.enable")
+        self.opened += 1
+        return PooledContext(self.opened, context, page, cdp)
+
+    async def usage(self, slot):
+        try:
+            usage = page_usage(await slot.cdp.send("Performance.getMetrics"))
+        except Exception:
+            usage = {}
+        return self.note(slot, usage)
+
+    async def acquire(self):
+        return await self.idle.get()
+
+    async def release(self, slot, failed=False):
+        slot.centres += 1
+        check = await self.usage(slot) if slot.centres % self.check_every == 0 else None
+        reason = self.reason(slot, failed, check)
+        if reason is not None:
+            slot = await self.recycle(slot, reason)
+        self.idle.put_nowait(slot)
+
+    async def recycle(self, old, reason):
+        usage = await self.usage(old)
+        selection = []
+        if old.nav is not None and reason != "error":
+            try:
+                selection = (await old.nav.selection())[:len(LEVELS) - 1]
+            except Exception:
+                pass
+        self.retire(old, reason, usage)
+        try:
+            await old.context.close()
+        except Exception:
+            pass
+        slot = await self.open()
+        self.slots[self.slots.index(old)] = slot
+        slot.nav = old.nav
+        if slot.nav is not None:
+            try:
+                await slot.nav.move_to(slot.page, selection)
+            except Exception as e:
+                print(f"  !! Could not restore the form after replacing the context: {e}")
+        return slot
+
+    async def close(self):
+        for slot in self.slots:
+            self.retired.append(self.record(slot, "end", await self.usage(slot)))
+            await slot.context.close()
@@ -0,0 +1,298 @@
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
+from collections import namedtuple
+import argparse
+import asyncio
+import os
+import time
+
+from records import build_frame
+from waits import AsyncWaiter
+from resource_policy import AsyncRequestPolicy
+from extract import AsyncTableReader
+from catalog import Catalog, LEVELS
+from navigator import AsyncNavigator
+from regions import RegionSpec, parse_shard, in_shard
+from rate_control import RateController, TIMEOUT, ERROR
+from retry import AsyncRetryPolicy, DeadLetters
+from journal import Journal, centre_key, DONE, FAILED
+from changes import ChangeTracker, UNCHANGED, REFRESH_DAYS
+from metrics import METRICS
+from context_pool import AsyncContextPool
+from scrape_districts import (
+    STATE_ID, DISTRICTS, OUTPUT_DIR, SITE_URL, PAGE_SIZE,
+    OPTIONS_JS, CentreWriter,
+    OUTPUT_FORMAT, ensure_dir, journal_path, save_centre,
+)
+
+# Concurrent version of scrape_districts.run(): expand the hierarchy once into
+# a queue of polling-centre jobs, then drain it with N isolated browser
+# contexts. Each context moves its own form with an AsyncNavigator (only the
+# levels that differ from its previous job are re-selected), so a context
+# never depends on what another one selected.
+
+CONCURRENCY = 4
+REGIONS = [f"{STATE_ID}/{d['id']}" for d in DISTRICTS]  # see regions.py for the syntax
+RETRIES = 2
+WAITS = AsyncWaiter()
+RATE = RateController()  # shared by all workers: one pace for the whole crawl
+RETRY = AsyncRetryPolicy()  # per-step backoff; an open circuit pauses every worker
+TABLE = AsyncTableReader(WAITS, RETRY)
+
+Job = namedtuple("Job", [
+    "state_val", "dist_id", "dist_name", "mun_val", "mun_text",
+    "ward_val", "ward_text", "center_val", "center_text",
+])
+
+
+async def get_options(page, selector):
+    return await page.eval_on_selector_all(f"{selector} option", OPTIONS_JS)
+
+
+async def expand_jobs(page, catalog, regions, shard=None, site_url=SITE_URL):
+    # Plan from the catalog; the browser is only driven for levels that are
+    # missing or expired there. Only branches the region spec allows are
+    # expanded, and only this shard's centres are kept.
+    jobs = []
+    dist_names = {d["id"]: d["name"] for d in DISTRICTS}  # output folder names
+    nav = AsyncNavigator(page, WAITS, site_url, retry=RETRY)
+
+    async def level_options(level, parents):
+        cached = catalog.get(level, parents)
+        if cached is not None:
+            return cached
+        await nav.go(*parents)
+        options = [(o["value"], o["text"]) for o in await get_options(page, f"select#{level}")]
+        catalog.put(level, parents, options)
+        return options
+
+    async def walk(parents, path):
+        level = LEVELS[len(parents)]
+        for value, text in await level_options(level, parents):
+            here = path + [(value, text)]
+            if not regions.allows(here):
+                continue
+            if level != "reg_centre":
+                await walk(parents + [value], here)
+                if level == "district":
+                    print(f"Planned {dist_names.get(value, text)}: {len(jobs)} centres so far")
+                continue
+            (state_val, _), (dist_id, dist_text), (mun_val, mun_text), (ward_val, ward_text), _ = here
+            job = Job(
+                state_val, dist_id, dist_names.get(dist_id, dist_text), mun_val, mun_text,
+                ward_val, ward_text, value, text,
+            )
+            if in_shard(job_key(job), shard):
+                jobs.append(job)
+
+    await walk([], [])
+    return jobs
+
+
+def job_key(job):
+    return centre_key(job.state_val, job.dist_id, job.mun_val, job.ward_val, job.center_val)
+
+
+async def open_centre(nav, job):
+    await nav.go(job.state_val, job.dist_id, job.mun_val, job.ward_val, job.center_val)
+
+
+async def scrape_pages(page, job, page_size, submitted, output_dir, output_format):
+    # scrape_districts.scrape_pages() for one job: page_size rows at a time
+    # into a CentreWriter, which is dropped again if the attempt fails
+    names = (job.dist_name, job.mun_text, job.ward_text, job.center_text)
+    writer = CentreWriter(job_key(job), *names, output_dir, output_format)
+    try:
+        async for rows_data in TABLE.read_pages(page, page_size, submitted):
+            writer.append(rows_data)
+    except BaseException:
+        writer.abort()
+        raise
+    if writer.empty:
+        writer.abort()
+        return build_frame([], *names)
+    return writer
+
+
+async def scrape_data(page, job, tracker=None, page_size=None, output_dir=OUTPUT_DIR, output_format=OUTPUT_FORMAT):
+    # Same steps as scrape_districts.scrape_data(), but failures raise (once
+    # the step's own retries are used up) so the worker can retry the job on
+    # a fresh context. With page_size, a CentreWriter ("pages" mode).
+    key = job_key(job)
+    submitted = False
+    if tracker is not None and tracker.previous(key) is not None:
+        count = await TABLE.count(page)
+        if not tracker.due(key, count):
+            return UNCHANGED
+        submitted = True
+    if page_size:
+        return await scrape_pages(page, job, page_size, submitted, output_dir, output_format)
+    rows_data = (await TABLE.read(page, submitted=submitted))["rows"]
+    return build_frame(rows_data, job.dist_name, job.mun_text, job.ward_text, job.center_text)
+
+
+async def worker(worker_id, pool, queue, output_dir, output_format, retries, failed, tracker, site_url=SITE_URL,
+                 page_size=None):
+    # Each attempt borrows a context from the pool; a failed one is given
+    # back to be replaced, so the retry starts from a clean context
+    journal = tracker.journal
+
+    while True:
+        try:
+            job = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            break
+
+        print(f"[w{worker_id}] {job.dist_name} -> {job.mun_text} -> Ward {job.ward_text} -> {job.center_text}")
+        METRICS.begin()  # this task's stage times now belong to this centre
+        started = time.perf_counter()
+        data = None
+        for attempt in range(1, retries + 2):
+            await RATE.async_wait()
+            attempt_started = time.perf_counter()
+            slot = await pool.acquire()
+            if slot.nav is None:
+                slot.nav = AsyncNavigator(slot.page, WAITS, site_url, retry=RETRY)
+            try:
+                await open_centre(slot.nav, job)
+                data = await scrape_data(slot.page, job, tracker, page_size, output_dir, output_format)
+            except Exception as e:
+                print(f"[w{worker_id}] !! Attempt {attempt} failed: {e}")
+                timed_out = isinstance(e, (TimeoutError, PlaywrightTimeout))
+                RATE.observe(time.perf_counter() - attempt_started, TIMEOUT if timed_out else ERROR)
+                # Retry from a clean context, after a jittered backoff
+                await pool.release(slot, failed=True)
+                if attempt <= retries:
+                    await asyncio.sleep(RETRY.backoff(attempt))
+                continue
+            RATE.observe(time.perf_counter() - attempt_started)
+            await pool.release(slot)
+            break
+
+        if data is UNCHANGED:
+            tracker.unchanged(job_key(job), time.perf_counter() - started)
+            print(f"[w{worker_id}]    Unchanged")
+        elif data is not None and not data.empty:
+            if isinstance(data, CentreWriter):
+                # Written page by page already; moved into place after the diff
+                fingerprint = tracker.fingerprint(job_key(job), data.read, data.content())
+                path, digest = data.close()
+            else:
+                fingerprint = tracker.fingerprint(job_key(job), data)
+                path, digest = save_centre(
+                    data, job_key(job), job.dist_name, job.mun_text, job.ward_text, job.center_text,
+                    output_dir, output_format,
+                )
+            journal.record(job_key(job), DONE, len(data), path, digest, time.perf_counter() - started, **fingerprint)
+            print(f"[w{worker_id}]    Saved {len(data)} rows to {path}")
+        else:
+            journal.record(job_key(job), FAILED, seconds=time.perf_counter() - started)
+            if data is None:
+                failed.append(job)
+
+        queue.task_done()
+
+
+async def crawl(concurrency=CONCURRENCY, retries=RETRIES, output_dir=OUTPUT_DIR, headless=True,
+                site_url=SITE_URL, output_format=OUTPUT_FORMAT, regions=REGIONS, shard=None,
+                recrawl=False, refresh_days=REFRESH_DAYS, page_size=None):
+    # page_size: read each centre that many rows at a time, streamed to its
+    # file ("pages" mode, see scrape_districts.py); None draws every row
+    ensure_dir(output_dir)
+    METRICS.start(output_dir, "async")  # metrics.jsonl and metrics_async.prom, see metrics.py
+    regions = RegionSpec(regions)
+    print(f"Regions: {regions}" + (f", shard {shard[0]}/{shard[1]}" if shard else ""))
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=headless)
+
+        catalog = Catalog()
+        # Shared by every context: images/fonts blocked, JS/CSS from the local cache
+        policy = AsyncRequestPolicy()
+        planner = await policy.attach(await browser.new_context())
+        jobs = await expand_jobs(await planner.new_page(), catalog, regions, shard, site_url)
+        await planner.close()
+
+        journal = Journal(journal_path(output_dir, output_format))
+        # On a re-crawl, saved centres are probed for changes instead of skipped
+        tracker = ChangeTracker(journal, output_dir, refresh_days)
+        queue = asyncio.Queue()
+        for job in jobs:
+            if journal.done(job_key(job)) and not recrawl:
+                continue
+            queue.put_nowait(job)
+        print(f"{queue.qsize()} of {len(jobs)} centres to scrape with {concurrency} contexts")
+
+        # concurrency contexts, replaced every MAX_CENTRES centres or when
+        # the browser uses too much memory (context_pool.py)
+        pool = AsyncContextPool(browser, policy, concurrency)
+        await pool.start()
+        failed = []
+        await asyncio.gather(*[
+            worker(i, pool, queue, output_dir, output_format, retries, failed, tracker, site_url, page_size)
+            for i in range(concurrency)
+        ])
+
+        # Dead letters: one more try for each failed centre at the end of the run
+        if failed:
+            print(f"\nRetrying {len(failed)} failed centres...")
+            for job in failed:
+                queue.put_nowait(job)
+            failed = []
+            await asyncio.gather(*[
+                worker(i, pool, queue, output_dir, output_format, 0, failed, tracker, site_url, page_size)
+                for i in range(min(concurrency, queue.qsize()))
+            ])
+        await pool.close()
+        await browser.close()
+        journal.close()
+
+    # Re-verify the centre lists that led to failures on the next run
+    dead = DeadLetters(os.path.join(output_dir, "dead_letters.jsonl"))
+    for job in failed:
+        catalog.invalidate("reg_centre", [job.state_val, job.dist_id, job.mun_val, job.ward_val])
+        dead.add(
+            job_key(job), (job.state_val, job.dist_id, job.mun_val, job.ward_val, job.center_val),
+            (job.dist_name, job.mun_text, job.ward_text, job.center_text),
+        )
+    catalog.close()
+    dead.save()
+    METRICS.close()
+
+    print(WAITS.summary())
+    print(RATE.summary())
+    print(RETRY.summary())
+    print(tracker.summary())
+    print(policy.summary())
+    print(pool.summary())
+    print(METRICS.summary())
+    if failed:
+        print(f"\n{len(failed)} centres failed after {retries} retries and a final pass:")
+        for job in failed:
+            print(f"  {job.dist_name} -> {job.mun_text} -> Ward {job.ward_text} -> {job.center_text}")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape polling centres with several browser contexts at once.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Number of browser contexts")
+    parser.add_argument("--retries", type=int, default=RETRIES, help="Retries per centre")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--headed", action="store_true", help="Show the browser windows")
+    parser.add_argument("--site-url", default=SITE_URL, help="Site root, e.g. a local standin_server.py")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=OUTPUT_FORMAT)
+    parser.add_argument("--region", action="append", help="province/district/municipality/ward[/centre] globs, "
+                        "IDs or names; repeatable (default: the scrape_districts.py districts)")
+    parser.add_argument("--shard", type=parse_shard, help="k/N: crawl only this machine's share of the centres")
+    parser.add_argument("--recrawl", action="store_true",
+                        help="Probe saved centres and pull only those whose row count changed (see changes.py)")
+    parser.add_argument("--refresh-days", type=float, default=REFRESH_DAYS,
+                        help="On --recrawl, pull a centre anyway if its rows are older than this")
+    parser.add_argument("--pages", action="store_true",
+                        help="Read each centre a page at a time, written as it arrives (for very large centres)")
+    parser.add_argument("--page-size", type=int, default=PAGE_SIZE, help="Rows per page with --pages")
+    args = parser.parse_args()
+    asyncio.run(crawl(
+        args.concurrency, args.retries, args.output_dir, not args.headed, args.site_url, args.format,
+        args.region or REGIONS, args.shard, args.recrawl, args.refresh_days,
+        args.page_size if args.pages else None,
+    ))
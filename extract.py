@@ -0,0 +1,275 @@
+from waits import ROW_STATUS_JS, PAGE_RANGE_JS
+
+# Row extraction for table#tbl_data.
+#
+# The old path walked every rendered <tr> and read cell.innerText, which
+# forces a layout pass over thousands of rows. Here rows come straight from
+# the DataTables instance when the page has one (its data is already loaded,
+# nothing has to be rendered), and otherwise from the DOM via textContent,
+# which needs no layout. Both return one array of string arrays.
+
+# Whether the table is a DataTables instance and whether it pages on the
+# server. A client-side table holds every row already, so the "All" rows
+# redraw can be skipped entirely.
+TABLE_INFO_JS = """() => {
+    const $ = window.jQuery;
+    const api = $ && $.fn.dataTable && $.fn.dataTable.isDataTable('#tbl_data')
+        ? $('#tbl_data').DataTable() : null;
+    return {
+        datatables: !!api,
+        serverSide: !!(api && api.settings()[0].oFeatures.bServerSide),
+    };
+}"""
+
+# Add an "All" (-1) entry to the DataTables length menu and select it
+ALL_ROWS_JS = """() => {
+    const sel = document.querySelector('select[name="tbl_data_length"]');
+    if (sel) {
+        let opt = sel.querySelector('option[value="-1"]');
+        if (!opt) {
+            opt = document.createElement('option');
+            opt.value = "-1";
+            opt.text = "All";
+            opt.dataset.injected = "1";  // removed again by navigator.CLEAN_LENGTH_JS
+            sel.add(opt);
+        }
+        sel.value = "-1";
+        sel.dispatchEvent(new Event('change'));
+    }
+}"""
+
+_TEXT_HELPERS = """
+    const clean = s => s.replace(/[ \\t\\n\\r\\f]+/g, ' ').trim();
+    const scratch = document.createElement('template');
+    const toText = v => {
+        if (v === null || v === undefined) return '';
+        v = String(v);
+        if (v.indexOf('<') === -1 && v.indexOf('&') === -1) return clean(v);
+        scratch.innerHTML = v;
+        return clean(scratch.content.textContent);
+    };
+    const domRows = () => {
+        const rows = document.querySelectorAll('table#tbl_data tbody tr');
+        const out = new Array(rows.length);
+        for (let i = 0; i < rows.length; i++) {
+            const cells = rows[i].cells;
+            const r = new Array(cells.length);
+            for (let j = 0; j < cells.length; j++) r[j] = clean(cells[j].textContent);
+            out[i] = r;
+        }
+        return out;
+    };
+"""
+
+ROWS_JS = """() => {""" + _TEXT_HELPERS + """
+    const $ = window.jQuery;
+    if ($ && $.fn.dataTable && $.fn.dataTable.isDataTable('#tbl_data')) {
+        const data = $('#tbl_data').DataTable()
+            .rows({order: 'applied', search: 'applied'}).data().toArray();
+        if (!data.length || Array.isArray(data[0])) {
+            return {source: 'datatables', rows: data.map(r => r.map(toText))};
+        }
+    }
+    return {source: 'dom', rows: domRows()};
+}"""
+
+# Draw page `index` of `length` rows: through the DataTables API when the
+# page has one, else the way a user would, with the length menu (page 0)
+# and the pager's Next button (only from the page before, so a retried step
+# never skips a page). False when the table cannot be paged.
+PAGE_JS = """([index, length, fromPrevious]) => {
+    const $ = window.jQuery;
+    if ($ && $.fn.dataTable && $.fn.dataTable.isDataTable('#tbl_data')) {
+        const api = $('#tbl_data').DataTable();
+        if (index === 0) api.page.len(length).draw();
+        else api.page(index).draw('page');
+        return true;
+    }
+    if (index === 0) {
+        const sel = document.querySelector('select[name="tbl_data_length"]');
+        if (!sel) return false;
+        let opt = sel.querySelector(`option[value="${length}"]`);
+        if (!opt) {
+            opt = document.createElement('option');
+            opt.value = String(length);
+            opt.text = String(length);
+            opt.dataset.injected = "1";  // removed again by navigator.CLEAN_LENGTH_JS
+            sel.add(opt);
+        }
+        sel.value = String(length);
+        sel.dispatchEvent(new Event('change'));
+        return true;
+    }
+    const next = document.querySelector('#tbl_data_next, #tbl_data_paginate .next');
+    if (!fromPrevious || !next || next.classList.contains('disabled')) return false;
+    next.click();
+    return true;
+}"""
+
+# The rows of the page on screen (DataTables data of the current page, or the DOM)
+PAGE_ROWS_JS = """() => {""" + _TEXT_HELPERS + """
+    const $ = window.jQuery;
+    if ($ && $.fn.dataTable && $.fn.dataTable.isDataTable('#tbl_data')) {
+        const data = $('#tbl_data').DataTable()
+            .rows({page: 'current', order: 'applied', search: 'applied'}).data().toArray();
+        if (!data.length || Array.isArray(data[0])) {
+            return {source: 'datatables', rows: data.map(r => r.map(toText))};
+        }
+    }
+    return {source: 'dom', rows: domRows().filter(r => r.length > 1)};  // not the "No data" row
+}"""
+
+# textContent walk only, without consulting DataTables
+DOM_ROWS_JS = """() => {""" + _TEXT_HELPERS + """
+    return domRows();
+}"""
+
+# The original layout-forcing extraction, kept for comparison
+INNER_TEXT_ROWS_JS = """() => {
+    const rows = Array.from(document.querySelectorAll('table#tbl_data tbody tr'));
+    return rows.map(row => {
+        const cells = Array.from(row.querySelectorAll('td'));
+        return cells.map(cell => cell.innerText.trim());
+    });
+}"""
+
+
+def needs_all_rows(info):
+    # The "All" length hack is only needed when rows are not all loaded
+    return not info["datatables"] or info["serverSide"]
+
+
+def page_span(index, length, total):
+    # (first, last) row numbers on page index, as the info line shows them
+    first = index * length + 1
+    return first, min(total, first + length - 1)
+
+
+def find_submit(page):
+    return page.query_selector("button.btn-success") or page.query_selector("input[type='submit']")
+
+
+class TableReader:
+    # Submit the selected centre, show every row and read them. Each step
+    # raises on failure and is retried on its own by the RetryPolicy, so a
+    # slow redraw repeats the redraw, not the whole centre.
+    def __init__(self, waits, retry):
+        self.waits = waits
+        self.retry = retry
+
+    def submit(self, page):
+        submit_btn = find_submit(page)
+        if not submit_btn:
+            raise RuntimeError("Submit button not found")
+        self.waits.before_submit(page)
+        submit_btn.click()
+        # Wait for the new table to finish its first draw
+        if not self.waits.table(page):
+            raise TimeoutError("Table not found or timed out")
+
+    def show_all_rows(self, page):
+        # Apply the 'All' rows hack, unless DataTables already holds every row
+        if not needs_all_rows(page.evaluate(TABLE_INFO_JS)):
+            return
+        if page.query_selector('select[name="tbl_data_length"]'):
+            page.evaluate(ALL_ROWS_JS)
+            if not self.waits.all_rows(page):
+                raise TimeoutError("Table did not finish drawing all rows")
+
+    def count(self, page):
+        # Submit and take the "of N entries" total off the first draw, without
+        # drawing or reading the rows (None if the page shows no total).
+        # read(page, submitted=True) carries on from here.
+        self.retry.call("submit", self.submit, page)
+        return page.evaluate(ROW_STATUS_JS)["total"]
+
+    def read(self, page, submitted=False):
+        # {"source": ..., "rows": [...]}; raises once a step runs out of retries
+        if not submitted:
+            self.retry.call("submit", self.submit, page)
+        self.retry.call("all_rows", self.show_all_rows, page)
+        return self.retry.call("extract", page.evaluate, ROWS_JS)
+
+    def show_page(self, page, index, length, total):
+        first, last = page_span(index, length, total)
+        shown = page.evaluate(PAGE_RANGE_JS)
+        if shown != [first, last, total]:
+            from_previous = shown is not None and shown[1] == first - 1
+            if not page.evaluate(PAGE_JS, [index, length, from_previous]):
+                raise RuntimeError(f"Cannot page to rows {first}-{last} (table shows {shown})")
+        if not self.waits.page(page, first, last):
+            raise TimeoutError(f"Rows {first}-{last} not drawn")
+
+    def read_pages(self, page, length, submitted=False):
+        # The table length rows at a time, as lists of rows, so only one page
+        # is ever drawn. Raises when a step runs out of retries, and at the
+        # end if the pages do not add up to the table's reported total.
+        if not submitted:
+            self.retry.call("submit", self.submit, page)
+        total = page.evaluate(ROW_STATUS_JS)["total"]
+        if total is None:
+            raise RuntimeError("Table shows no total to page through")
+        seen = 0
+        for index in range((total + length - 1) // length):
+            self.retry.call("page", self.show_page, page, index, length, total)
+            rows = self.retry.call("extract", page.evaluate, PAGE_ROWS_JS)["rows"]
+            seen += len(rows)
+            yield rows
+        if seen != total:
+            raise RuntimeError(f"Pages held {seen} rows, the table reports {total}")
+
+
+class AsyncTableReader(TableReader):
+    # Same steps for playwright.async_api pages (with an AsyncWaiter and AsyncRetryPolicy)
+
+    async def submit(self, page):
+        submit_btn = await page.query_selector("button.btn-success") or await page.query_selector("input[type='submit']")
+        if not submit_btn:
+            raise RuntimeError("Submit button not found")
+        await self.waits.before_submit(page)
+        await submit_btn.click()
+        if not await self.waits.table(page):
+            raise TimeoutError("Table not found or timed out")
+
+    async def show_all_rows(self, page):
+        if not needs_all_rows(await page.evaluate(TABLE_INFO_JS)):
+            return
+        if await page.query_selector('select[name="tbl_data_length"]'):
+            await page.evaluate(ALL_ROWS_JS)
+            if not await self.waits.all_rows(page):
+                raise TimeoutError("Table did not finish drawing all rows")
+
+    async def count(self, page):
+        await self.retry.call("submit", self.submit, page)
+        return (await page.evaluate(ROW_STATUS_JS))["total"]
+
+    async def read(self, page, submitted=False):
+        if not submitted:
+            await self.retry.call("submit", self.submit, page)
+        await self.retry.call("all_rows", self.show_all_rows, page)
+        return await self.retry.call("extract", page.evaluate, ROWS_JS)
+
+    async def show_page(self, page, index, length, total):
+        first, last = page_span(index, length, total)
+        shown = await page.evaluate(PAGE_RANGE_JS)
+        if shown != [first, last, total]:
+            from_previous = shown is not None and shown[1] == first - 1
+            if not await page.evaluate(PAGE_JS, [index, length, from_previous]):
+                raise RuntimeError(f"Cannot page to rows {first}-{last} (table shows {shown})")
+        if not await self.waits.page(page, first, last):
+            raise TimeoutError(f"Rows {first}-{last} not drawn")
+
+    async def read_pages(self, page, length, submitted=False):
+        if not submitted:
+            await self.retry.call("submit", self.submit, page)
+        total = (await page.evaluate(ROW_STATUS_JS))["total"]
+        if total is None:
+            raise RuntimeError("Table shows no total to page through")
+        seen = 0
+        for index in range((total + length - 1) // length):
+            await self.retry.call("page", self.show_page, page, index, length, total)
+            rows = (await self.retry.call("extract", page.evaluate, PAGE_ROWS_JS))["rows"]
+            seen += len(rows)
+            yield rows
+        if seen != total:
+            raise RuntimeError(f"Pages held {seen} rows, the table reports {total}")
@@ -0,0 +1,269 @@
+import requests
+from requests.adapters import HTTPAdapter
+from html.parser import HTMLParser
+import argparse
+import os
+import time
+
+from records import build_frame
+from journal import Journal, centre_key, DONE, FAILED
+from rate_control import RateController, START_RATE, MAX_RATE, TIMEOUT, ERROR
+from retry import RetryPolicy, DeadLetters
+from changes import ChangeTracker
+from metrics import METRICS
+from scrape_districts import (
+    STATE_ID, DISTRICTS, OUTPUT_DIR, OUTPUT_FORMAT, SITE_URL,
+    ensure_dir, journal_path, save_centre,
+)
+
+# Direct HTTP engine: talks to the endpoints behind the form instead of
+# driving a browser. Same records and same data/<District>/<Municipality>/
+# layout as scrape_districts.py.
+
+BASE_URL = SITE_URL
+
+# Endpoint the dropdown change handlers post to. Each level is requested with
+# list_type=<level> plus the parent selections, and answers with <option> tags.
+OPTIONS_PATH = "bbvrs1/index_process_1.php"
+
+# Endpoint the Submit button posts the form to. Answers with table#tbl_data.
+VIEW_PATH = "bbvrs1/view_ward_1.php"
+
+# list_type posted for each dropdown (keyed by the select's id)
+LEVELS = {
+    "district": "district",
+    "vdc_mun": "vdc",
+    "ward": "ward",
+    "reg_centre": "reg_centre",
+}
+
+POOL_SIZE = 10
+REQUEST_TIMEOUT = 60
+RETRY = RetryPolicy()  # backoff and circuit breaking for "options" and "fetch" requests
+
+
+class _OptionParser(HTMLParser):
+    # Options of every <select>, or only of the one with id select_id
+    def __init__(self, select_id=None):
+        super().__init__()
+        self.options = []
+        self.select_id = select_id
+        self._in_select = select_id is None
+        self._value = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "select" and self.select_id is not None:
+            self._in_select = dict(attrs).get("id") == self.select_id
+        elif tag == "option" and self._in_select:
+            self._value = dict(attrs).get("value") or ""
+            self._text = []
+
+    def handle_data(self, data):
+        if self._value is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "select" and self.select_id is not None:
+            self._in_select = False
+        elif tag == "option" and self._value is not None:
+            text = " ".join("".join(self._text).split())
+            if self._value:  # Skip placeholder
+                self.options.append({"text": text, "value": self._value})
+            self._value = None
+
+
+class _TableParser(HTMLParser):
+    # Collects the cell text of every table#tbl_data tbody row
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self._in_table = False
+        self._in_body = False
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table" and dict(attrs).get("id") == "tbl_data":
+            self._in_table = True
+        elif self._in_table and tag == "tbody":
+            self._in_body = True
+        elif self._in_body and tag == "tr":
+            self._row = []
+        elif self._row is not None and tag == "td":
+            self._cell = []
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == "td" and self._cell is not None:
+            self._row.append(" ".join("".join(self._cell).split()))
+            self._cell = None
+        elif tag == "tr" and self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+        elif tag == "tbody":
+            self._in_body = False
+        elif tag == "table":
+            self._in_table = False
+
+
+def parse_options(html, select_id=None):
+    parser = _OptionParser(select_id)
+    parser.feed(html)
+    return parser.options
+
+
+def parse_table(html):
+    parser = _TableParser()
+    parser.feed(html)
+    return parser.rows
+
+
+def make_session(pool_size=POOL_SIZE):
+    # One keep-alive connection pool shared by every request of the run
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"X-Requested-With": "XMLHttpRequest"})
+    return session
+
+
+def get_options(session, level, selected, base_url=BASE_URL):
+    # selected holds the parent selections so far, keyed by select id
+    payload = dict(selected, list_type=LEVELS[level])
+    resp = session.post(base_url + OPTIONS_PATH, data=payload, timeout=REQUEST_TIMEOUT)
+    resp.raise_for_status()
+    return parse_options(resp.text)
+
+
+def fetch_rows(session, state_val, dist_val, mun_val, ward_val, center_val, base_url=BASE_URL):
+    payload = {
+        "state": state_val,
+        "district": dist_val,
+        "vdc_mun": mun_val,
+        "ward": ward_val,
+        "reg_centre": center_val,
+    }
+    resp = session.post(base_url + VIEW_PATH, data=payload, timeout=REQUEST_TIMEOUT)
+    resp.raise_for_status()
+    with METRICS.span("parse"):
+        return parse_table(resp.text)
+
+
+def scrape_data(session, values, district_name, mun_name, ward_name, center_name, base_url=BASE_URL, rate=None):
+    # The centre as a records.SCHEMA frame (empty if the request failed).
+    # rate: optional RateController told how the request went
+    print(f"Processing: {district_name} -> {mun_name} -> Ward {ward_name} -> {center_name}")
+    started = time.perf_counter()
+    try:
+        rows_data = RETRY.call("fetch", fetch_rows, session, *values, base_url=base_url)
+    except requests.RequestException as e:
+        print(f"!! Request failed: {e}")
+        if rate:
+            timed_out = isinstance(e, requests.Timeout)
+            rate.observe(time.perf_counter() - started, TIMEOUT if timed_out else ERROR)
+        return build_frame([], district_name, mun_name, ward_name, center_name)
+
+    if rate:
+        rate.observe(time.perf_counter() - started, None if rows_data else ERROR)
+    print(f"   Fetched {len(rows_data)} rows.")
+    return build_frame(rows_data, district_name, mun_name, ward_name, center_name)
+
+
+def scrape_centre(session, tracker, key, values, names, base_url, rate, output_dir, output_format):
+    # Fetch, save and journal one centre at rate's pace; False if it failed.
+    # The view endpoint answers with every row at once, so there is no cheap
+    # count to probe: a re-crawl fetches each centre and only diffs it.
+    METRICS.begin()  # stage times from here on belong to this centre
+    rate.wait()
+    started = time.perf_counter()
+    data = scrape_data(session, values, *names, base_url, rate)
+    if data.empty:
+        tracker.journal.record(key, FAILED, seconds=time.perf_counter() - started)
+        return False
+    fingerprint = tracker.fingerprint(key, data)
+    path, digest = save_centre(data, key, *names, output_dir, output_format)
+    tracker.journal.record(key, DONE, len(data), path, digest, time.perf_counter() - started, **fingerprint)
+    print(f"      Saved to {path}")
+    return True
+
+
+def run(base_url=BASE_URL, output_dir=OUTPUT_DIR, rate=START_RATE, output_format=OUTPUT_FORMAT, max_rate=MAX_RATE,
+        recrawl=False):
+    ensure_dir(output_dir)
+    METRICS.start(output_dir, "http")  # metrics.jsonl and metrics_http.prom, see metrics.py
+    session = make_session()
+    # Paces centres, speeding up while the site answers well
+    controller = RateController(rate, max_rate=max_rate)
+    journal = Journal(journal_path(output_dir, output_format))
+    dead = DeadLetters(os.path.join(output_dir, "dead_letters.jsonl"))
+    tracker = ChangeTracker(journal, output_dir)
+
+    for district in DISTRICTS:
+        dist_id = district["id"]
+        dist_name = district["name"]
+
+        print(f"\n=== Starting District: {dist_name} ({dist_id}) ===")
+        selected = {"state": STATE_ID, "district": dist_id}
+        mun_options = RETRY.call("options", get_options, session, "vdc_mun", selected, base_url)
+
+        for mun_opt in mun_options:
+            mun_val = mun_opt["value"]
+            mun_text = mun_opt["text"]
+
+            print(f" -> Municipality: {mun_text}")
+
+            mun_selected = dict(selected, vdc_mun=mun_val)
+            for ward_opt in RETRY.call("options", get_options, session, "ward", mun_selected, base_url):
+                ward_val = ward_opt["value"]
+                ward_text = ward_opt["text"]
+                print(f"   -> Ward: {ward_text}")
+
+                ward_selected = dict(mun_selected, ward=ward_val)
+                for center_opt in RETRY.call("options", get_options, session, "reg_centre", ward_selected, base_url):
+                    center_val = center_opt["value"]
+                    center_text = center_opt["text"]
+
+                    key = centre_key(STATE_ID, dist_id, mun_val, ward_val, center_val)
+
+                    if journal.done(key) and not recrawl:
+                        print(f"      [Skipping] Already done: {center_text}")
+                        continue
+                    values = (STATE_ID, dist_id, mun_val, ward_val, center_val)
+                    names = (dist_name, mun_text, ward_text, center_text)
+                    if not scrape_centre(session, tracker, key, values, names, base_url, controller, output_dir, output_format):
+                        dead.add(key, values, names)
+
+    # One more try for the centres that failed, after the site has had a rest
+    if len(dead):
+        print(f"\nRetrying {len(dead)} failed centres...")
+    for key, letter in dead.items():
+        if scrape_centre(session, tracker, key, letter["values"], letter["names"], base_url, controller,
+                         output_dir, output_format):
+            dead.discard(key)
+    dead.save()
+
+    session.close()
+    journal.close()
+    METRICS.close()
+    print(controller.summary())
+    print(RETRY.summary())
+    print(tracker.summary())
+    print(METRICS.summary())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape voter lists over plain HTTP (no browser).")
+    parser.add_argument("--base-url", default=BASE_URL, help="Site root, e.g. a local standin_server.py")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--rate", type=float, default=START_RATE, help="Starting pace, centres per second")
+    parser.add_argument("--max-rate", type=float, default=MAX_RATE, help="Never go faster than this")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=OUTPUT_FORMAT)
+    parser.add_argument("--recrawl", action="store_true",
+                        help="Fetch saved centres again and log what changed (see changes.py)")
+    args = parser.parse_args()
+    run(args.base_url, args.output_dir, args.rate, args.format, args.max_rate, args.recrawl)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import time
+
+from metrics import METRICS
+
+# Append-only checkpoint journal. One JSON line per finished (or failed)
+# polling centre with its row count, output file hash and timing. Resume
+# reads this file once instead of stat-ing every output path, and output
+# files only appear under their final name once fully written.
+
+DONE = "done"
+FAILED = "failed"
+
+
+def centre_key(*values):
+    # Dropdown values from state down to polling centre
+    return "/".join(str(v) for v in values)
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def atomic_save(df, path, **kwargs):
+    # Write to a temp file next to the target, then rename over it. The
+    # temp name keeps the extension so pandas picks the right writer.
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{ext}"
+    if ext == ".xlsx":
+        df.to_excel(tmp_path, **kwargs)
+    else:
+        df.to_csv(tmp_path, **kwargs)
+    digest = file_digest(tmp_path)
+    os.replace(tmp_path, path)
+    return digest
+
+
+def mend_last_line(path):
+    # A crash mid-write leaves a torn last line. Cut it off (or just end it,
+    # if only the newline is missing) so the next record starts on a line of
+    # its own instead of being glued to the fragment and lost on reload.
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        start = end
+        while start > 0:
+            step = min(start, 1 << 16)
+            f.seek(start - step)
+            i = f.read(step).rfind(b"\n")
+            if i >= 0:
+                start = start - step + i + 1
+                break
+            start -= step
+        if start == end:
+            return
+        f.seek(start)
+        try:
+            json.loads(f.read())
+        except ValueError:
+            f.truncate(start)
+        else:
+            f.write(b"\n")
+
+
+class AtomicCsv:
+    # atomic_save() for a CSV that arrives in pieces: append() writes each
+    # frame to the temp file, close() renames it into place
+    def __init__(self, path):
+        self.path = path
+        root, ext = os.path.splitext(path)
+        self.tmp_path = f"{root}.tmp{ext}"
+        self.file = open(self.tmp_path, "w", newline="", encoding="utf-8")
+        self.header = True
+
+    def append(self, df):
+        df.to_csv(self.file, header=self.header, index=False)
+        self.header = False
+
+    def finish(self):
+        # No more pieces; the temp file can be read back
+        if not self.file.closed:
+            self.file.close()
+
+    def close(self):
+        self.finish()
+        digest = file_digest(self.tmp_path)
+        os.replace(self.tmp_path, self.path)
+        return digest
+
+    def abort(self):
+        self.finish()
+        os.remove(self.tmp_path)
+
+
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from a crash
+                    self.entries[entry["key"]] = entry
+            mend_last_line(path)
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.file = open(path, "a", encoding="utf-8")
+
+    def done(self, key):
+        entry = self.entries.get(key)
+        return entry is not None and entry["status"] == DONE
+
+    def record(self, key, status, rows=0, path=None, digest=None, seconds=None, **extra):
+        # extra: further fields kept with the entry (e.g. the fingerprint from changes.py)
+        entry = {
+            "key": key,
+            "status": status,
+            "rows": rows,
+            "path": path,
+            "sha256": digest,
+            "seconds": round(seconds, 3) if seconds is not None else None,
+            "at": time.time(),
+        }
+        entry.update(extra)
+        self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.entries[key] = entry
+        METRICS.centre(entry)
+        return entry
+
+    def close(self):
+        self.file.close()
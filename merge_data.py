@@ -0,0 +1,178 @@
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import argparse
+import hashlib
+import json
+import os
+
+from records import SCHEMA, normalize
+
+# Consolidate everything the scrapers have written into one dataset.
+#
+# Per-centre files (Ward_*.csv / Ward_*.xlsx and Parquet part-*.parquet, in
+# any of the layouts the scripts produce) are parsed across a process pool.
+# Rollups (data/<Municipality>.xlsx, all_voter_list.xlsx) only contribute
+# rows that no per-centre file has. Every file is brought into the typed
+# records.SCHEMA (old shifted layouts realigned, names unified). Parsed files
+# are cached and only re-read when their mtime or size changes.
+
+ROOTS = ["data", "voter_data", "all_voter_list.xlsx"]
+OUTPUT = "merged_voters.parquet"
+CACHE_DIR = ".merge_cache"
+MANIFEST_PATH = os.path.join(CACHE_DIR, "manifest.json")
+CACHE_VERSION = 3  # bump when parse_file() changes, to re-parse everything
+
+# A voter is the same voter if these match, whichever file it came from
+DEDUPE_KEY = ["Polling Centre", "Voter ID", "Name", "Age", "Gender", "Spouse Name", "Parent Name"]
+
+
+def is_centre_file(path):
+    name = os.path.basename(path)
+    return name.startswith("Ward_") or name.startswith("part-")
+
+
+def discover(roots=ROOTS):
+    centre_files, rollup_files = [], []
+    for root in roots:
+        if os.path.isfile(root):
+            paths = [root]
+        else:
+            paths = [
+                os.path.join(dirpath, name)
+                for dirpath, dirnames, filenames in os.walk(root)
+                for name in filenames
+            ]
+        for path in sorted(paths):
+            root_name, ext = os.path.splitext(path)
+            if ext not in (".csv", ".xlsx", ".parquet") or root_name.endswith(".tmp"):
+                continue
+            if ext == ".parquet" and not os.path.basename(path).startswith("part-"):
+                continue
+            (centre_files if is_centre_file(path) else rollup_files).append(path)
+    return centre_files, rollup_files
+
+
+def cache_path(path):
+    name = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"{name}.parquet")
+
+
+def read_output(path):
+    # One file written by any scraper, in records.SCHEMA
+    if path.endswith(".xlsx"):
+        df = pd.read_excel(path, dtype=str, keep_default_na=False)
+    elif path.endswith(".parquet"):
+        df = pd.read_parquet(path)
+        # district=/municipality=/ward= directories hold the location
+        for part in os.path.dirname(path).split(os.sep):
+            if "=" in part:
+                key, value = part.split("=", 1)
+                df[key] = value
+    else:
+        df = pd.read_csv(path, dtype=str, keep_default_na=False, encoding="utf-8")
+    return normalize(df)
+
+
+def parse_file(path):
+    # Runs in a worker process: parse one file and cache it as Parquet
+    df = read_output(path)
+    df["Source File"] = path
+    df["Source Row"] = range(len(df))
+    df.to_parquet(cache_path(path), index=False)
+    return path, len(df)
+
+
+def load_manifest():
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    return {}
+
+
+def save_manifest(manifest):
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def refresh_cache(paths, workers=None):
+    # Re-parse only files whose mtime/size changed since the last merge
+    if not os.path.exists(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+    manifest = load_manifest()
+    stale = []
+    for path in paths:
+        st = os.stat(path)
+        signature = [st.st_mtime, st.st_size, CACHE_VERSION]
+        if manifest.get(path) != signature or not os.path.exists(cache_path(path)):
+            stale.append(path)
+            manifest[path] = signature
+
+    print(f"{len(paths) - len(stale)} files unchanged, parsing {len(stale)}...")
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(parse_file, stale, chunksize=16))
+
+    # Forget files that no longer exist
+    for path in list(manifest):
+        if not os.path.exists(path):
+            del manifest[path]
+    save_manifest(manifest)
+
+
+def load_cached(paths):
+    frames = [pd.read_parquet(cache_path(p)) for p in paths]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def load_all(roots=ROOTS, workers=None, include_rollups=True):
+    # Every scraped voter once, in records.SCHEMA
+    centre_files, rollup_files = discover(roots)
+    if not include_rollups:
+        rollup_files = []
+    print(f"Found {len(centre_files)} centre files and {len(rollup_files)} rollups.")
+    refresh_cache(centre_files + rollup_files, workers)
+
+    centres = load_cached(centre_files)
+    rollups = load_cached(rollup_files)
+    merged = pd.concat([centres, rollups], ignore_index=True)
+    if merged.empty:
+        return merged
+    # Files have their own categories, which concat turns back into text
+    categories = {c: "category" for c, t in SCHEMA.items() if t == "category"}
+    merged = merged.astype(dict(categories, **{"Source File": "category"}))
+
+    # Per-centre rows come first, so rollup copies of the same voter are dropped
+    key = [c for c in DEDUPE_KEY if c in merged.columns]
+    before = len(merged)
+    merged = merged.drop_duplicates(subset=key, keep="first")
+    from_rollups = (merged.index >= len(centres)).sum()
+    print(f"{before - len(merged)} duplicates dropped, {from_rollups} rows only found in rollups.")
+    return merged.reset_index(drop=True)
+
+
+def merge(roots=ROOTS, output=OUTPUT, workers=None, include_rollups=True):
+    merged = load_all(roots, workers, include_rollups)
+    if merged.empty:
+        print("Nothing to merge.")
+        return merged
+
+    tmp_path = output + ".tmp"
+    if output.endswith(".parquet"):
+        merged.to_parquet(tmp_path, index=False)
+    else:
+        merged.to_csv(tmp_path, index=False, encoding="utf-8")
+    os.replace(tmp_path, output)
+    print(f"Saved {len(merged)} voters to {output}")
+    return merged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge all scraped voter files into one dataset.")
+    parser.add_argument("roots", nargs="*", default=ROOTS, help="Folders or files to merge")
+    parser.add_argument("--output", default=OUTPUT, help=".parquet or .csv")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--no-rollups", action="store_true", help="Ignore municipality / all-district rollups")
+    args = parser.parse_args()
+    merge(args.roots, args.output, args.workers, not args.no_rollups)
@@ -0,0 +1,221 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import bisect
+import json
+import os
+import threading
+import time
+
+# Where a run's time goes, per stage of a centre, and what it produced.
+#
+# The shared steps time themselves into METRICS: every RetryPolicy
+# operation (goto, select, submit, all_rows, page, extract, options, fetch,
+# including its retries and backoff), every Waiter wait (wait_options,
+# wait_table, wait_all_rows, wait_page, nested inside their step),
+# the pacing pause, parsing (http) and saving. Journal.record closes the
+# centre: its stage times are written as one JSON line and the run counters
+# (centres, rows) go up; retries, failed operations and wait timeouts are
+# counted as they happen.
+#
+# An entry point calls METRICS.start(output_dir, "<name>") and, at the end,
+# METRICS.close(). That writes to the output folder:
+#   metrics.jsonl          run_start / centre / run_end events, one per line
+#   metrics_<name>.prom    Prometheus text format, rewritten every PROM_EVERY
+#                          seconds and at the end (node_exporter textfile
+#                          collector)
+# Stage times are kept per task (contextvars), so concurrent crawl_async
+# workers each log their own centre. work_queue.py workers send theirs with
+# each finished centre and the coordinator logs them.
+
+LOG_NAME = "metrics.jsonl"
+PROM_EVERY = 15  # seconds between rewrites of the .prom file during a run
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+COUNTERS = {
+    "centres": "Centres recorded in the journal, by status",
+    "rows": "Voter rows saved",
+    "retries": "Operations retried after a failure, by operation",
+    "failures": "Operations that failed every attempt, by operation",
+    "timeouts": "Waits that timed out, by wait",
+    "recycles": "Browser contexts replaced, by reason (context_pool.py)",
+}
+
+_stages = ContextVar("centre_stages", default=None)
+
+
+def prom_path(output_dir, entry):
+    return os.path.join(output_dir, f"metrics_{entry}.prom")
+
+
+def labels_text(labels):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        if i < len(BUCKETS):
+            self.buckets[i] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def lines(self, name, labels):
+        out, running = [], 0
+        for bound, n in zip(BUCKETS, self.buckets):
+            running += n
+            out.append(f"{name}_bucket{labels_text(labels + [('le', bound)])} {running}")
+        out.append(f"{name}_bucket{labels_text(labels + [('le', '+Inf')])} {self.count}")
+        out.append(f"{name}_sum{labels_text(labels)} {self.sum:.6f}")
+        out.append(f"{name}_count{labels_text(labels)} {self.count}")
+        return out
+
+
+class Metrics:
+    def __init__(self):
+        self.entry = None
+        self.log = None
+        self.prom_path = None
+        self.lock = threading.Lock()
+        self.stages = defaultdict(Histogram)
+        self.centre_seconds = Histogram()
+        self.counters = defaultdict(int)  # (name, ((label, value), ...)) -> count
+        self.started = time.time()
+        self.written = 0.0
+
+    def start(self, output_dir, entry):
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        self.entry = entry
+        self.log = open(os.path.join(output_dir, LOG_NAME), "a", encoding="utf-8")
+        self.prom_path = prom_path(output_dir, entry)
+        self.started = time.time()
+        self.event("run_start")
+
+    def begin(self):
+        # Start a fresh centre: every entry point calls this as it takes up
+        # a centre (per task in crawl_async), so what ran before it, such as
+        # the page load and dropdown reads, is not charged to that centre
+        _stages.set({})
+
+    def take(self):
+        # {stage: seconds} of the current centre, which ends here
+        stages = _stages.get() or {}
+        _stages.set({})
+        return stages
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.stages[stage].observe(seconds)
+        stages = _stages.get()
+        if stages is None:
+            stages = {}
+            _stages.set(stages)
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def count(self, name, n=1, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += n
+
+    def centre(self, entry):
+        # Called by Journal.record with the new entry
+        stages = self.take()
+        self.count("centres", status=entry["status"])
+        self.count("rows", entry["rows"] or 0)
+        if entry["seconds"] is not None:
+            with self.lock:
+                self.centre_seconds.observe(entry["seconds"])
+        self.event("centre", key=entry["key"], status=entry["status"], rows=entry["rows"],
+                   seconds=entry["seconds"], stages={k: round(v, 3) for k, v in stages.items()})
+        if self.prom_path and time.time() - self.written >= PROM_EVERY:
+            self.write_prom()
+
+    def event(self, name, **fields):
+        if self.log is None:
+            return
+        line = dict({"at": round(time.time(), 3), "event": name, "entry": self.entry}, **fields)
+        with self.lock:
+            self.log.write(json.dumps(line, ensure_ascii=False) + "\n")
+            self.log.flush()
+
+    def totals(self):
+        # {"centres": {"done": n, ...}, "rows": n, ...} for the run_end event
+        out = {}
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                if labels:
+                    out.setdefault(name, {})[",".join(str(v) for _, v in labels)] = value
+                else:
+                    out[name] = value
+        return out
+
+    def render(self):
+        base = [("entry", self.entry or "")]
+        lines = [
+            "# HELP scraper_stage_seconds Time spent in each stage of a centre",
+            "# TYPE scraper_stage_seconds histogram",
+        ]
+        with self.lock:
+            for stage, hist in sorted(self.stages.items()):
+                lines += hist.lines("scraper_stage_seconds", base + [("stage", stage)])
+            lines += [
+                "# HELP scraper_centre_seconds Time per centre, as journaled",
+                "# TYPE scraper_centre_seconds histogram",
+            ]
+            lines += self.centre_seconds.lines("scraper_centre_seconds", base)
+            for name, help_text in COUNTERS.items():
+                lines += [f"# HELP scraper_{name}_total {help_text}", f"# TYPE scraper_{name}_total counter"]
+                for (counter, labels), value in sorted(self.counters.items()):
+                    if counter == name:
+                        lines.append(f"scraper_{name}_total{labels_text(base + list(labels))} {value}")
+        lines += [
+            "# HELP scraper_run_start_time_seconds When the run started",
+            "# TYPE scraper_run_start_time_seconds gauge",
+            f"scraper_run_start_time_seconds{labels_text(base)} {self.started:.3f}",
+            "# HELP scraper_last_update_time_seconds When this file was written",
+            "# TYPE scraper_last_update_time_seconds gauge",
+            f"scraper_last_update_time_seconds{labels_text(base)} {time.time():.3f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def write_prom(self):
+        # Atomic, so a collector never reads half a file
+        self.written = time.time()
+        tmp_path = self.prom_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, self.prom_path)
+
+    def close(self):
+        self.event("run_end", seconds=round(time.time() - self.started, 3), totals=self.totals())
+        if self.prom_path:
+            self.write_prom()
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def summary(self):
+        with self.lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1].sum)
+            lines = [
+                f"{stage:>13}: n={hist.count} total={hist.sum:.1f}s mean={hist.sum / hist.count:.3f}s"
+                for stage, hist in stages if hist.count
+            ]
+        return "stage timings (nested waits included in their step):\n" + "\n".join(lines)
+
+
+# One registry per process, like the journal each entry point opens
+METRICS = Metrics()
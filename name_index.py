@@ -0,0 +1,329 @@
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import os
+import re
+import time
+import unicodedata
+
+from merge_data import ROOTS, load_all
+
+# Name search over everything the scrapers have written.
+#
+# Every name field (Name, Spouse Name, Parent Name) of every voter is
+# normalized and cut into character trigrams; a word contributes its
+# trigrams with a leading space, so " रा" marks the start of a word. The
+# inverted index maps each trigram to the sorted list of (row, field) pairs
+# it occurs in. A query is cut the same way, the posting lists are
+# intersected (smallest first) and the few candidates left are checked:
+# every query word must start a word of the same field.
+#
+# The index is a directory of flat arrays read with np.memmap, so a search
+# touches only the trigrams it asks for and the rows it prints:
+#   grams.u64     sorted trigram keys (three code points packed in 64 bits)
+#   offsets.u64   where each trigram's postings start (one extra at the end)
+#   postings.u32  row * len(FIELDS) + field, sorted per trigram
+#   rgrams/roffsets/rpostings   the same for romanized keys (--romanized)
+#   rows.jsonl + rows.u64       one JSON line per voter, and line offsets
+#   meta.json
+
+INDEX_DIR = "name_index"
+FIELDS = ["Name", "Spouse Name", "Parent Name"]
+SHOWN = ["Voter ID", "Name", "Age", "Gender", "Spouse Name", "Parent Name",
+         "District", "Municipality", "Ward No", "Polling Centre"]
+N = 3
+LIMIT = 20
+
+NUKTA = "़"
+
+# Spellings of the same name that differ only in ways people do not type
+# consistently: long/short vowels, nukta, chandrabindu, व/ब, joiners
+FOLD = str.maketrans({
+    "ी": "ि", "ू": "ु", "ई": "इ", "ऊ": "उ",
+    "ँ": "ं", NUKTA: None, "व": "ब",
+    "‌": None, "‍": None,
+})
+NOT_LETTER = re.compile(r"[^\wऀ-ॿ]+")
+
+# Devanagari -> plain Latin, close to how Nepali names are usually spelled
+# in English (inherent "a" after consonants, dropped at the end of a word)
+CONSONANTS = {
+    "क": "k", "ख": "kh", "ग": "g", "घ": "gh", "ङ": "ng",
+    "च": "ch", "छ": "chh", "ज": "j", "झ": "jh", "ञ": "n",
+    "ट": "t", "ठ": "th", "ड": "d", "ढ": "dh", "ण": "n",
+    "त": "t", "थ": "th", "द": "d", "ध": "dh", "न": "n",
+    "प": "p", "फ": "ph", "ब": "b", "भ": "bh", "म": "m",
+    "य": "y", "र": "r", "ल": "l", "व": "b", "श": "sh", "ष": "sh", "स": "s", "ह": "h",
+}
+VOWELS = {
+    "अ": "a", "आ": "a", "इ": "i", "ई": "i", "उ": "u", "ऊ": "u", "ऋ": "ri",
+    "ए": "e", "ऐ": "ai", "ओ": "o", "औ": "au",
+}
+MATRAS = {
+    "ा": "a", "ि": "i", "ी": "i", "ु": "u", "ू": "u", "ृ": "ri",
+    "े": "e", "ै": "ai", "ो": "o", "ौ": "au",
+}
+SIGNS = {"ं": "n", "ँ": "n", "ः": "h"}
+VIRAMA = "्"
+# Folded the same way on both sides so "Bishnu", "Vishnu" and "Krishna"
+# meet what the transliteration produces
+ROMAN_FOLD = [("ee", "i"), ("oo", "u"), ("chh", "ch"), ("sh", "s"), ("ph", "f"), ("v", "b"), ("w", "b"), ("x", "ks"), ("z", "j"), ("q", "k")]
+REPEATS = re.compile(r"(.)\1+")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFC", str(text)).lower().translate(FOLD)
+    return " ".join(NOT_LETTER.sub(" ", text).split())
+
+
+def romanize(text):
+    out = []
+    for word in unicodedata.normalize("NFC", str(text)).split():
+        latin = []
+        pending = False  # a consonant still carrying its inherent "a"
+        for ch in word:
+            if ch in CONSONANTS:
+                if pending:
+                    latin.append("a")
+                latin.append(CONSONANTS[ch])
+                pending = True
+            elif ch in MATRAS:
+                latin.append(MATRAS[ch])
+                pending = False
+            elif ch == VIRAMA:
+                pending = False
+            elif ch == NUKTA:
+                continue
+            else:
+                if pending:
+                    latin.append("a")
+                pending = False
+                latin.append(SIGNS.get(ch) or VOWELS.get(ch) or (ch if ch.isascii() else ""))
+        out.append("".join(latin))
+    return fold_roman(" ".join(out))
+
+
+def fold_roman(text):
+    text = NOT_LETTER.sub(" ", text.lower())
+    for old, new in ROMAN_FOLD:
+        text = text.replace(old, new)
+    return " ".join(REPEATS.sub(r"\1", text).split())
+
+
+def gram_keys(text):
+    # Trigram keys of every word, each word read with a leading space
+    keys = set()
+    for word in text.split():
+        word = " " + word
+        for i in range(len(word) - N + 1):
+            a, b, c = word[i:i + N]
+            keys.add((ord(a) << 42) | (ord(b) << 21) | ord(c))
+    return keys
+
+
+def query_words(query, roman):
+    if roman:
+        # A trailing "a" is as often typed as not ("Krishna" / "krisn")
+        return [w[:-1] if len(w) > 2 and w.endswith("a") else w for w in fold_roman(query).split()]
+    return normalize(query).split()
+
+
+def matches(words, text):
+    # Every query word starts some word of text
+    field_words = text.split()
+    return all(any(fw.startswith(w) for fw in field_words) for w in words)
+
+
+def build_postings(columns, key_fn):
+    # columns: one sequence of strings per field. Names repeat a lot, so each
+    # distinct value is cut into trigrams once and its keys repeated per row.
+    all_keys, all_postings = [], []
+    for field, column in enumerate(columns):
+        codes, uniques = pd.factorize(pd.Series(column, dtype=str))
+        grams = [np.fromiter(sorted(gram_keys(key_fn(u))), dtype=np.uint64) for u in uniques]
+        lengths = np.array([len(g) for g in grams], dtype=np.int64)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]) if len(grams) else np.zeros(0, np.int64)
+        flat = np.concatenate(grams) if grams else np.zeros(0, np.uint64)
+
+        row_lengths = lengths[codes]
+        total = int(row_lengths.sum())
+        row_starts = np.repeat(np.cumsum(row_lengths) - row_lengths, row_lengths)
+        index = np.repeat(starts[codes], row_lengths) + (np.arange(total) - row_starts)
+        all_keys.append(flat[index])
+        all_postings.append(np.repeat(
+            np.arange(len(codes), dtype=np.uint32) * len(FIELDS) + field, row_lengths
+        ).astype(np.uint32))
+
+    keys = np.concatenate(all_keys)
+    postings = np.concatenate(all_postings)
+    order = np.lexsort((postings, keys))
+    keys, postings = keys[order], postings[order]
+    grams, first = np.unique(keys, return_index=True)
+    offsets = np.append(first, len(keys)).astype(np.uint64)
+    return grams, offsets, postings
+
+
+def save_array(index_dir, name, array):
+    array.tofile(os.path.join(index_dir, name))
+
+
+def build(roots=ROOTS, index_dir=INDEX_DIR, romanized=False, workers=None):
+    started = time.perf_counter()
+    voters = load_all(roots, workers)
+    if voters.empty:
+        print("Nothing to index.")
+        return
+    for column in SHOWN:
+        if column not in voters.columns:
+            voters[column] = ""
+    tmp_dir = index_dir + ".tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    # The rows themselves, for printing results
+    offsets = [0]
+    with open(os.path.join(tmp_dir, "rows.jsonl"), "wb") as f:
+        for row in voters[SHOWN].astype("string").fillna("").itertuples(index=False):
+            line = (json.dumps(dict(zip(SHOWN, row)), ensure_ascii=False) + "\n").encode("utf-8")
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    save_array(tmp_dir, "rows.u64", np.array(offsets, dtype=np.uint64))
+
+    columns = [voters[field].tolist() for field in FIELDS]
+    sets = [("", normalize)] + ([("r", romanize)] if romanized else [])
+    for prefix, key_fn in sets:
+        grams, gram_offsets, postings = build_postings(columns, key_fn)
+        save_array(tmp_dir, f"{prefix}grams.u64", grams)
+        save_array(tmp_dir, f"{prefix}offsets.u64", gram_offsets)
+        save_array(tmp_dir, f"{prefix}postings.u32", postings)
+        print(f"{'Romanized' if prefix else 'Devanagari'} keys: {len(grams)} trigrams, {len(postings)} postings")
+
+    meta = {"rows": len(voters), "fields": FIELDS, "n": N, "romanized": romanized, "roots": list(roots)}
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    # Swap the finished index in; a search never sees half of one
+    if os.path.exists(index_dir):
+        old_dir = index_dir + ".old"
+        os.replace(index_dir, old_dir)
+        os.replace(tmp_dir, index_dir)
+        for name in os.listdir(old_dir):
+            os.remove(os.path.join(old_dir, name))
+        os.rmdir(old_dir)
+    else:
+        os.replace(tmp_dir, index_dir)
+    print(f"Indexed {len(voters)} voters into {index_dir}/ in {time.perf_counter() - started:.1f}s")
+
+
+class NameIndex:
+    def __init__(self, index_dir=INDEX_DIR):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.row_offsets = self._map("rows.u64", np.uint64)
+        self.rows = open(os.path.join(index_dir, "rows.jsonl"), "rb")
+        self.sets = {False: self._load_set("")}
+        if self.meta["romanized"]:
+            self.sets[True] = self._load_set("r")
+
+    def _map(self, name, dtype):
+        path = os.path.join(self.index_dir, name)
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+
+    def _load_set(self, prefix):
+        return (
+            self._map(f"{prefix}grams.u64", np.uint64),
+            self._map(f"{prefix}offsets.u64", np.uint64),
+            self._map(f"{prefix}postings.u32", np.uint32),
+        )
+
+    def postings(self, key, roman):
+        grams, offsets, postings = self.sets[roman]
+        i = int(np.searchsorted(grams, np.uint64(key)))
+        if i == len(grams) or int(grams[i]) != key:
+            return np.zeros(0, dtype=np.uint32)
+        return postings[int(offsets[i]):int(offsets[i + 1])]
+
+    def row(self, number):
+        start, end = int(self.row_offsets[number]), int(self.row_offsets[number + 1])
+        self.rows.seek(start)
+        return json.loads(self.rows.read(end - start))
+
+    def search(self, query, fields=None, limit=LIMIT):
+        # (matches, candidates checked); matches are (row dict, matched field)
+        roman = query.isascii()
+        if roman and roman not in self.sets:
+            raise ValueError("Index has no romanized keys; rebuild it with --romanized")
+        words = query_words(query, roman)
+        keys = gram_keys(" ".join(words))
+        if not keys:
+            raise ValueError(f"Query {query!r} is too short to search")
+        lists = sorted((self.postings(k, roman) for k in keys), key=len)
+        candidates = lists[0]
+        for other in lists[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, other, assume_unique=True)
+        if fields:
+            wanted = [FIELDS.index(f) for f in fields]
+            candidates = candidates[np.isin(candidates % len(FIELDS), wanted)]
+
+        results, seen, checked = [], set(), 0
+        text_fn = romanize if roman else normalize
+        for posting in candidates:
+            number, field = divmod(int(posting), len(FIELDS))
+            if number in seen:
+                continue
+            checked += 1
+            row = self.row(number)
+            if matches(words, text_fn(row[FIELDS[field]])):
+                seen.add(number)
+                results.append((row, FIELDS[field]))
+                if len(results) == limit:
+                    break
+        return results, len(candidates)
+
+    def close(self):
+        self.rows.close()
+
+
+def search(query, index_dir=INDEX_DIR, fields=None, limit=LIMIT):
+    started = time.perf_counter()
+    index = NameIndex(index_dir)
+    try:
+        results, candidates = index.search(query, fields, limit)
+    except ValueError as e:
+        print(f"!! {e}")
+        index.close()
+        return []
+    elapsed = (time.perf_counter() - started) * 1000
+    for row, field in results:
+        where = " -> ".join(str(row[c]) for c in ["District", "Municipality", "Ward No", "Polling Centre"] if row[c])
+        via = "" if field == "Name" else f"  [{field}: {row[field]}]"
+        print(f"{row['Voter ID']:>12}  {row['Name']}, {row['Age']} {row['Gender']}  ({where}){via}")
+    more = " (showing the first matches)" if len(results) == limit else ""
+    print(f"{len(results)} matches from {candidates} candidates in {elapsed:.1f} ms{more}")
+    index.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query a name search index over the scraped voters.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="Index everything merge_data.py would merge")
+    build_cmd.add_argument("roots", nargs="*", default=ROOTS, help="Folders or files to index")
+    build_cmd.add_argument("--index", default=INDEX_DIR)
+    build_cmd.add_argument("--romanized", action="store_true", help="Also index Latin spellings (ram bahadur)")
+    build_cmd.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    search_cmd = sub.add_parser("search", help="Find voters by name")
+    search_cmd.add_argument("query", help="Name or start of name words, in Devanagari or Latin letters")
+    search_cmd.add_argument("--index", default=INDEX_DIR)
+    search_cmd.add_argument("--field", action="append", choices=FIELDS, help="Only these fields (repeatable)")
+    search_cmd.add_argument("--limit", type=int, default=LIMIT)
+    args = parser.parse_args()
+    if args.command == "build":
+        build(args.roots, args.index, args.romanized, args.workers)
+    else:
+        search(args.query, args.index, args.field, args.limit)
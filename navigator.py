@@ -0,0 +1,146 @@
+from collections import defaultdict
+
+from catalog import LEVELS, SITE_URL
+from retry import RetryPolicy, AsyncRetryPolicy
+
+# Moves the search form to a state/district/municipality/ward/centre path
+# by changing only what differs from what the page has selected now. The
+# current selection is read from the form itself, so a Submit that
+# re-renders the form (or anything else that touched it) is noticed. The
+# "All" option injected into the length menu is removed in place. The page
+# is reloaded only when the form is missing or a selection fails, instead
+# of after every centre. Page loads ("goto") and moves ("select") go through
+# a RetryPolicy: a failed move is retried with backoff from a fresh page.
+
+# Current value of each cascade select (null when the select is missing)
+FORM_STATE_JS = """levels => levels.map(id => {
+    const el = document.querySelector('select#' + id);
+    return el ? el.value : null;
+})"""
+
+# Remove the "All" entry ALL_ROWS_JS added to the DataTables length menu
+CLEAN_LENGTH_JS = """() => {
+    document.querySelectorAll('select[name="tbl_data_length"] option[data-injected]')
+        .forEach(o => o.remove());
+}"""
+
+
+def first_difference(values, actual):
+    for i, value in enumerate(values):
+        if actual[i] != value:
+            return i
+    return len(values)
+
+
+def selected(actual):
+    values = []
+    for value in actual:
+        if not value:
+            break
+        values.append(value)
+    return values
+
+
+class Navigator:
+    policy_class = RetryPolicy
+
+    def __init__(self, page, waits, site_url=SITE_URL, timeout=60000, retry=None):
+        self.page = page
+        self.waits = waits
+        self.site_url = site_url
+        self.timeout = timeout
+        self.retry = retry or self.policy_class()
+        self.stale = False  # last move failed part-way; start the next from a reload
+        self.stats = defaultdict(int)
+
+    def reload(self):
+        self.stats["reloads"] += 1
+        self.retry.call("goto", self.page.goto, self.site_url, timeout=self.timeout)
+
+    def _go(self, values):
+        self.page.wait_for_load_state("domcontentloaded")
+        self.page.evaluate(CLEAN_LENGTH_JS)
+        actual = self.page.evaluate(FORM_STATE_JS, LEVELS)
+        if None in actual:
+            # Not on the form (first call, error page, half-rendered page)
+            self.reload()
+            actual = self.page.evaluate(FORM_STATE_JS, LEVELS)
+        start = first_difference(values, actual)
+        self.stats["kept"] += start
+        for level, value in zip(LEVELS[start:], values[start:]):
+            self.stats["selects"] += 1
+            if not self.waits.select(self.page, f"select#{level}", value):
+                raise RuntimeError(f"select#{level} did not refresh the next dropdown")
+
+    def _attempt(self, values):
+        if self.stale:
+            self.reload()
+        self.stale = True
+        self._go(values)
+        self.stale = False
+
+    def go(self, *values):
+        # values from state down, as deep as needed. Raises once the retries
+        # are used up (e.g. the option does not exist).
+        self.stats["moves"] += 1
+        self.retry.call("select", self._attempt, values)
+
+    def selection(self):
+        # What the form has selected, from state down to the first empty select
+        return selected(self.page.evaluate(FORM_STATE_JS, LEVELS))
+
+    def move_to(self, page, values):
+        # Carry on in another page (a replaced context), back at values
+        self.page = page
+        self.stale = False
+        if values:
+            self.go(*values)
+
+    def summary(self):
+        return (
+            f"navigation: {self.stats['moves']} moves, {self.stats['selects']} selects, "
+            f"{self.stats['kept']} levels kept, {self.stats['reloads']} reloads"
+        )
+
+
+class AsyncNavigator(Navigator):
+    # Same navigation for playwright.async_api pages (with an AsyncWaiter)
+    policy_class = AsyncRetryPolicy
+
+    async def reload(self):
+        self.stats["reloads"] += 1
+        await self.retry.call("goto", self.page.goto, self.site_url, timeout=self.timeout)
+
+    async def _go(self, values):
+        await self.page.wait_for_load_state("domcontentloaded")
+        await self.page.evaluate(CLEAN_LENGTH_JS)
+        actual = await self.page.evaluate(FORM_STATE_JS, LEVELS)
+        if None in actual:
+            await self.reload()
+            actual = await self.page.evaluate(FORM_STATE_JS, LEVELS)
+        start = first_difference(values, actual)
+        self.stats["kept"] += start
+        for level, value in zip(LEVELS[start:], values[start:]):
+            self.stats["selects"] += 1
+            if not await self.waits.select(self.page, f"select#{level}", value):
+                raise RuntimeError(f"select#{level} did not refresh the next dropdown")
+
+    async def _attempt(self, values):
+        if self.stale:
+            await self.reload()
+        self.stale = True
+        await self._go(values)
+        self.stale = False
+
+    async def go(self, *values):
+        self.stats["moves"] += 1
+        await self.retry.call("select", self._attempt, values)
+
+    async def selection(self):
+        return selected(await self.page.evaluate(FORM_STATE_JS, LEVELS))
+
+    async def move_to(self, page, values):
+        self.page = page
+        self.stale = False
+        if values:
+            await self.go(*values)
@@ -0,0 +1,138 @@
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import argparse
+import hashlib
+import os
+
+from journal import file_digest
+
+# Columnar output: every polling centre becomes one compressed Parquet part
+# in a Hive-partitioned dataset
+#
+#   <root>/district=<..>/municipality=<..>/ward=<..>/part-<centre>.parquet
+#
+# so a whole district (or the whole country) loads with a single dataset
+# scan instead of opening one spreadsheet per centre.
+
+PARQUET_DIR = "parquet"
+COMPRESSION = "zstd"
+
+PARTITIONING = ds.partitioning(
+    pa.schema([
+        ("district", pa.string()),
+        ("municipality", pa.string()),
+        ("ward", pa.string()),
+    ]),
+    flavor="hive",
+)
+
+# Location columns live in the partition path; State is only set by scrape_all.py
+SCHEMA = pa.schema([
+    ("State", pa.dictionary(pa.int8(), pa.string())),
+    ("Polling Centre", pa.dictionary(pa.int16(), pa.string())),
+    ("Voter ID", pa.string()),
+    ("Name", pa.string()),
+    ("Age", pa.uint8()),  # records.SCHEMA's UInt8
+    ("Gender", pa.dictionary(pa.int8(), pa.string())),
+    ("Spouse Name", pa.string()),
+    ("Parent Name", pa.string()),
+])
+
+def _partition_value(text):
+    return str(text).replace("/", "_").replace("=", "-").strip()
+
+
+def frame_to_table(frame):
+    # A centre's records.SCHEMA frame, cast to the dataset's SCHEMA
+    columns = {}
+    for field in SCHEMA:
+        # Category columns arrive dictionary-encoded already, nothing is repeated
+        columns[field.name] = pa.array(frame[field.name]).cast(field.type)
+    return pa.table(columns, schema=SCHEMA)
+
+
+def partition_dir(root, district, municipality, ward):
+    return os.path.join(
+        root,
+        f"district={_partition_value(district)}",
+        f"municipality={_partition_value(municipality)}",
+        f"ward={_partition_value(ward)}",
+    )
+
+
+def part_paths(root, key, district, municipality, ward):
+    # (path, temp path) of a centre's part, named after its journal key so a
+    # re-scrape replaces the old part instead of duplicating it
+    directory = partition_dir(root, district, municipality, ward)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    name = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    path = os.path.join(directory, f"part-{name}.parquet")
+    tmp_path = os.path.join(directory, f".part-{name}.parquet.tmp")  # hidden from scans
+    return path, tmp_path
+
+
+def write_centre(root, frame, key, district, municipality, ward):
+    # One part per centre. Returns (path, sha256).
+    path, tmp_path = part_paths(root, key, district, municipality, ward)
+    pq.write_table(frame_to_table(frame), tmp_path, compression=COMPRESSION)
+    digest = file_digest(tmp_path)
+    os.replace(tmp_path, path)
+    return path, digest
+
+
+class PartWriter:
+    # write_centre() for a centre that arrives in pieces: each append() is
+    # one row group of the temp file, close() renames it into place
+    def __init__(self, root, key, district, municipality, ward):
+        self.path, self.tmp_path = part_paths(root, key, district, municipality, ward)
+        self.writer = pq.ParquetWriter(self.tmp_path, SCHEMA, compression=COMPRESSION)
+
+    def append(self, frame):
+        self.writer.write_table(frame_to_table(frame))
+
+    def finish(self):
+        # No more row groups; the temp file can be read back
+        if self.writer.is_open:
+            self.writer.close()
+
+    def close(self):
+        self.finish()
+        digest = file_digest(self.tmp_path)
+        os.replace(self.tmp_path, self.path)
+        return digest
+
+    def abort(self):
+        self.finish()
+        os.remove(self.tmp_path)
+
+
+def dataset(root):
+    # Always read as SCHEMA, so parts written before a type change (e.g. an
+    # int16 Age) come back the same as new ones
+    schema = pa.schema(list(SCHEMA) + list(PARTITIONING.schema))
+    return ds.dataset(root, schema=schema, format="parquet", partitioning=PARTITIONING)
+
+
+def load(root, district=None, municipality=None, ward=None, columns=None):
+    # Scan the dataset (optionally one district/municipality/ward) into pandas
+    expr = None
+    for name, value in (("district", district), ("municipality", municipality), ("ward", ward)):
+        if value is not None:
+            cond = ds.field(name) == _partition_value(value)
+            expr = cond if expr is None else expr & cond
+    return dataset(root).to_table(columns=columns, filter=expr).to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise a Parquet voter dataset.")
+    parser.add_argument("root", nargs="?", default=os.path.join("data", PARQUET_DIR))
+    parser.add_argument("--district")
+    parser.add_argument("--municipality")
+    args = parser.parse_args()
+
+    df = load(args.root, args.district, args.municipality)
+    print(f"{len(df)} voters")
+    if len(df):
+        print(df.groupby(["district", "municipality"], observed=True).size().to_string())
@@ -0,0 +1,91 @@
+from collections import defaultdict
+import asyncio
+import threading
+import time
+
+from metrics import METRICS
+
+# Adaptive pacing for requests to the site (AIMD, like TCP congestion
+# control). Every centre asks the controller for a start slot; slots are
+# 1/rate apart across all threads or tasks sharing the controller. Each
+# finished centre is reported back:
+#   - ok and not slow      -> rate += INCREASE           (additive increase)
+#   - timeout/error/slow   -> rate *= DECREASE           (multiplicative decrease)
+# "slow" means the centre took more than SLOW_FACTOR times the running
+# average, which usually comes before the site starts timing out.
+
+START_RATE = 1.0  # centres per second, what the old time.sleep(1) gave
+MIN_RATE = 0.1
+MAX_RATE = 5.0
+INCREASE = 0.05
+DECREASE = 0.5
+SLOW_FACTOR = 3.0
+SLOW_FLOOR = 1.0  # never call a centre under a second slow
+EWMA_ALPHA = 0.2
+
+TIMEOUT = "timeout"
+ERROR = "error"
+SLOW = "slow"
+OK = "ok"
+
+
+class RateController:
+    def __init__(self, rate=START_RATE, min_rate=MIN_RATE, max_rate=MAX_RATE,
+                 increase=INCREASE, decrease=DECREASE, slow_factor=SLOW_FACTOR):
+        self.rate = max(min_rate, min(max_rate, rate))
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.slow_factor = slow_factor
+        self.latency = None  # EWMA of centre latency, seconds
+        self.signals = defaultdict(int)
+        self.lowest = self.highest = self.rate
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # Seconds to wait before the caller's slot
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_at)
+            self.next_at = slot + 1.0 / self.rate
+            return slot - now
+
+    def wait(self):
+        with METRICS.span("pace"):
+            time.sleep(self.reserve())
+
+    async def async_wait(self):
+        with METRICS.span("pace"):
+            await asyncio.sleep(self.reserve())
+
+    def observe(self, seconds, signal=None):
+        # signal: TIMEOUT / ERROR when the centre failed, None when it worked.
+        # Returns the signal acted on (SLOW may be derived here).
+        with self.lock:
+            if signal is None:
+                if self.latency is not None and seconds > max(SLOW_FLOOR, self.slow_factor * self.latency):
+                    signal = SLOW
+                self.latency = seconds if self.latency is None else (
+                    EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency
+                )
+            self.signals[signal or OK] += 1
+
+            if signal is None:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+            else:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                # Back off now, not after the slots already handed out
+                self.next_at = max(self.next_at, time.monotonic() + 1.0 / self.rate)
+            self.lowest = min(self.lowest, self.rate)
+            self.highest = max(self.highest, self.rate)
+            return signal
+
+    def summary(self):
+        signals = ", ".join(f"{k}={self.signals[k]}" for k in (OK, SLOW, TIMEOUT, ERROR))
+        latency = f"{self.latency:.2f}s" if self.latency is not None else "n/a"
+        return (
+            f"rate: {self.rate:.2f} centres/s now (range {self.lowest:.2f}-{self.highest:.2f}), "
+            f"avg latency {latency}; signals: {signals}"
+        )
@@ -0,0 +1,117 @@
+# Shared conversion from raw table rows (lists of cell text) to the voter
+# records written by the scrapers. A centre is built as one frame, column by
+# column: the voter columns are cut straight from the cells and the location
+# is given once and stored as constant category columns, instead of one dict
+# per voter repeating the same strings.
+#
+# Each table row has 8 cells: serial, Voter ID, Name, Age, Gender, Spouse,
+# Parent ("father/ mother"), and a "मतदाता विवरण" details link.
+#
+# Files written before the mapping was fixed read the voter columns from
+# cells[2] on: every value sits one column right of its header (the name
+# under "Voter ID", the link text under "Parent Name") and the Voter ID was
+# never saved. realign() moves such frames back; their Voter ID stays empty
+# until the centre is scraped again.
+#
+# normalize() brings any scraper's output into one typed SCHEMA, so files
+# from all of them line up and join: the same column names, whitespace
+# trimmed, Devanagari digits converted, Age and Ward No as small integers
+# and the repeated text columns as categories.
+
+import numpy as np
+import pandas as pd
+
+DETAILS_LINK_TEXT = "मतदाता विवरण"
+VOTER_COLUMNS = ["Voter ID", "Name", "Age", "Gender", "Spouse Name", "Parent Name"]
+
+# Location columns a scraper does not know are left empty (State is only
+# set by scrape_all.py). The old, always empty "Mother Name" is dropped.
+SCHEMA = {
+    "State": "category",
+    "District": "category",
+    "Municipality": "category",
+    "Ward No": "UInt8",
+    "Polling Centre": "category",
+    "Voter ID": "string",
+    "Name": "string",
+    "Age": "UInt8",
+    "Gender": "category",
+    "Spouse Name": "string",
+    "Parent Name": "string",
+}
+# Column names used by scrape_all.py / scrape_lalitpur.py and the Parquet partition keys
+RENAME = {"Ward": "Ward No", "district": "District", "municipality": "Municipality", "ward": "Ward No"}
+DEVANAGARI_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+
+
+def location(district_name="", mun_name="", ward_name="", center_name="", state_name=""):
+    return {
+        "State": state_name,
+        "District": district_name,
+        "Municipality": mun_name,
+        "Ward No": ward_name,
+        "Polling Centre": center_name,
+    }
+
+
+def build_frame(rows_data, district_name="", mun_name="", ward_name="", center_name="", state_name=""):
+    # One centre's table rows as a SCHEMA frame. Basic validation: the table
+    # has 8 columns, cells[1:7] are the voter columns.
+    voters = pd.DataFrame([cells[1:7] for cells in rows_data if len(cells) >= 8], columns=VOTER_COLUMNS)
+    return normalize(voters, location(district_name, mun_name, ward_name, center_name, state_name))
+
+
+def voter_columns(frame):
+    # The voter columns as JSON-ready lists (None for missing); the location
+    # is sent once alongside and given back to normalize()
+    values = frame[VOTER_COLUMNS].astype(object)
+    return values.where(values.notna(), None).to_dict("list")
+
+
+def is_shifted(df):
+    # Old layout: the details link text fills the Parent Name column
+    if df.empty or not set(VOTER_COLUMNS) <= set(df.columns):
+        return False
+    return (df["Parent Name"].astype(str).str.strip() == DETAILS_LINK_TEXT).mean() > 0.5
+
+
+def realign(df):
+    # A frame read from any scraper's output, with the voter columns back
+    # under their headers
+    if not is_shifted(df):
+        return df
+    df = df.copy()
+    df[VOTER_COLUMNS[1:]] = df[VOTER_COLUMNS[:-1]].to_numpy()
+    df["Voter ID"] = ""
+    return df
+
+
+def _typed(column, text):
+    # One SCHEMA column from trimmed text
+    if column == "Voter ID":
+        text = text.str.translate(DEVANAGARI_DIGITS)
+    if SCHEMA[column] == "UInt8":
+        number = pd.to_numeric(text.str.translate(DEVANAGARI_DIGITS), errors="coerce")
+        return number.where(number.between(0, 255) & (number % 1 == 0)).astype("UInt8")
+    return text.astype(SCHEMA[column])
+
+
+def normalize(df, location=None):
+    # Any scraper's records or file (old layouts included) as a SCHEMA frame.
+    # location: {column: value} for columns that are the same in every row;
+    # each is converted once and repeated as a constant column.
+    location = location or {}
+    df = realign(df.rename(columns=RENAME))
+    read = [c for c in SCHEMA if c in df.columns and c not in location]
+    values = df[read].to_numpy(dtype=object)
+    # Every cell in one pass: to text, trimmed, missing -> ""
+    text = pd.Series(values.ravel(order="F"), dtype=object).astype("string").str.strip().fillna("")
+    text = text.to_numpy(dtype=object).reshape(values.shape, order="F")
+
+    columns = {c: _typed(c, pd.Series(text[:, i], dtype="string")) for i, c in enumerate(read)}
+    zeros = np.zeros(len(df), dtype=np.intp)
+    for column in SCHEMA:
+        if column not in columns:
+            value = _typed(column, pd.Series([str(location.get(column, ""))], dtype="string").str.strip())
+            columns[column] = value.take(zeros).reset_index(drop=True)
+    return pd.DataFrame({c: columns[c] for c in SCHEMA})
@@ -0,0 +1,76 @@
+from fnmatch import fnmatchcase
+import hashlib
+
+from catalog import LEVELS
+from scrape_districts import DISTRICTS
+
+# Which part of the country to crawl, and which share of it this machine takes.
+#
+# A region spec is a path province/district/municipality/ward/centre. Each
+# segment is a glob matched against the option's value (its ID) or its text
+# (the Nepali name; digits match in either script). Segments left off the
+# end mean "everything below". Districts also match their English names
+# from scrape_districts.DISTRICTS.
+#
+#   3/28            all of Lalitpur (province 3, district 28)
+#   */Bhaktapur     Bhaktapur, whatever its province
+#   3/28/*/1        ward 1 of every municipality in Lalitpur
+#   */*/*नगरपालिका*  every municipality whose name contains नगरपालिका
+#
+# --shard k/N keeps the centres whose key hashes to k of N. The split depends
+# only on the centre itself, so N machines given the same specs and shards
+# 1/N .. N/N crawl disjoint sets that together cover everything.
+
+DEVANAGARI_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+
+ALIASES = {d["id"]: [d["name"]] for d in DISTRICTS}
+
+
+def _norm(text):
+    return str(text).strip().translate(DEVANAGARI_DIGITS).lower()
+
+
+class RegionSpec:
+    def __init__(self, specs):
+        if isinstance(specs, str):
+            specs = [specs]
+        self.specs = []
+        for spec in specs:
+            segments = [_norm(s) or "*" for s in spec.strip().strip("/").split("/")]
+            if len(segments) > len(LEVELS):
+                raise ValueError(f"Region spec {spec!r} has more than {len(LEVELS)} levels")
+            self.specs.append(segments)
+
+    def _match(self, segments, path):
+        for level, pattern, (value, text) in zip(LEVELS, segments, path):
+            names = [value, text] + (ALIASES.get(value, []) if level == "district" else [])
+            if not any(fnmatchcase(_norm(n), pattern) for n in names):
+                return False
+        return True
+
+    def allows(self, path):
+        # path is [(value, text), ...] from the province down, as deep as known.
+        # True if some spec matches every level given, i.e. the option is in
+        # the region or may still contain part of it.
+        return any(self._match(segments, path) for segments in self.specs)
+
+    def __str__(self):
+        return ", ".join("/".join(s) for s in self.specs)
+
+
+def parse_shard(text):
+    # "k/N" -> (k, N), 1 <= k <= N
+    try:
+        k, n = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like k/N, got {text!r}")
+    if not 1 <= k <= n:
+        raise ValueError(f"Shard {text!r} out of range")
+    return k, n
+
+
+def in_shard(key, shard):
+    if shard is None:
+        return True
+    k, n = shard
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:8], 16) % n == k - 1
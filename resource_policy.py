@@ -0,0 +1,143 @@
+from collections import defaultdict
+import hashlib
+import json
+import os
+import time
+
+# Request policy for the Playwright contexts. Every navigation back to the
+# home page used to download its images, fonts, CSS and scripts again. With
+# the policy attached to a context:
+#   - images, fonts and media are aborted (nothing reads them),
+#   - scripts and stylesheets are served from an on-disk cache after the
+#     first download,
+#   - documents and XHR (the form, dropdown options, the table) go to the
+#     site as before.
+# so a navigation costs one HTML fetch. summary() reports what was saved.
+
+BLOCK_TYPES = {"image", "font", "media"}
+CACHE_TYPES = {"script", "stylesheet"}
+CACHE_DIR = ".asset_cache"
+CACHE_TTL = 7 * 24 * 3600  # the site's JS/CSS rarely changes
+
+# Response headers worth keeping with a cached asset
+KEEP_HEADERS = ("content-type", "content-encoding", "cache-control", "last-modified", "etag")
+
+
+class RequestPolicy:
+    def __init__(self, block_types=BLOCK_TYPES, cache_types=CACHE_TYPES, cache_dir=CACHE_DIR, ttl=CACHE_TTL):
+        self.block_types = set(block_types)
+        self.cache_types = set(cache_types)
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.counts = defaultdict(int)  # blocked / cache_hit / cache_miss / passed
+        self.bytes_saved = 0
+        self.bytes_fetched = 0
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _paths(self, url):
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.cache_dir, name)
+        return base + ".body", base + ".json"
+
+    def _action(self, request):
+        if request.resource_type in self.block_types:
+            return "block"
+        if self.cache_dir and request.method == "GET" and request.resource_type in self.cache_types:
+            return "cache"
+        return "pass"
+
+    def lookup(self, url):
+        # (body, headers) of a fresh cached asset, or None
+        body_path, meta_path = self._paths(url)
+        if not os.path.exists(meta_path) or not os.path.exists(body_path):
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if time.time() - meta["stored_at"] > self.ttl:
+            return None
+        with open(body_path, "rb") as f:
+            body = f.read()
+        return body, meta["headers"]
+
+    def store(self, url, status, headers, body):
+        if status != 200:
+            return
+        body_path, meta_path = self._paths(url)
+        headers = {k: v for k, v in headers.items() if k.lower() in KEEP_HEADERS}
+        # Playwright hands back the decoded body
+        headers.pop("content-encoding", None)
+        for path, data, mode in (
+            (body_path, body, "wb"),
+            (meta_path, json.dumps({"url": url, "headers": headers, "stored_at": time.time()}), "w"),
+        ):
+            tmp_path = path + ".tmp"
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    def attach(self, context):
+        context.route("**/*", self._handle)
+        return context
+
+    def _handle(self, route):
+        request = route.request
+        action = self._action(request)
+        if action == "block":
+            self.counts["blocked"] += 1
+            route.abort()
+        elif action == "cache":
+            cached = self.lookup(request.url)
+            if cached:
+                self.counts["cache_hit"] += 1
+                self.bytes_saved += len(cached[0])
+                route.fulfill(status=200, headers=cached[1], body=cached[0])
+                return
+            self.counts["cache_miss"] += 1
+            response = route.fetch()
+            body = response.body()
+            self.bytes_fetched += len(body)
+            self.store(request.url, response.status, response.headers, body)
+            route.fulfill(response=response, body=body)
+        else:
+            self.counts["passed"] += 1
+            route.continue_()
+
+    def summary(self):
+        return (
+            f"requests: {self.counts['blocked']} blocked, {self.counts['cache_hit']} served from cache, "
+            f"{self.counts['cache_miss']} cached, {self.counts['passed']} passed through; "
+            f"{self.bytes_saved / 1024:.0f} KB saved by the asset cache "
+            f"({self.bytes_fetched / 1024:.0f} KB downloaded into it)"
+        )
+
+
+class AsyncRequestPolicy(RequestPolicy):
+    # Same policy for playwright.async_api contexts
+
+    async def attach(self, context):
+        await context.route("**/*", self._handle)
+        return context
+
+    async def _handle(self, route):
+        request = route.request
+        action = self._action(request)
+        if action == "block":
+            self.counts["blocked"] += 1
+            await route.abort()
+        elif action == "cache":
+            cached = self.lookup(request.url)
+            if cached:
+                self.counts["cache_hit"] += 1
+                self.bytes_saved += len(cached[0])
+                await route.fulfill(status=200, headers=cached[1], body=cached[0])
+                return
+            self.counts["cache_miss"] += 1
+            response = await route.fetch()
+            body = await response.body()
+            self.bytes_fetched += len(body)
+            self.store(request.url, response.status, response.headers, body)
+            await route.fulfill(response=response, body=body)
+        else:
+            self.counts["passed"] += 1
+            await route.continue_()
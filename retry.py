@@ -0,0 +1,196 @@
+from collections import defaultdict, deque
+import asyncio
+import json
+import os
+import random
+import time
+
+from metrics import METRICS
+
+# Failure handling shared by the scrapers.
+#
+# RetryPolicy.call(op, fn, ...) runs one operation (goto, select, submit,
+# all_rows, page, extract, fetch) and retries it with jittered exponential backoff
+# ("full jitter": a random wait up to BASE_DELAY * 2^attempt, capped).
+#
+# Each operation has a CircuitBreaker. When most of its recent attempts
+# failed the breaker opens and every call of that operation pauses for a
+# cooldown (doubling on each consecutive trip), so a struggling site is
+# left alone instead of being hit by a reload loop.
+#
+# Centres that still fail go to a DeadLetters list, which is retried once
+# more at the end of the run and saved to disk with whatever is left.
+
+ATTEMPTS = {"goto": 3, "select": 3, "submit": 3, "all_rows": 2, "page": 3, "extract": 2, "fetch": 3}
+DEFAULT_ATTEMPTS = 3
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+
+BREAKER_WINDOW = 20  # recent attempts looked at
+BREAKER_MIN_CALLS = 6
+BREAKER_THRESHOLD = 0.6  # share of failures that opens the breaker
+COOLDOWN = 30.0
+MAX_COOLDOWN = 600.0
+
+
+class CircuitBreaker:
+    def __init__(self, name, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS,
+                 threshold=BREAKER_THRESHOLD, cooldown=COOLDOWN, max_cooldown=MAX_COOLDOWN):
+        self.name = name
+        self.outcomes = deque(maxlen=window)
+        self.min_calls = min_calls
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.open_until = 0.0
+        self.trips = 0
+
+    def pause_for(self):
+        # Seconds the caller should hold off (0 when closed)
+        return max(0.0, self.open_until - time.monotonic())
+
+    def wait(self):
+        pause = self.pause_for()
+        if pause:
+            print(f"  || {self.name} circuit open, pausing {pause:.0f}s")
+            time.sleep(pause)
+
+    def record(self, ok):
+        self.outcomes.append(ok)
+        if ok:
+            self.cooldown = self.base_cooldown
+            return
+        failures = self.outcomes.count(False)
+        if len(self.outcomes) >= self.min_calls and failures >= self.threshold * len(self.outcomes):
+            self.open_until = time.monotonic() + self.cooldown
+            self.trips += 1
+            print(f"  || {self.name}: {failures}/{len(self.outcomes)} recent attempts failed, "
+                  f"opening circuit for {self.cooldown:.0f}s")
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            self.outcomes.clear()
+
+
+class RetryPolicy:
+    def __init__(self, attempts=ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breakers = {}
+        self.stats = defaultdict(lambda: defaultdict(int))  # op -> ok / retried / failed
+
+    def breaker(self, op):
+        if op not in self.breakers:
+            self.breakers[op] = CircuitBreaker(op)
+        return self.breakers[op]
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _failed(self, op, error, attempt, attempts):
+        # Backoff before the next attempt, or None when there is none
+        if attempt + 1 == attempts:
+            self.stats[op]["failed"] += 1
+            METRICS.count("failures", op=op)
+            return None
+        delay = self.backoff(attempt)
+        self.stats[op]["retried"] += 1
+        METRICS.count("retries", op=op)
+        print(f"  !! {op} failed ({error}); retry {attempt + 1}/{attempts - 1} in {delay:.1f}s")
+        return delay
+
+    def call(self, op, fn, *args, **kwargs):
+        # fn's result, or the last exception once every attempt failed.
+        # Timed as one stage, retries and backoff included.
+        with METRICS.span(op):
+            return self._call(op, fn, *args, **kwargs)
+
+    def _call(self, op, fn, *args, **kwargs):
+        breaker = self.breaker(op)
+        attempts = self.attempts.get(op, DEFAULT_ATTEMPTS)
+        for attempt in range(attempts):
+            breaker.wait()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                breaker.record(False)
+                delay = self._failed(op, e, attempt, attempts)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            breaker.record(True)
+            self.stats[op]["ok"] += 1
+            return result
+
+    def summary(self):
+        lines = []
+        for op, counts in sorted(self.stats.items()):
+            trips = self.breakers[op].trips if op in self.breakers else 0
+            lines.append(
+                f"{op:>9}: ok={counts['ok']} retried={counts['retried']} "
+                f"failed={counts['failed']} circuit trips={trips}"
+            )
+        return "\n".join(lines)
+
+
+class AsyncRetryPolicy(RetryPolicy):
+    # Same policy for coroutines (playwright.async_api); an open circuit
+    # pauses every task that reaches that operation
+
+    async def call(self, op, fn, *args, **kwargs):
+        with METRICS.span(op):
+            return await self._call(op, fn, *args, **kwargs)
+
+    async def _call(self, op, fn, *args, **kwargs):
+        breaker = self.breaker(op)
+        attempts = self.attempts.get(op, DEFAULT_ATTEMPTS)
+        for attempt in range(attempts):
+            pause = breaker.pause_for()
+            if pause:
+                print(f"  || {op} circuit open, pausing {pause:.0f}s")
+                await asyncio.sleep(pause)
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                breaker.record(False)
+                delay = self._failed(op, e, attempt, attempts)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            breaker.record(True)
+            self.stats[op]["ok"] += 1
+            return result
+
+
+class DeadLetters:
+    # Centres that failed every attempt: key -> {"values": [...], "names": [...], "error": ...}
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+
+    def add(self, key, values, names, error=None):
+        self.entries[key] = {"key": key, "values": list(values), "names": list(names), "error": error}
+
+    def discard(self, key):
+        self.entries.pop(key, None)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def items(self):
+        return list(self.entries.items())
+
+    def save(self):
+        # What is still failing after the final pass, for a look or a later run
+        if not self.entries:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        print(f"{len(self.entries)} centres still failing, listed in {self.path}")
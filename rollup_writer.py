@@ -0,0 +1,89 @@
+from openpyxl import Workbook
+import csv
+import os
+
+from metrics import METRICS
+
+# Streaming rollup files. Each polling centre's frame is appended as the
+# centre finishes, so memory stays bounded by one centre's rows and the export is
+# done by the time the crawl is. XLSX uses openpyxl's write-only mode (rows
+# are spooled to disk, not kept as cell objects); CSV is written directly.
+# Files appear under their final name only when closed.
+
+EXCEL_MAX_ROWS = 1048576
+INVALID_SHEET_CHARS = str.maketrans({c: "_" for c in "[]:*?/\\"})
+
+
+class RollupWriter:
+    def __init__(self, path):
+        self.path = path
+        root, ext = os.path.splitext(path)
+        self.tmp_path = f"{root}.tmp{ext}"
+        self.is_excel = ext == ".xlsx"
+        self.rows = 0
+        self.columns = None
+
+        if self.is_excel:
+            self.workbook = Workbook(write_only=True)
+            self.sheets = {}  # name -> [worksheet, rows written]
+        else:
+            self.file = open(self.tmp_path, "w", newline="", encoding="utf-8")
+            self.writer = None
+
+    def _sheet(self, name):
+        # Excel limits: 31 chars, no []:*?/\ and ~1M rows per sheet
+        name = (name or "Sheet").translate(INVALID_SHEET_CHARS)[:31]
+        entry = self.sheets.get(name)
+        if entry is None or entry[1] >= EXCEL_MAX_ROWS:
+            sheet_name = name
+            n = 2
+            while sheet_name in self.workbook.sheetnames:
+                suffix = f" ({n})"
+                sheet_name = name[:31 - len(suffix)] + suffix
+                n += 1
+            ws = self.workbook.create_sheet(sheet_name)
+            ws.append(self.columns)
+            entry = self.sheets[name] = [ws, 1]
+        return entry
+
+    def append(self, frame, sheet=None):
+        # sheet is ignored for CSV output
+        with METRICS.span("rollup"):
+            self._append(frame, sheet)
+
+    def _append(self, frame, sheet):
+        if frame.empty:
+            return
+        if self.columns is None:
+            self.columns = list(frame.columns)
+        values = frame.reindex(columns=self.columns).astype(object)
+        rows = values.where(values.notna(), "").itertuples(index=False, name=None)
+
+        if self.is_excel:
+            entry = self._sheet(sheet)
+            for row in rows:
+                if entry[1] >= EXCEL_MAX_ROWS:
+                    entry = self._sheet(sheet)
+                entry[0].append(row)
+                entry[1] += 1
+        else:
+            if self.writer is None:
+                self.writer = csv.writer(self.file)
+                self.writer.writerow(self.columns)
+            self.writer.writerows(rows)
+            self.file.flush()
+        self.rows += len(frame)
+
+    def close(self):
+        # Finalise and move into place; an empty rollup leaves no file
+        if self.is_excel:
+            if self.rows:
+                self.workbook.save(self.tmp_path)
+            self.workbook.close()
+        else:
+            self.file.close()
+        if self.rows:
+            os.replace(self.tmp_path, self.path)
+        elif os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        return self.rows
@@ -1,104 +1,89 @@
 from playwright.sync_api import sync_playwright
-import pandas as pd
 import time
 import os
 
+from waits import Waiter
+from resource_policy import RequestPolicy
+from extract import TableReader
+from catalog import Catalog
+from navigator import Navigator
+from regions import RegionSpec
+from retry import RetryPolicy, DeadLetters
+from journal import Journal, centre_key, atomic_save, DONE, FAILED
+from records import build_frame
+from parquet_writer import PARQUET_DIR, write_centre
+from metrics import METRICS
+from context_pool import ContextPool
+
 OUTPUT_DIR = "voter_data"
+OUTPUT_FORMAT = "xlsx" # or "parquet" for a partitioned dataset under voter_data/parquet
+JOURNAL_PATH = os.path.join(OUTPUT_DIR, "journal.jsonl" if OUTPUT_FORMAT == "xlsx" else "parquet.journal.jsonl")
+DEAD_LETTER_PATH = os.path.join(OUTPUT_DIR, "dead_letters.jsonl")
+SITE_URL = "https://voterlist.election.gov.np/"
+HEADLESS = False # True to run without a window
+REGIONS = RegionSpec(["*/*Lalitpur*", "*/*ललितपुर*", "*/*Bhaktapur*", "*/*भक्तपुर*"]) # see regions.py
+WAITS = Waiter()
+RETRY = RetryPolicy() # see retry.py
+TABLE = TableReader(WAITS, RETRY)
 
 def scrape_polling_centre(page, state_name, district_name, mun_name, ward_name, center_name):
     print(f"Scraping: {state_name} -> {district_name} -> {mun_name} -> Ward {ward_name} -> {center_name}")
     
-    # Click Submit
-    submit_btn = page.query_selector("button.btn-success")
-    if not submit_btn:
-        submit_btn = page.query_selector("input[type='submit']")
-    
-    if not submit_btn:
-        print("  Submit button not found!")
-        return []
-
-    submit_btn.click()
-    
-    # Wait for table
+    # Submit, force "All" rows and read them, each step retried with backoff
     try:
-        page.wait_for_selector("table#tbl_data", timeout=10000)
-    except:
-        print("  Table not found (timeout). Maybe no data?")
-        return []
-
-    # Force "All" rows (-1)
-    try:
-        page.evaluate("""() => {
-            const sel = document.querySelector('select[name="tbl_data_length"]');
-            if (sel) {
-                let opt = sel.querySelector('option[value="-1"]');
-                if (!opt) {
-                    opt = document.createElement('option');
-                    opt.value = "-1";
-                    opt.text = "All";
-                    sel.add(opt);
-                }
-                sel.value = "-1";
-                sel.dispatchEvent(new Event('change'));
-            }
-        }""")
-        page.wait_for_timeout(3000) 
+        page_data = TABLE.read(page)["rows"]
     except Exception as e:
-        print(f"  Could not set 'All' rows: {e}")
-
-    # Scrape all rows
-    page_data = page.evaluate("""() => {
-        const rows = Array.from(document.querySelectorAll('tbody tr'));
-        return rows.map(row => {
-            const cells = Array.from(row.querySelectorAll('td'));
-            return cells.map(cell => cell.innerText);
-        });
-    }""")
-    
-    print(f"  Found {len(page_data)} rows.")
+        print(f"  Could not read the table: {e}")
+        page_data = []
+    else:
+        print(f"  Found {len(page_data)} rows.")
     
-    all_data = []
-    for cells in page_data:
-        if len(cells) >= 8:
-            record = {
-                "State": state_name,
-                "District": district_name,
-                "Municipality": mun_name,
-                "Ward": ward_name,
-                "Polling Centre": center_name,
-                "Voter ID": cells[2],
-                "Name": cells[3],
-                "Age": cells[4],
-                "Gender": cells[5],
-                "Spouse Name": cells[6],
-                "Parent Name": cells[7]
-            }
-            all_data.append(record)
-            
-    return all_data
+    # One frame for the centre, the location stored once (see records.py)
+    return build_frame(page_data, district_name, mun_name, ward_name, center_name, state_name)
 
-def navigate_to_context(page, state_val, district_val, mun_val, ward_val):
-    print("  Re-navigating to context...")
+def scrape_centre(page, nav, values, names):
+    # None if the centre could not be selected
     try:
-        page.goto("https://voterlist.election.gov.np/", timeout=60000)
-        
-        if state_val:
-            page.select_option("select#state", value=state_val)
-            page.wait_for_timeout(1000)
-        
-        if district_val:
-            page.select_option("select#district", value=district_val)
-            page.wait_for_timeout(1000)
-            
-        if mun_val:
-            page.select_option("select#vdc_mun", value=mun_val)
-            page.wait_for_timeout(1000)
-            
-        if ward_val:
-            page.select_option("select#ward", value=ward_val)
-            page.wait_for_timeout(1000)
+        nav.go(*values)
     except Exception as e:
-        print(f"  Error during re-navigation: {e}")
+        print(f"      Could not select polling centre: {e}")
+        return None
+    return scrape_polling_centre(page, *names)
+
+def save_polling_centre(journal, key, data, names, started):
+    # Save and journal one centre; False if it has to be tried again
+    state_text, dist_text, mun_text, ward_text, center_text = names
+    if data is not None and not data.empty and OUTPUT_FORMAT == "parquet":
+        root = os.path.join(OUTPUT_DIR, PARQUET_DIR)
+        with METRICS.span("save"):
+            filename, digest = write_centre(root, data, key, dist_text, mun_text, ward_text)
+        journal.record(key, DONE, len(data), filename, digest, time.perf_counter() - started)
+        print(f"      Saved to {filename}")
+        return True
+    elif data is not None and not data.empty:
+        try:
+
+            # Create directory structure: data/State/District/Municipality
+            safe_state = state_text.replace('/', '_').strip()
+            safe_dist = dist_text.replace('/', '_').strip()
+            safe_mun = mun_text.replace('/', '_').strip()
+            safe_ward = ward_text.replace('/', '_').strip()
+            safe_center = center_text.replace('/', '_').strip()
+            
+            save_dir = os.path.join(OUTPUT_DIR, safe_state, safe_dist, safe_mun)
+            if not os.path.exists(save_dir):
+                os.makedirs(save_dir)
+                
+            filename = os.path.join(save_dir, f"Ward_{safe_ward}_{safe_center}.xlsx")
+            with METRICS.span("save"):
+                digest = atomic_save(data, filename, index=False)
+            journal.record(key, DONE, len(data), filename, digest, time.perf_counter() - started)
+            print(f"      Saved to {filename}")
+            return True
+        except Exception as e:
+            print(f"      Error saving file: {e}")
+    journal.record(key, FAILED, seconds=time.perf_counter() - started)
+    return False
 
 def get_options(page, selector):
     select = page.query_selector(selector)
@@ -116,114 +101,133 @@ def get_options(page, selector):
 def run():
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
+    METRICS.start(OUTPUT_DIR, "all") # metrics.jsonl and metrics_all.prom, see metrics.py
+    catalog = Catalog()
+    journal = Journal(JOURNAL_PATH)
+    dead = DeadLetters(DEAD_LETTER_PATH)
 
     with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)
-        context = browser.new_context()
-        page = context.new_page()
+        browser = p.chromium.launch(headless=HEADLESS)
+        # Block images/fonts, serve the site's JS/CSS from the local cache
+        policy = RequestPolicy()
+        # Replaced every MAX_CENTRES centres or when the browser uses too much memory
+        pool = ContextPool(browser, policy)
+        page = pool.page
         
-        print("Navigating to https://voterlist.election.gov.np/ ...")
-        page.goto("https://voterlist.election.gov.np/", timeout=60000)
+        # Only re-selects the dropdown levels that change between centres
+        nav = Navigator(page, WAITS, SITE_URL, retry=RETRY)
+        print(f"Navigating to {SITE_URL} ...")
+        nav.reload()
         
         # 1. States
-        states = get_options(page, "select#state")
+        states = catalog.options("state", [], lambda: get_options(page, "select#state"))
         print(f"Found {len(states)} states.")
         
         for state_val, state_text in states:
+            if not REGIONS.allows([(state_val, state_text)]):
+                continue
             print(f"\n=== State: {state_text} ===")
-            page.select_option("select#state", value=state_val)
-            page.wait_for_timeout(1500)
+            nav.go(state_val)
             
             # 2. Districts
-            districts = get_options(page, "select#district")
+            districts = catalog.options("district", [state_val], lambda: get_options(page, "select#district"))
             print(f"Found {len(districts)} districts in {state_text}.")
             
             for dist_val, dist_text in districts:
-                # Filter for Lalitpur and Bhaktapur
-                # Check for English or Nepali names
-                is_target = False
-                target_districts = ["Lalitpur", "ललितपुर", "Bhaktapur", "भक्तपुर"]
-                for target in target_districts:
-                    if target in dist_text:
-                        is_target = True
-                        break
-                
-                if not is_target:
+                # Only the districts (and below) REGIONS asks for
+                dist_path = [(state_val, state_text), (dist_val, dist_text)]
+                if not REGIONS.allows(dist_path):
                     continue
 
                 print(f"\n  --- District: {dist_text} ---")
-                page.select_option("select#district", value=dist_val)
-                page.wait_for_timeout(1500)
+                nav.go(state_val, dist_val)
                 
                 # 3. Municipalities
-                muns = get_options(page, "select#vdc_mun")
+                muns = catalog.options("vdc_mun", [state_val, dist_val], lambda: get_options(page, "select#vdc_mun"))
                 print(f"  Found {len(muns)} municipalities in {dist_text}.")
                 
                 for mun_val, mun_text in muns:
+                    mun_path = dist_path + [(mun_val, mun_text)]
+                    if not REGIONS.allows(mun_path):
+                        continue
                     print(f"\n    Processing Municipality: {mun_text}")
                     
                     # Select Mun
                     try:
-                        page.select_option("select#vdc_mun", value=mun_val)
-                        page.wait_for_timeout(1500)
-                    except:
-                        navigate_to_context(page, state_val, dist_val, mun_val, "")
+                        nav.go(state_val, dist_val, mun_val)
+                    except Exception as e:
+                        print(f"    Could not select municipality: {e}")
+                        catalog.invalidate("vdc_mun", [state_val, dist_val])
+                        continue
                     
                     # 4. Wards
-                    wards = get_options(page, "select#ward")
+                    wards = catalog.options("ward", [state_val, dist_val, mun_val], lambda: get_options(page, "select#ward"))
                     print(f"    Found {len(wards)} wards.")
                     
                     for ward_val, ward_text in wards:
+                        if not REGIONS.allows(mun_path + [(ward_val, ward_text)]):
+                            continue
+
                         # Select Ward
                         try:
-                            page.select_option("select#ward", value=ward_val)
-                            page.wait_for_timeout(1500)
-                        except:
-                            navigate_to_context(page, state_val, dist_val, mun_val, ward_val)
+                            nav.go(state_val, dist_val, mun_val, ward_val)
+                        except Exception as e:
+                            print(f"      Could not select ward: {e}")
+                            catalog.invalidate("ward", [state_val, dist_val, mun_val])
+                            continue
 
                         # 5. Polling Centres
-                        centers = get_options(page, "select#reg_centre")
+                        ward_parents = [state_val, dist_val, mun_val, ward_val]
+                        centers = catalog.options("reg_centre", ward_parents, lambda: get_options(page, "select#reg_centre"))
                         print(f"      Ward {ward_text}: Found {len(centers)} polling centres.")
                         
                         for center_val, center_text in centers:
-                            # Select Polling Centre
-                            try:
-                                page.select_option("select#reg_centre", value=center_val)
-                            except:
-                                print("      Dropdown issue, reloading...")
-                                navigate_to_context(page, state_val, dist_val, mun_val, ward_val)
-                                page.select_option("select#reg_centre", value=center_val)
-                            
-                            # Scrape
-                            data = scrape_polling_centre(page, state_text, dist_text, mun_text, ward_text, center_text)
-                            
-                            # Save Data
-                            if data:
-                                try:
-                                    df = pd.DataFrame(data)
-                                    
-                                    # Create directory structure: data/State/District/Municipality
-                                    safe_state = state_text.replace('/', '_').strip()
-                                    safe_dist = dist_text.replace('/', '_').strip()
-                                    safe_mun = mun_text.replace('/', '_').strip()
-                                    safe_ward = ward_text.replace('/', '_').strip()
-                                    safe_center = center_text.replace('/', '_').strip()
-                                    
-                                    save_dir = os.path.join(OUTPUT_DIR, safe_state, safe_dist, safe_mun)
-                                    if not os.path.exists(save_dir):
-                                        os.makedirs(save_dir)
-                                        
-                                    filename = os.path.join(save_dir, f"Ward_{safe_ward}_{safe_center}.xlsx")
-                                    df.to_excel(filename, index=False)
-                                    print(f"      Saved to {filename}")
-                                except Exception as e:
-                                    print(f"      Error saving file: {e}")
+                            key = centre_key(state_val, dist_val, mun_val, ward_val, center_val)
+                            if journal.done(key):
+                                print(f"      [Skipping] Already done: {journal.entries[key]['path']}")
+                                continue
+                            METRICS.begin()  # stage times from here on belong to this centre
+                            started = time.perf_counter()
+                            values = (state_val, dist_val, mun_val, ward_val, center_val)
+                            names = (state_text, dist_text, mun_text, ward_text, center_text)
+
+                            # Select Polling Centre and Scrape
+                            data = scrape_centre(page, nav, values, names)
+                            if data is None:
+                                catalog.invalidate("reg_centre", ward_parents)
                             
-                            # Reload to clean up
-                            page.reload()
-                            navigate_to_context(page, state_val, dist_val, mun_val, ward_val)
+                            # Save Data, or keep the centre for the retry pass at the end
+                            if not save_polling_centre(journal, key, data, names, started):
+                                dead.add(key, values, names, "not selectable" if data is None else "no rows")
+
+                            # A replaced context comes back on this ward
+                            if pool.release(nav):
+                                page = pool.page
+
+        # One more try for the centres that failed, after the site has had a rest
+        if len(dead):
+            print(f"\nRetrying {len(dead)} failed polling centres...")
+        for key, letter in dead.items():
+            METRICS.begin()
+            started = time.perf_counter()
+            data = scrape_centre(page, nav, letter["values"], letter["names"])
+            if save_polling_centre(journal, key, data, letter["names"], started):
+                dead.discard(key)
+            if pool.release(nav):
+                page = pool.page
+        dead.save()
 
+        pool.close()
         browser.close()
+        catalog.close()
+        journal.close()
+        METRICS.close()
+        print(WAITS.summary())
+        print(nav.summary())
+        print(RETRY.summary())
+        print(policy.summary())
+        print(pool.summary())
+        print(METRICS.summary())
 
 if __name__ == "__main__":
     run()
@@ -1,8 +1,23 @@
 from playwright.sync_api import sync_playwright
+import pyarrow.parquet as pq
 import pandas as pd
 import time
 import os
 
+from records import build_frame, normalize
+from waits import Waiter
+from resource_policy import RequestPolicy
+from extract import TableReader, find_submit
+from catalog import Catalog
+from navigator import Navigator
+from rate_control import RateController, TIMEOUT, ERROR
+from retry import RetryPolicy, DeadLetters
+from journal import Journal, AtomicCsv, centre_key, atomic_save, DONE, FAILED
+from changes import ChangeTracker, UNCHANGED, row_hashes, content_hash
+from parquet_writer import PARQUET_DIR, PartWriter, write_centre
+from metrics import METRICS
+from context_pool import ContextPool
+
 # Configuration
 STATE_ID = "3" # Bagmati
 DISTRICTS = [
@@ -10,151 +25,275 @@ DISTRICTS = [
     {"id": "28", "name": "Lalitpur"}
 ]
 OUTPUT_DIR = "data"
+OUTPUT_FORMAT = "csv" # or "parquet" for a partitioned dataset under data/parquet
+DEAD_LETTER_PATH = os.path.join(OUTPUT_DIR, "dead_letters.jsonl") # centres still failing after the run
+SITE_URL = "https://voterlist.election.gov.np/"
+HEADLESS = False # True to run without a window (bench_scrapers.py does)
+EXTRACT_MODE = "dom" # or "network" to read rows from the table response (xhr_capture.py), or "pages"
+PAGE_SIZE = 500 # rows per page in "pages" mode: big centres are read and written a page at a time
+RECRAWL = False # True: probe saved centres for changes instead of skipping them (changes.py)
+WAITS = Waiter()
+RATE = RateController() # paces centres instead of a fixed 1 s pause
+RETRY = RetryPolicy() # backoff and circuit breaking per step (goto, select, submit, ...)
+TABLE = TableReader(WAITS, RETRY)
+
+OPTIONS_JS = """
+    opts => opts.map(o => ({
+        text: o.innerText.trim(),
+        value: o.value
+    })).filter(o => o.value !== "")
+"""
 
 def ensure_dir(directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
 def get_options(page, selector):
-    return page.eval_on_selector_all(f"{selector} option", """
-        opts => opts.map(o => ({
-            text: o.innerText.trim(), 
-            value: o.value
-        })).filter(o => o.value !== "")
-    """)
-
-def scrape_data(page, district_name, mun_name, ward_name, center_name):
-    print(f"Processing: {district_name} -> {mun_name} -> Ward {ward_name} -> {center_name}")
-    
-    # 1. Click Submit
-    submit_btn = page.query_selector("button.btn-success")
-    if not submit_btn:
-        submit_btn = page.query_selector("input[type='submit']")
-    
+    return page.eval_on_selector_all(f"{selector} option", OPTIONS_JS)
+
+def cached_options(catalog, page, level, parents):
+    # Dropdown options from the catalog, reading the live <select> only on a miss
+    options = catalog.options(level, parents, lambda: [
+        (o["value"], o["text"]) for o in get_options(page, f"select#{level}")
+    ])
+    return [{"value": value, "text": text} for value, text in options]
+
+def centre_csv_path(mun_dir, ward_text, center_text):
+    safe_center_name = center_text.replace("/", "-").replace("\\", "-")
+    return os.path.join(mun_dir, f"Ward_{ward_text}_{safe_center_name}.csv")
+
+def journal_path(output_dir=OUTPUT_DIR, output_format=OUTPUT_FORMAT):
+    # Each output format keeps its own journal
+    if output_format == "parquet":
+        return os.path.join(output_dir, "parquet.journal.jsonl")
+    return os.path.join(output_dir, "journal.jsonl")
+
+def save_centre(data, key, dist_name, mun_text, ward_text, center_text,
+                output_dir=OUTPUT_DIR, output_format=OUTPUT_FORMAT):
+    # Write one centre's frame (records.SCHEMA); returns (path, sha256) for the journal
+    with METRICS.span("save"):
+        if output_format == "parquet":
+            root = os.path.join(output_dir, PARQUET_DIR)
+            return write_centre(root, data, key, dist_name, mun_text, ward_text)
+        mun_dir = os.path.join(output_dir, dist_name, mun_text)
+        ensure_dir(mun_dir)
+        csv_path = centre_csv_path(mun_dir, ward_text, center_text)
+        return csv_path, atomic_save(data, csv_path, index=False, encoding='utf-8')
+
+class CentreWriter:
+    # save_centre() for a centre read in pages: each page is written as it
+    # arrives, so neither the browser nor this process holds the whole centre.
+    # close() moves the file into place; until then the old one stands.
+    def __init__(self, key, dist_name, mun_text, ward_text, center_text,
+                 output_dir=OUTPUT_DIR, output_format=OUTPUT_FORMAT):
+        self.names = (dist_name, mun_text, ward_text, center_text)
+        self.output_format = output_format
+        if output_format == "parquet":
+            self.file = PartWriter(os.path.join(output_dir, PARQUET_DIR), key, dist_name, mun_text, ward_text)
+        else:
+            mun_dir = os.path.join(output_dir, dist_name, mun_text)
+            ensure_dir(mun_dir)
+            self.file = AtomicCsv(centre_csv_path(mun_dir, ward_text, center_text))
+        self.path = self.file.path
+        self.hashes = []  # row hashes of every page, for the change fingerprint
+        self.rows = 0
+
+    @property
+    def empty(self):
+        return self.rows == 0
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, rows_data):
+        frame = build_frame(rows_data, *self.names)
+        with METRICS.span("save"):
+            self.file.append(frame)
+        self.hashes.append(row_hashes(frame))
+        self.rows += len(frame)
+
+    def content(self):
+        return content_hash(hashes=self.hashes)
+
+    def read(self):
+        # The whole centre back from the temp file (only needed to diff a
+        # changed centre); nothing can be appended after this
+        self.file.finish()
+        if self.output_format == "parquet":
+            return normalize(pq.read_table(self.file.tmp_path).to_pandas())
+        return normalize(pd.read_csv(self.file.tmp_path, dtype=str, keep_default_na=False, encoding="utf-8"))
+
+    def close(self):
+        with METRICS.span("save"):
+            return self.path, self.file.close()
+
+    def abort(self):
+        self.file.abort()
+
+def capture_rows(page, capture):
+    submit_btn = find_submit(page)
     if not submit_btn:
-        print("!! Submit button not found")
-        return []
+        raise RuntimeError("Submit button not found")
+    rows_data = capture.submit(submit_btn)
+    if rows_data is None:
+        raise RuntimeError("No table response captured")
+    return rows_data
 
-    submit_btn.click()
+def scrape_pages(page, key, names, submitted=False):
+    # "pages" mode: PAGE_SIZE rows at a time, each page written as it
+    # arrives. The CentreWriter, or an empty frame if the pages could not all
+    # be read or do not add up to the table's total.
+    writer = CentreWriter(key, *names)
+    try:
+        for rows_data in TABLE.read_pages(page, PAGE_SIZE, submitted):
+            writer.append(rows_data)
+    except Exception as e:
+        writer.abort()
+        print(f"!! Could not read the table: {e}")
+        return build_frame([], *names)
+    if writer.empty:
+        writer.abort()
+        return build_frame([], *names)
+    print(f"   Fetched {writer.rows} rows in pages of {PAGE_SIZE}.")
+    return writer
+
+def scrape_data(page, district_name, mun_name, ward_name, center_name, capture=None, tracker=None, key=None,
+                mode=None):
+    # The centre as a records.SCHEMA frame (empty if the table could not be
+    # read), or a CentreWriter in "pages" mode. With a tracker, a centre
+    # saved before is probed first: UNCHANGED if its row count still matches
+    # and no refresh is due. mode overrides EXTRACT_MODE.
+    print(f"Processing: {district_name} -> {mun_name} -> Ward {ward_name} -> {center_name}")
     
-    # 2. Wait for table loading
     try:
-        # Wait a bit for the table to appear or update
-        page.wait_for_selector("table#tbl_data", state="attached", timeout=10000)
-    except:
-        print("!! Table not found or timed out")
-        return []
+        submitted = False
+        if tracker is not None and capture is None and tracker.previous(key) is not None:
+            count = TABLE.count(page)
+            if not tracker.due(key, count):
+                print(f"   Unchanged: {count} rows.")
+                return UNCHANGED
+            submitted = True
+        if capture is not None:
+            # Network mode: the rows come from the table response, nothing is drawn
+            rows_data = RETRY.call("submit", capture_rows, page, capture)
+            source = "network"
+        elif (mode or EXTRACT_MODE) == "pages":
+            # PAGE_SIZE rows drawn at a time, each page saved as it arrives
+            return scrape_pages(page, key, (district_name, mun_name, ward_name, center_name), submitted)
+        else:
+            # Submit, show 'All' rows, read DataTables row data (or the DOM)
+            result = TABLE.read(page, submitted=submitted)
+            rows_data, source = result["rows"], result["source"]
+        print(f"   Fetched {len(rows_data)} rows ({source}).")
+    except Exception as e:
+        print(f"!! Could not read the table: {e}")
+        rows_data = []
+
+    return build_frame(rows_data, district_name, mun_name, ward_name, center_name)
 
-    # 3. Apply 'All' rows hack
+def scrape_centre(page, nav, values, names, capture=None, tracker=None):
+    # Select and scrape one centre at RATE's pace. None if it could not be
+    # selected, an empty frame if it gave no rows, UNCHANGED if the probe matched.
+    RATE.wait()
+    started = time.perf_counter()
+    timeouts_before = sum(WAITS.timeouts_hit.values())
     try:
-        # Check if select exists
-        has_select = page.evaluate("() => !!document.querySelector('select[name=\"tbl_data_length\"]')")
-        
-        if has_select:
-            page.evaluate("""() => {
-                const sel = document.querySelector('select[name="tbl_data_length"]');
-                if (sel) {
-                    let opt = sel.querySelector('option[value="-1"]');
-                    if (!opt) {
-                        opt = document.createElement('option');
-                        opt.value = "-1";
-                        opt.text = "All";
-                        sel.add(opt);
-                    }
-                    sel.value = "-1";
-                    sel.dispatchEvent(new Event('change'));
-                }
-            }""")
-            # Wait for reload/update. 
-            # We can check if the rows count changes or just wait.
-            # A fixed wait is safer for now.
-            page.wait_for_timeout(3000)
+        nav.go(*values)
     except Exception as e:
-        print(f"!! Error setting 'All' rows: {e}")
-
-    # 4. Extract Data
-    rows_data = page.evaluate("""() => {
-        const rows = Array.from(document.querySelectorAll('table#tbl_data tbody tr'));
-        return rows.map(row => {
-            const cells = Array.from(row.querySelectorAll('td'));
-            return cells.map(cell => cell.innerText.trim());
-        });
-    }""")
-    
-    print(f"   Fetched {len(rows_data)} rows.")
-
-    structured_data = []
-    for cells in rows_data:
-        # Basic validation: Table usually has 8 columns
-        # Serial, Voter ID, Name, Age, Gender, Spouse, Parent, Mother
-        if len(cells) >= 8:
-            record = {
-                "District": district_name,
-                "Municipality": mun_name,
-                "Ward No": ward_name,
-                "Polling Centre": center_name,
-                "Voter ID": cells[2] if len(cells) > 2 else "",
-                "Name": cells[3] if len(cells) > 3 else "",
-                "Age": cells[4] if len(cells) > 4 else "",
-                "Gender": cells[5] if len(cells) > 5 else "",
-                "Spouse Name": cells[6] if len(cells) > 6 else "",
-                "Parent Name": cells[7] if len(cells) > 7 else "",
-                "Mother Name": cells[8] if len(cells) > 8 else "" 
-            }
-            structured_data.append(record)
-            
-    return structured_data
+        print(f"      !! Could not select centre ({e})")
+        RATE.observe(time.perf_counter() - started, ERROR)
+        return None
+
+    data = scrape_data(page, *names, capture, tracker, centre_key(*values))
+    # Speed up while the site keeps up, back off on timeouts / failures
+    timed_out = sum(WAITS.timeouts_hit.values()) > timeouts_before
+    healthy = data is UNCHANGED or not data.empty
+    RATE.observe(time.perf_counter() - started, TIMEOUT if timed_out else None if healthy else ERROR)
+    return data
+
+def record_centre(journal, key, data, names, started, tracker):
+    # Save and journal one centre with its fingerprint; False if there was
+    # nothing to save
+    if data is UNCHANGED:
+        tracker.unchanged(key, time.perf_counter() - started)
+        return True
+    if data is None or data.empty:
+        journal.record(key, FAILED, seconds=time.perf_counter() - started)
+        return False
+    if isinstance(data, CentreWriter):
+        # Written page by page already; moved into place after the diff
+        fingerprint = tracker.fingerprint(key, data.read, data.content())
+        path, digest = data.close()
+    else:
+        fingerprint = tracker.fingerprint(key, data)  # diffs against the old file before it is replaced
+        path, digest = save_centre(data, key, *names)
+    journal.record(key, DONE, len(data), path, digest, time.perf_counter() - started, **fingerprint)
+    print(f"      Saved to {path}")
+    return True
 
 def run():
     ensure_dir(OUTPUT_DIR)
+    METRICS.start(OUTPUT_DIR, "districts") # metrics.jsonl and metrics_districts.prom, see metrics.py
+    catalog = Catalog()
+    journal = Journal(journal_path())
+    dead = DeadLetters(DEAD_LETTER_PATH)
+    tracker = ChangeTracker(journal, OUTPUT_DIR)
     
     with sync_playwright() as p:
-        # headless=False so you can see it working. Set to True for background run.
-        browser = p.chromium.launch(headless=False) 
-        context = browser.new_context()
-        page = context.new_page()
+        # HEADLESS = False so you can see it working. Set to True for background run.
+        browser = p.chromium.launch(headless=HEADLESS)
+        # Block images/fonts, serve the site's JS/CSS from the local cache
+        policy = RequestPolicy()
+        # Replaced every MAX_CENTRES centres or when the browser uses too much memory
+        pool = ContextPool(browser, policy)
+        page = pool.page
+        capture = None
+        if EXTRACT_MODE == "network":
+            from xhr_capture import TableCapture
+            capture = TableCapture(page)
         
+        # Only re-selects the dropdown levels that change between centres
+        nav = Navigator(page, WAITS, SITE_URL, retry=RETRY)
         print("Navigate to site...")
-        page.goto("https://voterlist.election.gov.np/", timeout=60000)
+        nav.reload()
         
         # Select State
         print(f"Selecting State: {STATE_ID}")
-        page.select_option("select#state", value=STATE_ID)
-        page.wait_for_timeout(1000)
+        nav.go(STATE_ID)
 
         for district in DISTRICTS:
             dist_id = district["id"]
             dist_name = district["name"]
             
             print(f"\n=== Starting District: {dist_name} ({dist_id}) ===")
-            page.select_option("select#state", value=STATE_ID) # Ensure state is selected
-            page.wait_for_timeout(500)
-            page.select_option("select#district", value=dist_id)
-            page.wait_for_timeout(1000)
+            try:
+                nav.go(STATE_ID, dist_id)
+            except Exception as e:
+                print(f"!! Could not select district: {e}")
+                catalog.invalidate("district", [STATE_ID])
+                continue
             
             # Get Municipalities
             # Note: We need to re-query options every time the parent reference changes, 
             # but getting the list of values upfront is safer, then re-selecting by value.
-            mun_options = get_options(page, "select#vdc_mun")
+            mun_options = cached_options(catalog, page, "vdc_mun", [STATE_ID, dist_id])
             
             for mun_opt in mun_options:
                 mun_val = mun_opt["value"]
                 mun_text = mun_opt["text"]
                 
-                # Create folder for Municipality
-                mun_dir = os.path.join(OUTPUT_DIR, dist_name, mun_text)
-                ensure_dir(mun_dir)
-                
                 print(f" -> Municipality: {mun_text}")
                 
-                # Re-select context to be safe (state -> district -> mun)
-                page.select_option("select#district", value=dist_id)
-                page.wait_for_timeout(500)
-                page.select_option("select#vdc_mun", value=mun_val)
-                page.wait_for_timeout(1000)
+                # A value gone stale in the catalog: re-read the list next run
+                try:
+                    nav.go(STATE_ID, dist_id, mun_val)
+                except Exception as e:
+                    print(f" !! Could not select municipality: {e}")
+                    catalog.invalidate("vdc_mun", [STATE_ID, dist_id])
+                    continue
                 
                 # Get Wards
-                ward_options = get_options(page, "select#ward")
+                ward_options = cached_options(catalog, page, "ward", [STATE_ID, dist_id, mun_val])
                 
                 for ward_opt in ward_options:
                     ward_val = ward_opt["value"]
@@ -162,52 +301,78 @@ def run():
                     
                     print(f"   -> Ward: {ward_text}")
                     
-                    # Re-select context
-                    page.select_option("select#vdc_mun", value=mun_val)
-                    page.wait_for_timeout(500)
-                    page.select_option("select#ward", value=ward_val)
-                    page.wait_for_timeout(1000)
+                    try:
+                        nav.go(STATE_ID, dist_id, mun_val, ward_val)
+                    except Exception as e:
+                        print(f"   !! Could not select ward: {e}")
+                        catalog.invalidate("ward", [STATE_ID, dist_id, mun_val])
+                        continue
                     
                     # Get Polling Centres
-                    center_options = get_options(page, "select#reg_centre")
+                    center_options = cached_options(catalog, page, "reg_centre", [STATE_ID, dist_id, mun_val, ward_val])
                     
                     for center_opt in center_options:
                         center_val = center_opt["value"]
                         center_text = center_opt["text"]
                         
-                        # Check if file exists to skip
-                        safe_center_name = center_text.replace("/", "-").replace("\\", "-")
-                        csv_path = os.path.join(mun_dir, f"Ward_{ward_text}_{safe_center_name}.csv")
+                        # Skip centres the journal has as complete
+                        key = centre_key(STATE_ID, dist_id, mun_val, ward_val, center_val)
                         
-                        if os.path.exists(csv_path):
-                            print(f"      [Skipping] Already exists: {csv_path}")
+                        if journal.done(key) and not RECRAWL:
+                            print(f"      [Skipping] Already done: {center_text}")
                             continue
-
-                        # Select Center
-                        page.select_option("select#ward", value=ward_val)
-                        page.wait_for_timeout(500)
-                        page.select_option("select#reg_centre", value=center_val)
-                        
-                        # Scrape
-                        data = scrape_data(page, dist_name, mun_text, ward_text, center_text)
+                        METRICS.begin()  # stage times from here on belong to this centre
+                        started = time.perf_counter()
+                        values = (STATE_ID, dist_id, mun_val, ward_val, center_val)
+                        names = (dist_name, mun_text, ward_text, center_text)
                         
-                        # Save
-                        if data:
-                            df = pd.DataFrame(data)
-                            df.to_csv(csv_path, index=False, encoding='utf-8')
-                            print(f"      Saved to {csv_path}")
+                        # Select Center and Scrape
+                        data = scrape_centre(page, nav, values, names, capture, tracker)
+                        if data is None:
+                            # Catalog may be stale: re-read this ward's centres next time
+                            catalog.invalidate("reg_centre", [STATE_ID, dist_id, mun_val, ward_val])
                         
-                        # Navigate back / reset for next iteration?
-                        # The page might have reloaded. It's safer to ensure we are at the root or just re-select content.
-                        # Since scrape_data clicks submit, the page content changes.
-                        # We don't always reload the page, but the dropdowns might need refreshing or the selection might trigger ajax.
-                        # The safest usage for this specific site (which uses ajax) is probably to 
-                        # just re-select the dropdowns in the next loop iteration, which we do.
+                        # Save, or keep it for the retry pass at the end
+                        if not record_centre(journal, key, data, names, started, tracker):
+                            dead.add(key, values, names, "not selectable" if data is None else "no rows")
+
+                        # A replaced context comes back on this ward
+                        if pool.release(nav):
+                            page = pool.page
+                            if capture is not None:
+                                capture = TableCapture(page)
                         
-                        # Small pause to be nice to server
-                        time.sleep(1)
+                        # No reset needed: the next nav.go() re-selects whatever
+                        # the Submit changed and reloads only if the form is gone.
+
+        # One more try for the centres that failed, after the site has had a rest
+        if len(dead):
+            print(f"\nRetrying {len(dead)} failed centres...")
+        for key, letter in dead.items():
+            METRICS.begin()
+            started = time.perf_counter()
+            data = scrape_centre(page, nav, letter["values"], letter["names"], capture, tracker)
+            if record_centre(journal, key, data, letter["names"], started, tracker):
+                dead.discard(key)
+            if pool.release(nav):
+                page = pool.page
+                if capture is not None:
+                    capture = TableCapture(page)
+        dead.save()
 
+        pool.close()
         browser.close()
+        catalog.close()
+        journal.close()
+        METRICS.close()
+        print(WAITS.summary())
+        print(nav.summary())
+        print(RATE.summary())
+        print(RETRY.summary())
+        print(tracker.summary())
+        print(policy.summary())
+        print(pool.summary())
+        print(METRICS.summary())
 
 if __name__ == "__main__":
     run()
@@ -3,247 +3,252 @@ import pandas as pd
 import time
 import os
 
+from waits import Waiter
+from resource_policy import RequestPolicy
+from extract import TableReader
+from catalog import Catalog
+from navigator import Navigator
+from regions import RegionSpec
+from retry import RetryPolicy, DeadLetters
+from journal import Journal, centre_key, atomic_save, DONE, FAILED
+from rollup_writer import RollupWriter
+from records import build_frame, normalize
+from metrics import METRICS
+from context_pool import ContextPool
+
 # Configuration
 STATE_ID = "3" # Bagmati
 DISTRICT_ID = "28" # Lalitpur
+DISTRICT_NAME = "Lalitpur"
 OUTPUT_DIR = "data"
+JOURNAL_PATH = os.path.join(OUTPUT_DIR, "lalitpur.journal.jsonl")
+DEAD_LETTER_PATH = os.path.join(OUTPUT_DIR, "lalitpur.dead_letters.jsonl")
+ROLLUP_FORMAT = "xlsx" # or "csv" for the municipality and all-district rollups
+ALL_SHEET_PER_MUNICIPALITY = False # one sheet per municipality in all_voter_list.xlsx
+SITE_URL = "https://voterlist.election.gov.np/"
+HEADLESS = False # True to run without a window
+EXTRACT_MODE = "all" # or "pages" to draw PAGE_SIZE rows at a time (for the metro's largest centres)
+PAGE_SIZE = 500
+REGIONS = RegionSpec(f"{STATE_ID}/{DISTRICT_ID}/*/1") # ward 1 of every municipality; see regions.py
+WAITS = Waiter()
+RETRY = RetryPolicy() # see retry.py
+TABLE = TableReader(WAITS, RETRY)
 
 def scrape_polling_centre(page, mun_name, ward_name, center_name):
     print(f"Scraping: {mun_name} - Ward {ward_name} - {center_name}")
     
-    # Click Submit
-    submit_btn = page.query_selector("button.btn-success")
-    if not submit_btn:
-        submit_btn = page.query_selector("input[type='submit']")
-    
-    if not submit_btn:
-        print("Submit button not found!")
-        return []
-
-    submit_btn.click()
-    
-    # Wait for table
     try:
-        page.wait_for_selector("table#tbl_data", timeout=10000)
-    except:
-        print("Table not found (timeout). Maybe no data?")
-        return []
+        if EXTRACT_MODE == "pages":
+            # The browser only ever draws one page. The rows are still gathered
+            # here, since the centre's xlsx and the rollups take one frame.
+            page_data = [row for rows in TABLE.read_pages(page, PAGE_SIZE) for row in rows]
+        else:
+            # Submit, force "All" rows and read them all at once, each step retried with backoff
+            page_data = TABLE.read(page)["rows"]
+    except Exception as e:
+        print(f"Could not read the table: {e}")
+        page_data = []
+    else:
+        print(f"  Found {len(page_data)} rows.")
+    
+    # Columns: Serial, ID, Name, Age, Gender, Spouse, Parent, Link; one frame
+    # with the location stored once (see records.py)
+    return build_frame(page_data, DISTRICT_NAME, mun_name, ward_name, center_name)
 
-    # Force "All" rows (-1)
+def scrape_centre(page, nav, values, names):
+    # None if the centre could not be selected
     try:
-        page.evaluate("""() => {
-            const sel = document.querySelector('select[name="tbl_data_length"]');
-            if (sel) {
-                // Check if -1 option exists
-                let opt = sel.querySelector('option[value="-1"]');
-                if (!opt) {
-                    opt = document.createElement('option');
-                    opt.value = "-1";
-                    opt.text = "All";
-                    sel.add(opt);
-                }
-                sel.value = "-1";
-                sel.dispatchEvent(new Event('change'));
-            }
-        }""")
-        # Wait for table to update. 
-        # If there are many rows, this might take a moment.
-        # We can wait for the number of rows to be > 100 if possible, or just a fixed wait.
-        # Or wait for the processing overlay to disappear.
-        page.wait_for_timeout(3000) 
+        nav.go(*values)
     except Exception as e:
-        print(f"Could not set 'All' rows: {e}")
-
-    # Scrape all rows at once
-    page_data = page.evaluate("""() => {
-        const rows = Array.from(document.querySelectorAll('tbody tr'));
-        return rows.map(row => {
-            const cells = Array.from(row.querySelectorAll('td'));
-            return cells.map(cell => cell.innerText);
-        });
-    }""")
-    
-    print(f"  Found {len(page_data)} rows.")
-    
-    all_data = []
-    for cells in page_data:
-        # Add metadata
-        if len(cells) >= 8: # Ensure valid row
-            # Columns: Serial, ID, Name, Age, Gender, Spouse, Parent, Link
-            record = {
-                "Municipality": mun_name,
-                "Ward": ward_name,
-                "Polling Centre": center_name,
-                "Voter ID": cells[2],
-                "Name": cells[3],
-                "Age": cells[4],
-                "Gender": cells[5],
-                "Spouse Name": cells[6],
-                "Parent Name": cells[7]
-            }
-            all_data.append(record)
+        print(f"  Could not select polling centre: {e}")
+        return None
+    return scrape_polling_centre(page, *names)
+
+def save_polling_centre(journal, key, data, names, started):
+    # Save and journal one centre; False if it has to be tried again
+    mun_text, ward_text, center_text = names
+    if data is not None and not data.empty:
+        try:
+            safe_mun = mun_text.replace('/', '_').strip()
+            safe_ward = ward_text.replace('/', '_').strip()
+            safe_center = center_text.replace('/', '_').strip()
             
-    return all_data
-
-def navigate_to_context(page, mun_val, ward_val):
-    print("  Re-navigating to context...")
-    page.goto("https://voterlist.election.gov.np/", timeout=60000)
-    page.select_option("select#state", value=STATE_ID)
-    page.wait_for_timeout(1000)
-    page.select_option("select#district", value=DISTRICT_ID)
-    page.wait_for_timeout(1000)
-    page.select_option("select#vdc_mun", value=mun_val)
-    page.wait_for_timeout(1000)
-    page.select_option("select#ward", value=ward_val)
-    page.wait_for_timeout(1000)
+            # Create Mun directory
+            mun_dir = os.path.join(OUTPUT_DIR, safe_mun)
+            if not os.path.exists(mun_dir):
+                os.makedirs(mun_dir)
+                
+            filename = os.path.join(mun_dir, f"Ward_{safe_ward}_{safe_center}.xlsx")
+            with METRICS.span("save"):
+                digest = atomic_save(data, filename, index=False)
+            journal.record(key, DONE, len(data), filename, digest, time.perf_counter() - started)
+            print(f"  Saved {len(data)} records to {filename}")
+            return True
+        except Exception as e:
+            print(f"  Error saving file: {e}")
+    journal.record(key, FAILED, seconds=time.perf_counter() - started)
+    return False
+
+def get_options(page, selector):
+    select = page.query_selector(selector)
+    if not select:
+        return []
+    results = []
+    for opt in select.query_selector_all("option"):
+        val = opt.get_attribute("value")
+        text = opt.inner_text()
+        if val: # Skip placeholder
+            results.append((val, text))
+    return results
 
 def run():
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
+    METRICS.start(OUTPUT_DIR, "lalitpur") # metrics.jsonl and metrics_lalitpur.prom, see metrics.py
+    catalog = Catalog()
+    journal = Journal(JOURNAL_PATH)
+    dead = DeadLetters(DEAD_LETTER_PATH)
 
     with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)
-        context = browser.new_context()
-        page = context.new_page()
+        browser = p.chromium.launch(headless=HEADLESS)
+        # Block images/fonts, serve the site's JS/CSS from the local cache
+        policy = RequestPolicy()
+        # Replaced every MAX_CENTRES centres or when the browser uses too much memory
+        pool = ContextPool(browser, policy)
+        page = pool.page
         
-        print("Navigating to https://voterlist.election.gov.np/ ...")
-        page.goto("https://voterlist.election.gov.np/", timeout=60000)
+        # Only re-selects the dropdown levels that change between centres
+        nav = Navigator(page, WAITS, SITE_URL, retry=RETRY)
+        print(f"Navigating to {SITE_URL} ...")
+        nav.reload()
         
         # Select State
         print("Selecting State 3...")
-        page.select_option("select#state", value=STATE_ID)
-        page.wait_for_timeout(2000)
+        nav.go(STATE_ID)
         
         # Select District
         print("Selecting District 28 (Lalitpur)...")
-        page.select_option("select#district", value=DISTRICT_ID)
-        page.wait_for_timeout(2000)
+        nav.go(STATE_ID, DISTRICT_ID)
         
         # Get Municipalities
-        mun_select = page.query_selector("select#vdc_mun")
-        mun_options = mun_select.query_selector_all("option")
-        # Skip first (placeholder)
-        muns = []
-        for opt in mun_options:
-            val = opt.get_attribute("value")
-            text = opt.inner_text()
-            if val:
-                muns.append((val, text))
+        muns = catalog.options("vdc_mun", [STATE_ID, DISTRICT_ID], lambda: get_options(page, "select#vdc_mun"))
         
         print(f"Found {len(muns)} municipalities.")
         
-        all_records = []
-        tables_scraped = 0
+        # Rollups are streamed to disk as centres finish
+        all_writer = RollupWriter(f"all_voter_list.{ROLLUP_FORMAT}")
 
         for mun_val, mun_text in muns:
+            if not REGIONS.allows([(STATE_ID, ""), (DISTRICT_ID, ""), (mun_val, mun_text)]):
+                continue
             print(f"\nProcessing Municipality: {mun_text}")
-            mun_data = []
             
             # Select Municipality
-            # We might need to re-select if we reloaded
             try:
-                page.select_option("select#vdc_mun", value=mun_val)
-                page.wait_for_timeout(2000)
-            except:
-                navigate_to_context(page, mun_val, "") # Ward not known yet
+                nav.go(STATE_ID, DISTRICT_ID, mun_val)
+            except Exception as e:
+                print(f"  Could not select municipality: {e}")
+                catalog.invalidate("vdc_mun", [STATE_ID, DISTRICT_ID])
+                continue
+
+            mun_writer = RollupWriter(f"{OUTPUT_DIR}/{mun_text.replace('/', '_')}.{ROLLUP_FORMAT}")
+            all_sheet = mun_text if ALL_SHEET_PER_MUNICIPALITY else None
             
             # Get Wards
-            ward_select = page.query_selector("select#ward")
-            ward_options = ward_select.query_selector_all("option")
-            wards = []
-            for opt in ward_options:
-                val = opt.get_attribute("value")
-                text = opt.inner_text()
-                if val:
-                    wards.append((val, text))
+            wards = catalog.options("ward", [STATE_ID, DISTRICT_ID, mun_val], lambda: get_options(page, "select#ward"))
             
             print(f"  Found {len(wards)} wards.")
             
             for ward_val, ward_text in wards:
-                # Filter for Ward 1 only
-                if ward_text.strip() not in ["1", "१"]:
+                # Only the wards REGIONS asks for
+                ward_path = [(STATE_ID, ""), (DISTRICT_ID, ""), (mun_val, mun_text), (ward_val, ward_text)]
+                if not REGIONS.allows(ward_path):
                     continue
 
                 # Select Ward
                 try:
-                    page.select_option("select#ward", value=ward_val)
-                    page.wait_for_timeout(2000)
-                except:
-                    navigate_to_context(page, mun_val, ward_val)
+                    nav.go(STATE_ID, DISTRICT_ID, mun_val, ward_val)
+                except Exception as e:
+                    print(f"  Could not select ward: {e}")
+                    catalog.invalidate("ward", [STATE_ID, DISTRICT_ID, mun_val])
+                    continue
 
                 # Get Polling Centres
-                center_select = page.query_selector("select#reg_centre")
-                center_options = center_select.query_selector_all("option")
-                centers = []
-                for opt in center_options:
-                    val = opt.get_attribute("value")
-                    text = opt.inner_text()
-                    if val:
-                        centers.append((val, text))
+                ward_parents = [STATE_ID, DISTRICT_ID, mun_val, ward_val]
+                centers = catalog.options("reg_centre", ward_parents, lambda: get_options(page, "select#reg_centre"))
                 
                 print(f"  Ward {ward_text}: Found {len(centers)} polling centres.")
                 
                 for center_val, center_text in centers:
-                    # Select Polling Centre
-                    try:
-                        page.select_option("select#reg_centre", value=center_val)
-                    except:
-                        print("  Dropdown issue, reloading...")
-                        navigate_to_context(page, mun_val, ward_val)
-                        page.select_option("select#reg_centre", value=center_val)
-                    
-                    # Scrape
-                    data = scrape_polling_centre(page, mun_text, ward_text, center_text)
-                    mun_data.extend(data)
-
-                    # Save Polling Centre Data (One by one)
-                    if data:
-                        try:
-                            df_center = pd.DataFrame(data)
-                            safe_mun = mun_text.replace('/', '_').strip()
-                            safe_ward = ward_text.replace('/', '_').strip()
-                            safe_center = center_text.replace('/', '_').strip()
-                            
-                            # Create Mun directory
-                            mun_dir = os.path.join(OUTPUT_DIR, safe_mun)
-                            if not os.path.exists(mun_dir):
-                                os.makedirs(mun_dir)
-                                
-                            filename = os.path.join(mun_dir, f"Ward_{safe_ward}_{safe_center}.xlsx")
-                            df_center.to_excel(filename, index=False)
-                            print(f"  Saved {len(data)} records to {filename}")
-                        except Exception as e:
-                            print(f"  Error saving file: {e}")
+                    key = centre_key(STATE_ID, DISTRICT_ID, mun_val, ward_val, center_val)
+                    if journal.done(key):
+                        # Already saved: reuse it for the municipality rollup
+                        saved_path = journal.entries[key]["path"]
+                        print(f"  [Skipping] Already done: {saved_path}")
+                        saved = normalize(pd.read_excel(saved_path, dtype=str, keep_default_na=False))
+                        mun_writer.append(saved)
+                        all_writer.append(saved, sheet=all_sheet)
+                        continue
+                    METRICS.begin()  # stage times from here on belong to this centre
+                    started = time.perf_counter()
+                    values = (STATE_ID, DISTRICT_ID, mun_val, ward_val, center_val)
+                    names = (mun_text, ward_text, center_text)
+
+                    # Select Polling Centre and Scrape
+                    data = scrape_centre(page, nav, values, names)
+                    if data is None:
+                        catalog.invalidate("reg_centre", ward_parents)
                     
-                    # Reload page to clean up DOM hack
-                    # This ensures the next iteration starts clean
-                    page.reload()
-                    # We need to get back to the current state (Mun -> Ward)
-                    # But we are inside the loop.
-                    # The easiest way is to just re-select everything at the start of the loop or catch exceptions.
-                    # But since we reload, we MUST re-navigate.
-                    navigate_to_context(page, mun_val, ward_val)
+                    # Save Polling Centre Data (One by one), or keep it for the retry pass
+                    if save_polling_centre(journal, key, data, names, started):
+                        mun_writer.append(data)
+                        all_writer.append(data, sheet=all_sheet)
+                    else:
+                        dead.add(key, values, names, "not selectable" if data is None else "no rows")
+
+                    # A replaced context comes back on this ward
+                    if pool.release(nav):
+                        page = pool.page
+
+            # One more try for this municipality's failed centres before its
+            # file is finished, so recovered rows still reach the rollups
+            mun_dead = [(key, letter) for key, letter in dead.items() if letter["values"][2] == mun_val]
+            if mun_dead:
+                print(f"  Retrying {len(mun_dead)} failed polling centres...")
+            for key, letter in mun_dead:
+                METRICS.begin()
+                started = time.perf_counter()
+                data = scrape_centre(page, nav, letter["values"], letter["names"])
+                if save_polling_centre(journal, key, data, letter["names"], started):
+                    mun_writer.append(data)
+                    all_writer.append(data, sheet=all_sheet)
+                    dead.discard(key)
+                if pool.release(nav):
+                    page = pool.page
                     
-            # Save Municipality Data
-            if mun_data:
-                df = pd.DataFrame(mun_data)
-                filename = f"{OUTPUT_DIR}/{mun_text.replace('/', '_')}.xlsx"
-                df.to_excel(filename, index=False)
-                print(f"Saved {len(mun_data)} records to {filename}")
-                
-                # Add to main list
-                all_records.extend(mun_data)
+            # Finish Municipality file
+            if mun_writer.close():
+                print(f"Saved {mun_writer.rows} records to {mun_writer.path}")
             else:
                 print(f"No data found for {mun_text}")
 
-        # Save ALL data to one file
-        if all_records:
-            print(f"Saving total {len(all_records)} records to all_voter_list.xlsx...")
-            df_all = pd.DataFrame(all_records)
-            df_all.to_excel("all_voter_list.xlsx", index=False)
+        # Finish the all-district file
+        if all_writer.close():
+            print(f"Saved total {all_writer.rows} records to {all_writer.path}")
             print("Done.")
 
+        dead.save()
+        pool.close()
         browser.close()
+        catalog.close()
+        journal.close()
+        METRICS.close()
+        print(WAITS.summary())
+        print(nav.summary())
+        print(RETRY.summary())
+        print(policy.summary())
+        print(pool.summary())
+        print(METRICS.summary())
 
 if __name__ == "__main__":
     run()
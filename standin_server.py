@@ -0,0 +1,311 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from html import escape
+import argparse
+import json
+import os
+import random
+import threading
+import time
+
+from http_scraper import OPTIONS_PATH, VIEW_PATH, LEVELS
+from records import DETAILS_LINK_TEXT
+
+# Local stand-in for voterlist.election.gov.np. Serves the same cascade
+# (state -> district -> vdc_mun -> ward -> reg_centre), the options endpoint
+# the dropdowns call and the table#tbl_data view, filled with deterministic
+# fake voters so scrapers can be exercised without touching the live site.
+#
+# The table pages like the live DataTables one: only page_length rows are
+# drawn at first, the info line says "Showing 1 to 10 of N entries", and
+# changing select[name=tbl_data_length] (to -1 for all) or clicking the
+# pager's Previous / Next redraws behind the processing indicator. Every request can be delayed and made to fail, to
+# benchmark scrapers under a slow or flaky site (bench_scrapers.py).
+
+DEFAULT_CONFIG = {
+    "municipalities": 3,  # per district
+    "wards": 2,  # per municipality
+    "centres": 2,  # per ward
+    "rows": 50,  # voters per centre
+    "seed": 1,
+    "latency": 0.0,  # seconds added to every response (jittered +-50%)
+    "error_rate": 0.0,  # share of options / table requests answered with HTTP 500
+    "page_length": 10,  # rows drawn before a length change; 0 draws every row
+    "draw_delay": 0.05,  # seconds a length change keeps the table processing
+}
+
+STATES = [
+    ("1", "कोशी प्रदेश"),
+    ("2", "मधेश प्रदेश"),
+    ("3", "बागमती प्रदेश"),
+]
+
+DISTRICTS = {
+    "3": [("26", "काठमाडौं"), ("27", "भक्तपुर"), ("28", "ललितपुर")],
+}
+
+FIRST_NAMES = ["राम", "सीता", "हरि", "गीता", "कृष्ण", "माया", "श्याम", "सरिता", "बिष्णु", "कमला"]
+SURNAMES = ["श्रेष्ठ", "महर्जन", "शाक्य", "थापा", "अधिकारी", "कार्की", "प्रजापति", "बज्राचार्य"]
+
+
+class StandinSite:
+    def __init__(self, **config):
+        self.config = dict(DEFAULT_CONFIG, **config)
+
+    def districts(self, state_val):
+        return DISTRICTS.get(state_val, [])
+
+    def municipalities(self, dist_val):
+        names = dict(d for ds in DISTRICTS.values() for d in ds)
+        if dist_val not in names:
+            return []
+        return [
+            (f"{dist_val}{i:02d}", f"{names[dist_val]} नगरपालिका {i}")
+            for i in range(1, self.config["municipalities"] + 1)
+        ]
+
+    def wards(self, mun_val):
+        if not mun_val:
+            return []
+        return [(f"{mun_val}{i:02d}", str(i)) for i in range(1, self.config["wards"] + 1)]
+
+    def centres(self, ward_val):
+        if not ward_val:
+            return []
+        return [
+            (f"{ward_val}{i:02d}", f"वडा कार्यालय {i}, {ward_val}")
+            for i in range(1, self.config["centres"] + 1)
+        ]
+
+    def options(self, list_type, form):
+        if list_type == LEVELS["district"]:
+            return self.districts(form.get("state", ""))
+        if list_type == LEVELS["vdc_mun"]:
+            return self.municipalities(form.get("district", ""))
+        if list_type == LEVELS["ward"]:
+            return self.wards(form.get("vdc_mun", ""))
+        if list_type == LEVELS["reg_centre"]:
+            return self.centres(form.get("ward", ""))
+        return []
+
+    def voters(self, center_val):
+        # Same centre always yields the same voters
+        rng = random.Random(f"{self.config['seed']}-{center_val}")
+        rows = []
+        for i in range(1, self.config["rows"] + 1):
+            surname = rng.choice(SURNAMES)
+            gender = rng.choice(["पुरुष", "महिला"])
+            age = rng.randint(18, 95)
+            spouse = f"{rng.choice(FIRST_NAMES)} {surname}" if age > 25 and rng.random() < 0.8 else "-"
+            rows.append([
+                str(i),
+                f"{center_val}{i:05d}",
+                f"{rng.choice(FIRST_NAMES)} {surname}",
+                str(age),
+                gender,
+                spouse,
+                f"{rng.choice(FIRST_NAMES)} {surname}/ {rng.choice(FIRST_NAMES)} {rng.choice(SURNAMES)}",
+                DETAILS_LINK_TEXT,
+            ])
+        return rows
+
+
+def render_options(options):
+    parts = ['<option value="">-- छान्नुहोस् --</option>']
+    for value, text in options:
+        parts.append(f'<option value="{escape(value)}">{escape(text)}</option>')
+    return "".join(parts)
+
+
+def render_form():
+    return f"""
+<form id="search" method="post" action="/{VIEW_PATH}">
+  <select id="state" name="state">{render_options(STATES)}</select>
+  <select id="district" name="district"><option value="">--</option></select>
+  <select id="vdc_mun" name="vdc_mun"><option value="">--</option></select>
+  <select id="ward" name="ward"><option value="">--</option></select>
+  <select id="reg_centre" name="reg_centre"><option value="">--</option></select>
+  <button type="submit" class="btn btn-success">Submit</button>
+</form>
+<script>
+const CASCADE = ["state", "district", "vdc_mun", "ward", "reg_centre"];
+const LIST_TYPES = {{district: "{LEVELS['district']}", vdc_mun: "{LEVELS['vdc_mun']}", ward: "{LEVELS['ward']}", reg_centre: "{LEVELS['reg_centre']}"}};
+CASCADE.slice(0, -1).forEach((id, i) => {{
+  document.getElementById(id).addEventListener("change", async () => {{
+    const next = CASCADE[i + 1];
+    CASCADE.slice(i + 2).forEach(c => document.getElementById(c).innerHTML = '<option value="">--</option>');
+    const body = new URLSearchParams({{list_type: LIST_TYPES[next]}});
+    CASCADE.slice(0, i + 1).forEach(c => body.append(c, document.getElementById(c).value));
+    const resp = await fetch("/{OPTIONS_PATH}", {{method: "POST", body}});
+    document.getElementById(next).innerHTML = await resp.text();
+  }});
+}});
+</script>
+"""
+
+
+# Client-side paging in the style of DataTables, without jQuery: keeps every
+# row in memory and draws `length` of them, from the page the pager's
+# Previous / Next buttons are on
+PAGING_JS = """
+(() => {
+  const table = document.getElementById("tbl_data");
+  const tbody = table.tBodies[0];
+  const rows = Array.from(tbody.rows);
+  const info = document.getElementById("tbl_data_info");
+  const processing = document.getElementById("tbl_data_processing");
+  const length = document.querySelector('select[name="tbl_data_length"]');
+  const empty = () => {
+    const tr = document.createElement("tr");
+    tr.innerHTML = '<td class="dataTables_empty" colspan="8">No data available in table</td>';
+    return tr;
+  };
+  const next = document.getElementById("tbl_data_next");
+  const previous = document.getElementById("tbl_data_previous");
+  let start = 0;
+  const later = (fn) => {
+    processing.style.display = "block";
+    setTimeout(() => { fn(); draw(); processing.style.display = "none"; }, DRAW_DELAY_MS);
+  };
+  const draw = () => {
+    const n = parseInt(length.value, 10);
+    const shown = n < 0 ? rows : rows.slice(start, start + n);
+    tbody.replaceChildren(...(shown.length ? shown : [empty()]));
+    const first = shown.length ? start + 1 : 0;
+    info.textContent = `Showing ${first} to ${start + shown.length} of ${rows.length} entries`;
+    previous.classList.toggle("disabled", start === 0);
+    next.classList.toggle("disabled", n < 0 || start + n >= rows.length);
+  };
+  length.addEventListener("change", () => later(() => { start = 0; }));
+  next.addEventListener("click", () => {
+    const n = parseInt(length.value, 10);
+    if (!next.classList.contains("disabled")) later(() => { start += n; });
+  });
+  previous.addEventListener("click", () => {
+    const n = parseInt(length.value, 10);
+    if (!previous.classList.contains("disabled")) later(() => { start = Math.max(0, start - n); });
+  });
+  draw();
+})();
+"""
+
+
+def render_table(rows, page_length=0, draw_delay=0.0):
+    # page_length 0: a static table with every row drawn
+    body = "".join(
+        "<tr>" + "".join(f"<td>{escape(c)}</td>" for c in row) + "</tr>"
+        for row in rows
+    )
+    lengths = [10, 25, 50, 100]
+    if page_length and page_length not in lengths:
+        lengths = sorted(lengths + [page_length])
+    options = "".join(
+        f'<option value="{n}"{" selected" if n == page_length else ""}>{n}</option>' for n in lengths
+    )
+    shown = min(page_length, len(rows)) if page_length else len(rows)
+    paging = pager = ""
+    if page_length:
+        pager = ('<div id="tbl_data_paginate" class="dataTables_paginate">'
+                 '<a id="tbl_data_previous" class="paginate_button previous disabled">Previous</a>'
+                 f'<a id="tbl_data_next" class="paginate_button next{"" if len(rows) > page_length else " disabled"}">Next</a>'
+                 '</div>\n')
+        paging = "<script>" + PAGING_JS.replace("DRAW_DELAY_MS", json.dumps(int(draw_delay * 1000))) + "</script>"
+    return f"""
+<div class="dataTables_length"><select name="tbl_data_length">{options}</select></div>
+<div id="tbl_data_processing" class="dataTables_processing" style="display:none">Processing...</div>
+<table id="tbl_data">
+  <thead><tr><th>क्र.सं.</th><th>मतदाता नं</th><th>नाम</th><th>उमेर</th>
+  <th>लिङ्ग</th><th>पति/पत्नीको नाम</th><th>पिता/माताको नाम</th><th></th></tr></thead>
+  <tbody>{body}</tbody>
+</table>
+<div id="tbl_data_info" class="dataTables_info">Showing {1 if shown else 0} to {shown} of {len(rows)} entries</div>
+{pager}{paging}"""
+
+
+def page(body):
+    return f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>Voter List</title></head><body>{body}</body></html>'
+
+
+def recorded_payload(payloads, center_val):
+    # A table response saved by xhr_capture.TableCapture(record_dir=...)
+    for ext, content_type in (("json", "application/json"), ("html", "text/html; charset=utf-8")):
+        path = os.path.join(payloads, f"{center_val}.{ext}")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return f.read(), content_type
+    return None
+
+
+def make_handler(site, payloads=None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the live site
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_html(self, html, status=200, content_type="text/html; charset=utf-8"):
+            data = html.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_form(self):
+            parsed = urlparse(self.path)
+            form = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            if length:
+                body = self.rfile.read(length).decode("utf-8")
+                form.update({k: v[0] for k, v in parse_qs(body).items()})
+            return parsed.path, form
+
+        def route(self):
+            path, form = self.read_form()
+            config = site.config
+            if config["latency"]:
+                time.sleep(config["latency"] * random.uniform(0.5, 1.5))
+            if path != "/" and random.random() < config["error_rate"]:
+                self.send_html(page("Internal Server Error"), status=500)
+                return
+            if path == "/":
+                self.send_html(page(render_form()))
+            elif path == "/" + OPTIONS_PATH:
+                self.send_html(render_options(site.options(form.get("list_type", ""), form)))
+            elif path == "/" + VIEW_PATH:
+                recorded = payloads and recorded_payload(payloads, form.get("reg_centre", ""))
+                if recorded:
+                    self.send_html(recorded[0], content_type=recorded[1])
+                    return
+                rows = site.voters(form.get("reg_centre", "")) if form.get("reg_centre") else []
+                self.send_html(page(render_form() + render_table(rows, config["page_length"], config["draw_delay"])))
+            else:
+                self.send_html(page("Not Found"), status=404)
+
+        do_GET = route
+        do_POST = route
+
+    return Handler
+
+
+def start(port=0, payloads=None, **config):
+    # Serve in a background thread; returns (server, base_url)
+    site = StandinSite(**config)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(site, payloads))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in of the voter list site.")
+    parser.add_argument("--port", type=int, default=8765)
+    for key, value in DEFAULT_CONFIG.items():
+        parser.add_argument(f"--{key.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument("--payloads", help="Folder of recorded table responses (<reg_centre>.html/.json)")
+    args = vars(parser.parse_args())
+    port = args.pop("port")
+    payloads = args.pop("payloads")
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(StandinSite(**args), payloads))
+    print(f"Stand-in site on http://127.0.0.1:{port}/")
+    server.serve_forever()
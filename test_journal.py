@@ -0,0 +1,49 @@
+import json
+import os
+import tempfile
+
+from journal import Journal, DONE
+
+# Resume after a crash: a record torn mid-write must not take the next one
+# down with it. Run with pytest or directly.
+
+
+def test_torn_last_line():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.jsonl")
+        journal = Journal(path)
+        journal.record("a", DONE, 1)
+        journal.close()
+        # Crash halfway through the next record
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"key": "b", "sta')
+
+        journal = Journal(path)
+        assert sorted(journal.entries) == ["a"]
+        journal.record("c", DONE, 2)
+        journal.close()
+
+        journal = Journal(path)
+        assert sorted(journal.entries) == ["a", "c"]
+        journal.close()
+
+
+def test_missing_newline():
+    # Only the newline was lost: the record is kept and the next one follows it
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"key": "a", "status": DONE, "rows": 1}))
+        journal = Journal(path)
+        journal.record("b", DONE, 2)
+        journal.close()
+
+        journal = Journal(path)
+        assert sorted(journal.entries) == ["a", "b"]
+        journal.close()
+
+
+if __name__ == "__main__":
+    test_torn_last_line()
+    test_missing_newline()
+    print("journal: ok")
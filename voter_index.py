@@ -0,0 +1,204 @@
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import os
+import time
+
+from merge_data import ROOTS, discover, refresh_cache, cache_path
+
+# Primary-key index on Voter ID over everything the scrapers have written.
+#
+# One pass reads each parsed file (the merge_data cache, so layouts and old
+# shifted files are already sorted out) and keeps only the ID, where the row
+# lives and a hash of the voter's details. The IDs are then sorted once:
+#   - the same ID with the same details again   -> duplicate, dropped
+#   - the same ID with different details        -> conflict, reported
+# Per-centre files come before rollups, so the kept copy of a voter is the
+# one in its centre file.
+#
+# The index is a sorted array of fixed-width records, read with np.memmap,
+# so a lookup is a binary search that loads nothing else:
+#   entries.bin     (id, file, row) sorted by id
+#   files.json      file number -> path (a CSV/XLSX file or Parquet part)
+#   conflicts.csv   every row whose ID was already taken by other details
+#   meta.json
+
+INDEX_DIR = "voter_index"
+# What makes two rows with one ID the same voter. Age is left out: it grows
+# between runs.
+DETAILS = ["Name", "Gender", "Spouse Name", "Parent Name"]
+DEVANAGARI_DIGITS = str.maketrans("०१२३४५६७८९", "0123456789")
+
+
+def entry_dtype(width):
+    return np.dtype([("id", f"S{width}"), ("file", "<u4"), ("row", "<u4")])
+
+
+def normalize_id(value):
+    return str(value).strip().translate(DEVANAGARI_DIGITS)
+
+
+def read_ids(path):
+    # (ids as bytes, detail hashes, rows) of one parsed file, rows without an ID skipped
+    df = pd.read_parquet(cache_path(path))
+    if "Voter ID" not in df.columns:
+        return None, None, None, len(df)
+    ids = df["Voter ID"].fillna("").map(normalize_id)
+    keep = (ids != "").to_numpy()
+    details = df[[c for c in DETAILS if c in df.columns]].fillna("").astype(str)
+    hashes = pd.util.hash_pandas_object(details, index=False).to_numpy()
+    return (
+        ids[keep].str.encode("utf-8").to_numpy().astype(bytes),
+        hashes[keep],
+        df["Source Row"].to_numpy()[keep].astype(np.uint32),
+        int((~keep).sum()),
+    )
+
+
+def build(roots=ROOTS, index_dir=INDEX_DIR, workers=None):
+    started = time.perf_counter()
+    centre_files, rollup_files = discover(roots)
+    files = centre_files + rollup_files
+    print(f"Found {len(centre_files)} centre files and {len(rollup_files)} rollups.")
+    refresh_cache(files, workers)
+
+    id_parts, hash_parts, file_parts, row_parts = [], [], [], []
+    without_id = 0
+    for number, path in enumerate(files):
+        ids, hashes, rows, missing = read_ids(path)
+        without_id += missing
+        if ids is None or not len(ids):
+            continue
+        id_parts.append(ids)
+        hash_parts.append(hashes)
+        file_parts.append(np.full(len(ids), number, dtype=np.uint32))
+        row_parts.append(rows)
+
+    total = sum(len(p) for p in id_parts)
+    width = max([p.dtype.itemsize for p in id_parts] + [1])
+    ids = np.concatenate(id_parts).astype(f"S{width}") if id_parts else np.zeros(0, f"S{width}")
+    hashes = np.concatenate(hash_parts) if hash_parts else np.zeros(0, np.uint64)
+    file_nos = np.concatenate(file_parts) if file_parts else np.zeros(0, np.uint32)
+    rows = np.concatenate(row_parts) if row_parts else np.zeros(0, np.uint32)
+
+    # Stable: within one ID, rows keep file order (centre files first)
+    order = np.argsort(ids, kind="stable")
+    ids, hashes, file_nos, rows = ids[order], hashes[order], file_nos[order], rows[order]
+    first = np.ones(len(ids), dtype=bool)
+    first[1:] = ids[1:] != ids[:-1]
+    group_start = np.maximum.accumulate(np.where(first, np.arange(len(ids)), 0))
+    conflict = ~first & (hashes != hashes[group_start])
+    duplicates = int((~first).sum() - conflict.sum())
+
+    entries = np.zeros(int(first.sum()), dtype=entry_dtype(width))
+    entries["id"], entries["file"], entries["row"] = ids[first], file_nos[first], rows[first]
+
+    tmp_dir = index_dir + ".tmp"
+    os.makedirs(tmp_dir, exist_ok=True)
+    entries.tofile(os.path.join(tmp_dir, "entries.bin"))
+    with open(os.path.join(tmp_dir, "files.json"), "w", encoding="utf-8") as f:
+        json.dump(files, f, ensure_ascii=False)
+    write_conflicts(
+        os.path.join(tmp_dir, "conflicts.csv"), files,
+        ids[conflict], file_nos[group_start[conflict]], rows[group_start[conflict]],
+        file_nos[conflict], rows[conflict],
+    )
+    meta = {"width": width, "voters": len(entries), "rows": total, "duplicates": duplicates,
+            "conflicts": int(conflict.sum()), "without_id": without_id, "roots": list(roots)}
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    if os.path.exists(index_dir):
+        for name in os.listdir(index_dir):
+            os.remove(os.path.join(index_dir, name))
+        os.rmdir(index_dir)
+    os.replace(tmp_dir, index_dir)
+
+    print(f"Indexed {len(entries)} Voter IDs from {total} rows in {time.perf_counter() - started:.1f}s: "
+          f"{duplicates} duplicates dropped, {int(conflict.sum())} conflicting rows "
+          f"(see {index_dir}/conflicts.csv)")
+    if without_id:
+        print(f"{without_id} rows have no Voter ID (files saved in the old column layout); "
+              f"scrape those centres again to fill it in.")
+    return meta
+
+
+def write_conflicts(path, files, ids, kept_files, kept_rows, other_files, other_rows):
+    # Kept row and conflicting row side by side, with the details that differ
+    cache = {}
+
+    def details(file_no, row):
+        if file_no not in cache:
+            cache[file_no] = pd.read_parquet(cache_path(files[file_no]))
+        values = cache[file_no].iloc[int(row)]
+        return " | ".join(str(values.get(c, "")) for c in DETAILS)
+
+    records = []
+    for vid, kf, kr, of, orow in zip(ids, kept_files, kept_rows, other_files, other_rows):
+        records.append({
+            "Voter ID": vid.decode("utf-8"),
+            "Kept File": files[kf], "Kept Row": int(kr), "Kept": details(kf, kr),
+            "Other File": files[of], "Other Row": int(orow), "Other": details(of, orow),
+        })
+    pd.DataFrame(records, columns=["Voter ID", "Kept File", "Kept Row", "Kept", "Other File", "Other Row", "Other"]
+                 ).to_csv(path, index=False, encoding="utf-8")
+
+
+class VoterIndex:
+    def __init__(self, index_dir=INDEX_DIR):
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(index_dir, "files.json"), encoding="utf-8") as f:
+            self.files = json.load(f)
+        path = os.path.join(index_dir, "entries.bin")
+        dtype = entry_dtype(self.meta["width"])
+        self.entries = np.memmap(path, dtype=dtype, mode="r") if os.path.getsize(path) else np.zeros(0, dtype)
+
+    def get(self, voter_id):
+        # (file path, row) or None; a binary search over the sorted IDs
+        key = normalize_id(voter_id).encode("utf-8")
+        if len(key) > self.meta["width"]:
+            return None
+        ids = self.entries["id"]
+        i = int(np.searchsorted(ids, key))
+        if i == len(ids) or ids[i] != key:
+            return None
+        return self.files[int(self.entries["file"][i])], int(self.entries["row"][i])
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def lookup(voter_ids, index_dir=INDEX_DIR, show=False):
+    index = VoterIndex(index_dir)
+    for voter_id in voter_ids:
+        started = time.perf_counter()
+        found = index.get(voter_id)
+        elapsed = (time.perf_counter() - started) * 1000
+        if found is None:
+            print(f"{voter_id}: not found ({elapsed:.2f} ms)")
+            continue
+        path, row = found
+        print(f"{voter_id}: {path}, row {row} ({elapsed:.2f} ms)")
+        if show:
+            values = pd.read_parquet(cache_path(path)).iloc[row]
+            for column, value in values.items():
+                print(f"    {column}: {value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the Voter ID index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="Index everything merge_data.py would merge, dropping duplicates")
+    build_cmd.add_argument("roots", nargs="*", default=ROOTS, help="Folders or files to index")
+    build_cmd.add_argument("--index", default=INDEX_DIR)
+    build_cmd.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    lookup_cmd = sub.add_parser("lookup", help="Where a Voter ID is stored")
+    lookup_cmd.add_argument("voter_ids", nargs="+")
+    lookup_cmd.add_argument("--index", default=INDEX_DIR)
+    lookup_cmd.add_argument("--show", action="store_true", help="Print the stored row too")
+    args = parser.parse_args()
+    if args.command == "build":
+        build(args.roots, args.index, args.workers)
+    else:
+        lookup(args.voter_ids, args.index, args.show)
@@ -0,0 +1,230 @@
+from collections import defaultdict
+import statistics
+import time
+
+from metrics import METRICS
+
+# Event-driven waits for the voter list form, replacing fixed
+# wait_for_timeout() sleeps. Every wait polls for a real completion signal,
+# has its own timeout and records how long it actually took.
+
+# Per-step timeouts (ms)
+TIMEOUTS = {
+    "options": 10000,   # dependent <select> repopulated after a change
+    "table": 10000,     # fresh table#tbl_data after Submit
+    "all_rows": 30000,  # every row drawn after forcing length = -1
+    "page": 10000,      # one page of rows drawn (extract.TableReader.read_pages)
+}
+
+# Which dropdown each selection repopulates
+CASCADE = {
+    "select#state": "select#district",
+    "select#district": "select#vdc_mun",
+    "select#vdc_mun": "select#ward",
+    "select#ward": "select#reg_centre",
+}
+
+# Drop a marker option into the dependent select. The change handler
+# replaces the option list, so the marker disappearing means the AJAX call
+# has come back.
+MARK_OPTIONS_JS = """sel => {
+    const el = document.querySelector(sel);
+    if (!el) return;
+    el.querySelectorAll('option[data-wait-pending]').forEach(o => o.remove());
+    const opt = document.createElement('option');
+    opt.value = '';
+    opt.dataset.waitPending = '1';
+    el.appendChild(opt);
+}"""
+
+OPTIONS_READY_JS = """sel => {
+    const el = document.querySelector(sel);
+    return !!el
+        && !el.querySelector('option[data-wait-pending]')
+        && Array.from(el.options).some(o => o.value !== '');
+}"""
+
+CLEAR_MARK_JS = """sel => {
+    const el = document.querySelector(sel);
+    if (el) el.querySelectorAll('option[data-wait-pending]').forEach(o => o.remove());
+}"""
+
+# Tag the table that is on screen before Submit so the old one is not
+# mistaken for the new result.
+MARK_TABLE_JS = """() => {
+    const t = document.querySelector('table#tbl_data');
+    if (t) t.dataset.waitStale = '1';
+}"""
+
+# DataTables helpers shared by the predicates below. The total comes from
+# the "Showing 1 to 10 of N entries" info line (Devanagari digits allowed).
+_DT_HELPERS = """
+    const processing = () => {
+        const p = document.querySelector('#tbl_data_processing, .dataTables_processing');
+        return !!p && getComputedStyle(p).display !== 'none' && p.offsetParent !== null;
+    };
+    const rowCount = () => {
+        const rows = document.querySelectorAll('table#tbl_data tbody tr');
+        if (rows.length === 1 && rows[0].querySelector('td.dataTables_empty')) return 0;
+        return rows.length;
+    };
+    const reportedTotal = () => {
+        const info = document.querySelector('#tbl_data_info, .dataTables_info');
+        if (!info) return null;
+        const text = info.textContent
+            .replace(/[०-९]/g, d => String('०१२३४५६७८९'.indexOf(d)))
+            .replace(/,/g, '');
+        const m = text.match(/of\\s+(\\d+)/i) || [null, (text.match(/\\d+/g) || []).pop()];
+        return m[1] === undefined ? null : parseInt(m[1], 10);
+    };
+    // [first, last, total] from "Showing 11 to 20 of N entries" (null if not shown)
+    const reportedRange = () => {
+        const info = document.querySelector('#tbl_data_info, .dataTables_info');
+        if (!info) return null;
+        const numbers = info.textContent
+            .replace(/[०-९]/g, d => String('०१२३४५६७८९'.indexOf(d)))
+            .replace(/,/g, '')
+            .match(/\\d+/g);
+        return numbers && numbers.length >= 3 ? numbers.slice(0, 3).map(n => parseInt(n, 10)) : null;
+    };
+"""
+
+TABLE_READY_JS = """() => {""" + _DT_HELPERS + """
+    const t = document.querySelector('table#tbl_data');
+    return !!t && !t.dataset.waitStale && !processing();
+}"""
+
+ALL_ROWS_READY_JS = """() => {""" + _DT_HELPERS + """
+    if (processing()) return false;
+    const total = reportedTotal();
+    const rows = rowCount();
+    return total === null ? rows > 0 : rows >= total;
+}"""
+
+ROW_STATUS_JS = """() => {""" + _DT_HELPERS + """
+    return {rows: rowCount(), total: reportedTotal()};
+}"""
+
+PAGE_RANGE_JS = """() => {""" + _DT_HELPERS + """
+    return reportedRange();
+}"""
+
+# Rows first..last drawn and nothing pending
+PAGE_READY_JS = """([first, last]) => {""" + _DT_HELPERS + """
+    if (processing()) return false;
+    const range = reportedRange();
+    return !!range && range[0] === first && range[1] === last && rowCount() === last - first + 1;
+}"""
+
+
+class Waiter:
+    def __init__(self, timeouts=None):
+        self.timeouts = dict(TIMEOUTS, **(timeouts or {}))
+        self.timings = defaultdict(list)
+        self.timeouts_hit = defaultdict(int)
+
+    def record(self, step, started, ok):
+        seconds = time.perf_counter() - started
+        self.timings[step].append(seconds)
+        METRICS.observe(f"wait_{step}", seconds)
+        if not ok:
+            self.timeouts_hit[step] += 1
+            METRICS.count("timeouts", wait=step)
+
+    def _poll(self, page, step, predicate, arg=None):
+        started = time.perf_counter()
+        try:
+            page.wait_for_function(predicate, arg=arg, timeout=self.timeouts[step])
+            ok = True
+        except Exception:
+            ok = False
+        self.record(step, started, ok)
+        return ok
+
+    def select(self, page, selector, value):
+        # select_option + wait until the dependent dropdown has been refilled
+        child = CASCADE.get(selector)
+        if child:
+            page.evaluate(MARK_OPTIONS_JS, child)
+        page.select_option(selector, value=value)
+        if not child:
+            return True
+        ok = self._poll(page, "options", OPTIONS_READY_JS, child)
+        if not ok:
+            page.evaluate(CLEAR_MARK_JS, child)
+            print(f"  !! {child} not repopulated within {self.timeouts['options']} ms")
+        return ok
+
+    def before_submit(self, page):
+        page.evaluate(MARK_TABLE_JS)
+
+    def table(self, page):
+        return self._poll(page, "table", TABLE_READY_JS)
+
+    def all_rows(self, page):
+        ok = self._poll(page, "all_rows", ALL_ROWS_READY_JS)
+        if not ok:
+            status = page.evaluate(ROW_STATUS_JS)
+            print(f"  !! Table incomplete: {status['rows']} of {status['total']} rows drawn")
+        return ok
+
+    def page(self, page, first, last):
+        ok = self._poll(page, "page", PAGE_READY_JS, [first, last])
+        if not ok:
+            print(f"  !! Rows {first}-{last} not drawn, table shows {page.evaluate(PAGE_RANGE_JS)}")
+        return ok
+
+    def summary(self):
+        lines = []
+        for step, values in sorted(self.timings.items()):
+            lines.append(
+                f"{step:>9}: n={len(values)} median={statistics.median(values):.2f}s "
+                f"max={max(values):.2f}s timeouts={self.timeouts_hit[step]}"
+            )
+        return "\n".join(lines)
+
+
+class AsyncWaiter(Waiter):
+    # Same waits for playwright.async_api pages
+
+    async def _poll(self, page, step, predicate, arg=None):
+        started = time.perf_counter()
+        try:
+            await page.wait_for_function(predicate, arg=arg, timeout=self.timeouts[step])
+            ok = True
+        except Exception:
+            ok = False
+        self.record(step, started, ok)
+        return ok
+
+    async def select(self, page, selector, value):
+        child = CASCADE.get(selector)
+        if child:
+            await page.evaluate(MARK_OPTIONS_JS, child)
+        await page.select_option(selector, value=value)
+        if not child:
+            return True
+        ok = await self._poll(page, "options", OPTIONS_READY_JS, child)
+        if not ok:
+            await page.evaluate(CLEAR_MARK_JS, child)
+            print(f"  !! {child} not repopulated within {self.timeouts['options']} ms")
+        return ok
+
+    async def before_submit(self, page):
+        await page.evaluate(MARK_TABLE_JS)
+
+    async def table(self, page):
+        return await self._poll(page, "table", TABLE_READY_JS)
+
+    async def all_rows(self, page):
+        ok = await self._poll(page, "all_rows", ALL_ROWS_READY_JS)
+        if not ok:
+            status = await page.evaluate(ROW_STATUS_JS)
+            print(f"  !! Table incomplete: {status['rows']} of {status['total']} rows drawn")
+        return ok
+
+    async def page(self, page, first, last):
+        ok = await self._poll(page, "page", PAGE_READY_JS, [first, last])
+        if not ok:
+            print(f"  !! Rows {first}-{last} not drawn, table shows {await page.evaluate(PAGE_RANGE_JS)}")
+        return ok
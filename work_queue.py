@@ -0,0 +1,470 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from playwright.async_api import async_playwright
+from playwright.sync_api import sync_playwright
+import pandas as pd
+import requests
+import argparse
+import asyncio
+import json
+import socket
+import sqlite3
+import threading
+import time
+import os
+
+from catalog import Catalog, LEVELS, CATALOG_PATH
+from navigator import Navigator
+from resource_policy import RequestPolicy
+from journal import Journal, DONE, FAILED
+from changes import content_hash
+from metrics import METRICS
+from context_pool import ContextPool
+from records import location, normalize, voter_columns
+from regions import RegionSpec, in_shard, parse_shard
+from rate_control import RateController, TIMEOUT, ERROR
+from crawl_async import Job, REGIONS, expand_jobs, job_key
+from http_scraper import make_session, get_options as http_get_options, parse_options, scrape_data as http_scrape_data
+from scrape_districts import (
+    DISTRICTS, OUTPUT_DIR, OUTPUT_FORMAT, SITE_URL, WAITS, RETRY,
+    ensure_dir, journal_path, save_centre, scrape_data as browser_scrape_data,
+)
+
+# Distributed crawl: one coordinator owns the job list, any number of
+# workers (on any host that can reach it) pull polling centres from it.
+#
+#   coordinator  seeds one job per centre of the requested regions into a
+#                SQLite queue and hands them out over HTTP with a lease.
+#                A lease that runs out (worker crashed, host gone) puts the
+#                job back in the queue. Workers post their records back and
+#                the coordinator saves them into its own output folder and
+#                journal, so workers keep no state.
+#   worker       lease -> scrape_data() -> complete / fail, until the queue
+#                is drained. --engine http needs no browser.
+#
+# Everything runs fine on one machine, e.g. against standin_server.py.
+
+QUEUE_PATH = "queue.sqlite"
+HOST = "127.0.0.1"  # no authentication: only listen wider (--host 0.0.0.0) on a trusted network
+PORT = 8700
+LEASE_SECONDS = 600
+MAX_ATTEMPTS = 3
+IDLE_WAIT = 5  # seconds a worker waits when every remaining job is leased
+
+PENDING = "pending"
+LEASED = "leased"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    job TEXT NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    token TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    rows INTEGER,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+"""
+
+
+class WorkQueue:
+    # Shared by the coordinator's request threads; every call holds the lock
+    def __init__(self, path=QUEUE_PATH, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+
+    def seed(self, jobs, done_keys=()):
+        # Jobs already in the queue keep their state; journaled ones start done
+        now = time.time()
+        with self.lock, self.conn:
+            for job in jobs:
+                key = job_key(job)
+                status = DONE if key in done_keys else PENDING
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO jobs (key, job, status, updated_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(job._asdict(), ensure_ascii=False), status, now),
+                )
+
+    def _expire(self, now):
+        # Leases that ran out go back to the queue
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, worker = NULL, token = NULL, updated_at = ? "
+            "WHERE status = ? AND lease_expires < ?",
+            (PENDING, now, LEASED, now),
+        )
+
+    def lease(self, worker):
+        # (key, job dict, token), or None when nothing is pending right now
+        now = time.time()
+        with self.lock, self.conn:
+            self._expire(now)
+            row = self.conn.execute(
+                "SELECT key, job FROM jobs WHERE status = ? ORDER BY rowid LIMIT 1", (PENDING,)
+            ).fetchone()
+            if row is None:
+                return None
+            token = os.urandom(8).hex()
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, token = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE key = ?",
+                (LEASED, worker, token, now + self.lease_seconds, now, row[0]),
+            )
+            return row[0], json.loads(row[1]), token
+
+    def holds(self, key, token):
+        # Whether token is the job's current lease (not expired and handed on)
+        with self.lock, self.conn:
+            self._expire(time.time())
+            row = self.conn.execute(
+                "SELECT 1 FROM jobs WHERE key = ? AND status = ? AND token = ?", (key, LEASED, token)
+            ).fetchone()
+            return row is not None
+
+    def complete(self, key, token, rows):
+        # Only the current lease holder can close a job, like fail()
+        with self.lock, self.conn:
+            cur = self.conn.execute(
+                "UPDATE jobs SET status = ?, rows = ?, token = NULL, error = NULL, updated_at = ? "
+                "WHERE key = ? AND status = ? AND token = ?",
+                (DONE, rows, time.time(), key, LEASED, token),
+            )
+            return cur.rowcount == 1
+
+    def fail(self, key, token, error):
+        # Only the current lease holder can hand a job back
+        with self.lock, self.conn:
+            row = self.conn.execute(
+                "SELECT attempts FROM jobs WHERE key = ? AND status = ? AND token = ?", (key, LEASED, token)
+            ).fetchone()
+            if row is None:
+                return False
+            status = FAILED if row[0] >= self.max_attempts else PENDING
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, token = NULL, error = ?, updated_at = ? WHERE key = ?",
+                (status, error, time.time(), key),
+            )
+            return True
+
+    def counts(self):
+        with self.lock, self.conn:
+            self._expire(time.time())
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in (PENDING, LEASED, DONE, FAILED)}
+
+    def close(self):
+        self.conn.close()
+
+
+def plan_http(catalog, regions, shard=None, base_url=SITE_URL):
+    # Same plan as crawl_async.expand_jobs(), filling catalog misses over HTTP
+    session = make_session()
+    dist_names = {d["id"]: d["name"] for d in DISTRICTS}
+    jobs = []
+
+    def level_options(level, parents):
+        cached = catalog.get(level, parents)
+        if cached is not None:
+            return cached
+        if level == "state":
+            found = parse_options(session.get(base_url, timeout=60).text, "state")
+        else:
+            found = http_get_options(session, level, dict(zip(LEVELS, parents)), base_url)
+        options = [(o["value"], o["text"]) for o in found]
+        catalog.put(level, parents, options)
+        return options
+
+    def walk(parents, path):
+        level = LEVELS[len(parents)]
+        for value, text in level_options(level, parents):
+            here = path + [(value, text)]
+            if not regions.allows(here):
+                continue
+            if level != "reg_centre":
+                walk(parents + [value], here)
+                continue
+            (state_val, _), (dist_id, dist_text), (mun_val, mun_text), (ward_val, ward_text), _ = here
+            job = Job(
+                state_val, dist_id, dist_names.get(dist_id, dist_text), mun_val, mun_text,
+                ward_val, ward_text, value, text,
+            )
+            if in_shard(job_key(job), shard):
+                jobs.append(job)
+
+    walk([], [])
+    session.close()
+    return jobs
+
+
+async def plan_browser(catalog, regions, shard=None, site_url=SITE_URL):
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page()
+        jobs = await expand_jobs(page, catalog, regions, shard, site_url)
+        await browser.close()
+    return jobs
+
+
+def make_handler(queue, journal, output_dir, output_format):
+    save_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, payload, status=200):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length).decode("utf-8")) if length else {}
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self.send_json(queue.counts())
+            else:
+                self.send_json({"error": "not found"}, status=404)
+
+        def do_POST(self):
+            try:
+                self.post(self.read_json())
+            except Exception as e:
+                # A bad request or a failed save: answer instead of dropping the
+                # connection. The job stays leased and is handed out again later.
+                print(f"!! {self.path} failed: {e}")
+                self.send_json({"accepted": False, "error": str(e)}, status=500)
+
+        def post(self, body):
+            if self.path == "/lease":
+                leased = queue.lease(body.get("worker", "?"))
+                if leased is None:
+                    self.send_json({"job": None, "counts": queue.counts()})
+                else:
+                    key, job, token = leased
+                    self.send_json({"key": key, "job": job, "token": token})
+
+            elif self.path == "/complete":
+                key, token, job = body["key"], body["token"], body["job"]
+                # Voter columns from the worker, the location from the job
+                frame = normalize(pd.DataFrame(body["columns"]), location(
+                    job["dist_name"], job["mun_text"], job["ward_text"], job["center_text"],
+                ))
+                with save_lock:
+                    if not queue.holds(key, token):
+                        # Lease expired and handed on, or the job is already closed
+                        self.send_json({"accepted": False, "error": "not the current lease"}, status=409)
+                        return
+                    if journal.done(key):
+                        queue.complete(key, token, len(frame))
+                        self.send_json({"accepted": False})
+                        return
+                    for stage, seconds in body.get("stages", {}).items():
+                        METRICS.observe(stage, seconds)  # timed on the worker
+                    path, digest = save_centre(
+                        frame, key, job["dist_name"], job["mun_text"], job["ward_text"], job["center_text"],
+                        output_dir, output_format,
+                    )
+                    journal.record(key, DONE, len(frame), path, digest, body.get("seconds"),
+                                   content=content_hash(frame), pulled=time.time())
+                    queue.complete(key, token, len(frame))
+                print(f"[{body.get('worker')}] {job['dist_name']} -> {job['mun_text']} -> Ward {job['ward_text']} "
+                      f"-> {job['center_text']}: {len(frame)} rows")
+                self.send_json({"accepted": True, "path": path})
+
+            elif self.path == "/fail":
+                ok = queue.fail(body["key"], body["token"], body.get("error", ""))
+                print(f"[{body.get('worker')}] !! {body['key']} failed: {body.get('error')}")
+                self.send_json({"accepted": ok})
+
+            else:
+                self.send_json({"error": "not found"}, status=404)
+
+    return Handler
+
+
+def serve(port=PORT, regions=REGIONS, shard=None, seed_engine="browser", site_url=SITE_URL,
+          output_dir=OUTPUT_DIR, output_format=OUTPUT_FORMAT, queue_path=QUEUE_PATH,
+          lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, catalog_path=CATALOG_PATH, host=HOST):
+    ensure_dir(output_dir)
+    METRICS.start(output_dir, "work_queue")  # metrics.jsonl and metrics_work_queue.prom, see metrics.py
+    regions = RegionSpec(regions)
+    journal = Journal(journal_path(output_dir, output_format))
+    queue = WorkQueue(queue_path, lease_seconds, max_attempts)
+
+    catalog = Catalog(catalog_path)
+    print(f"Seeding jobs for {regions} ({seed_engine})...")
+    if seed_engine == "http":
+        jobs = plan_http(catalog, regions, shard, site_url)
+    else:
+        jobs = asyncio.run(plan_browser(catalog, regions, shard, site_url))
+    catalog.close()
+    done_keys = {k for k in journal.entries if journal.done(k)}
+    queue.seed(jobs, done_keys)
+    print(f"{len(jobs)} centres planned; queue: {queue.counts()}")
+
+    server = ThreadingHTTPServer((host, port), make_handler(queue, journal, output_dir, output_format))
+    shown = socket.gethostname() if host == "0.0.0.0" else host
+    print(f"Coordinator on http://{shown}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+    queue.close()
+    journal.close()
+    METRICS.close()
+    print(METRICS.summary())
+
+
+class BrowserScraper:
+    # scrape_districts.scrape_data() on one page kept for the worker's lifetime
+    def __init__(self, rate, site_url=SITE_URL, headless=True):
+        self.rate = rate
+        self.playwright = sync_playwright().start()
+        self.browser = self.playwright.chromium.launch(headless=headless)
+        # Replaced every MAX_CENTRES centres or when the browser uses too much memory
+        self.pool = ContextPool(self.browser, RequestPolicy())
+        self.nav = Navigator(self.pool.page, WAITS, site_url, retry=RETRY)
+
+    def __call__(self, job):
+        started = time.perf_counter()
+        timeouts_before = sum(WAITS.timeouts_hit.values())
+        try:
+            self.nav.go(job["state_val"], job["dist_id"], job["mun_val"], job["ward_val"], job["center_val"])
+            # Always the whole table: the rows go back to the coordinator in
+            # one request, so "pages" mode's streaming to a local file does
+            # not apply to a worker
+            data = browser_scrape_data(
+                self.pool.page, job["dist_name"], job["mun_text"], job["ward_text"], job["center_text"],
+                mode="dom",
+            )
+        except Exception:
+            self.rate.observe(time.perf_counter() - started, ERROR)
+            self.pool.release(self.nav)
+            raise
+        timed_out = sum(WAITS.timeouts_hit.values()) > timeouts_before
+        self.rate.observe(time.perf_counter() - started, TIMEOUT if timed_out else None if not data.empty else ERROR)
+        self.pool.release(self.nav)
+        return data
+
+    def close(self):
+        self.pool.close()
+        print(self.pool.summary())
+        self.browser.close()
+        self.playwright.stop()
+
+
+class HttpScraper:
+    def __init__(self, rate, site_url=SITE_URL):
+        self.rate = rate
+        self.site_url = site_url
+        self.session = make_session()
+
+    def __call__(self, job):
+        values = (job["state_val"], job["dist_id"], job["mun_val"], job["ward_val"], job["center_val"])
+        return http_scrape_data(
+            self.session, values, job["dist_name"], job["mun_text"], job["ward_text"], job["center_text"],
+            self.site_url, self.rate,
+        )
+
+    def close(self):
+        self.session.close()
+
+
+def work(coordinator, engine="http", site_url=SITE_URL, worker_id=None, headless=True):
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    coordinator = coordinator.rstrip("/") + "/"
+    # Each worker paces itself; many workers back off independently
+    rate = RateController()
+    scraper = HttpScraper(rate, site_url) if engine == "http" else BrowserScraper(rate, site_url, headless)
+    rpc = requests.Session()
+
+    def call(path, payload):
+        resp = rpc.post(coordinator + path, json=dict(payload, worker=worker_id), timeout=60)
+        resp.raise_for_status()
+        return resp.json()
+
+    done = 0
+    try:
+        while True:
+            leased = call("lease", {})
+            if leased["job"] is None:
+                if leased["counts"][LEASED] == 0:
+                    break  # queue drained
+                time.sleep(IDLE_WAIT)  # others hold the rest; their leases may expire
+                continue
+
+            key, job, token = leased["key"], leased["job"], leased["token"]
+            METRICS.begin()
+            rate.wait()
+            started = time.perf_counter()
+            try:
+                frame = scraper(job)
+                error = None if not frame.empty else "no rows"
+            except Exception as e:
+                frame, error = None, str(e)
+
+            if error:
+                call("fail", {"key": key, "token": token, "error": error})
+            else:
+                try:
+                    call("complete", {
+                        "key": key, "token": token, "job": job, "columns": voter_columns(frame),
+                        "seconds": time.perf_counter() - started, "stages": METRICS.take(),
+                    })
+                except requests.RequestException as e:
+                    # Lease lost or the save failed; the coordinator hands the job out again
+                    print(f"[{worker_id}] !! {key} not accepted: {e}")
+                    continue
+                done += 1
+    finally:
+        scraper.close()
+        rpc.close()
+    print(f"[{worker_id}] queue drained, {done} centres completed")
+    print(rate.summary())
+    print(METRICS.summary())
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coordinator / worker for a distributed crawl.")
+    parser.add_argument("command", choices=["serve", "work", "status"])
+    parser.add_argument("--site-url", default=SITE_URL, help="Site root, e.g. a local standin_server.py")
+    # serve
+    parser.add_argument("--host", default=HOST, help="Address to listen on (0.0.0.0 for workers on other hosts)")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--region", action="append", help="Region spec (see regions.py); repeatable")
+    parser.add_argument("--shard", type=parse_shard, help="k/N: seed only this share of the centres")
+    parser.add_argument("--seed-engine", choices=["browser", "http"], default="browser",
+                        help="How to fill catalog misses while seeding")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--format", choices=["csv", "parquet"], default=OUTPUT_FORMAT)
+    parser.add_argument("--queue", default=QUEUE_PATH)
+    parser.add_argument("--catalog", default=CATALOG_PATH, help="Use a separate catalog when seeding from a stand-in site")
+    parser.add_argument("--lease", type=int, default=LEASE_SECONDS, help="Seconds before a job is handed out again")
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+    # work / status
+    parser.add_argument("--coordinator", default=f"http://127.0.0.1:{PORT}/")
+    parser.add_argument("--engine", choices=["http", "browser"], default="http")
+    parser.add_argument("--worker-id")
+    parser.add_argument("--headed", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.port, args.region or REGIONS, args.shard, args.seed_engine, args.site_url,
+              args.output_dir, args.format, args.queue, args.lease, args.max_attempts, args.catalog, args.host)
+    elif args.command == "work":
+        work(args.coordinator, args.engine, args.site_url, args.worker_id, not args.headed)
+    else:
+        print(requests.get(args.coordinator.rstrip("/") + "/stats", timeout=60).json())
@@ -0,0 +1,179 @@
+from playwright.sync_api import sync_playwright
+from urllib.parse import parse_qsl, urlencode
+import argparse
+import html
+import json
+import os
+import re
+
+from http_scraper import VIEW_PATH, parse_table, make_session, fetch_rows
+from standin_server import start, StandinSite, STATES, DISTRICTS
+from waits import Waiter
+
+# Network mode: take the voter rows from the table request's response instead
+# of waiting for the browser to render them and scraping them back out.
+#
+# The table request is routed through Playwright. Its response body is
+# parsed straight into row lists (an HTML table#tbl_data or a DataTables JSON
+# payload), and by default the page gets the response back with the rows
+# stripped out, so nothing is rendered. Waiting on the response itself
+# means the slow settle after Submit no longer matters. A server-side
+# DataTables request also has its page length raised to -1, so one response
+# carries every row.
+
+TABLE_URL = "**/" + VIEW_PATH
+TIMEOUT = 60000  # the view answers in seconds, not milliseconds
+
+TBODY_RE = re.compile(r"(<tbody[^>]*>).*?(</tbody>)", re.S | re.I)
+TAG_RE = re.compile(r"<[^>]+>")
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    return " ".join(html.unescape(TAG_RE.sub("", str(value))).split())
+
+
+def _is_json(body, content_type):
+    return "json" in content_type or body.lstrip()[:1] in ("{", "[")
+
+
+def parse_payload(body, content_type=""):
+    # Row lists from a table response, same shape as the DOM extraction
+    if not _is_json(body, content_type):
+        return parse_table(body)
+    payload = json.loads(body)
+    rows = payload
+    if isinstance(payload, dict):
+        rows = payload.get("data", payload.get("aaData", []))
+    return [
+        [_cell_text(c) for c in (row.values() if isinstance(row, dict) else row)]
+        for row in rows
+    ]
+
+
+def empty_payload(body, content_type=""):
+    # The same response with no rows left in it for the page to draw
+    if not _is_json(body, content_type):
+        return TBODY_RE.sub(r"\1\2", body)
+    payload = json.loads(body)
+    if isinstance(payload, list):
+        return "[]"
+    for field in ("data", "aaData"):
+        if field in payload:
+            payload[field] = []
+    for field in ("recordsTotal", "recordsFiltered", "iTotalRecords", "iTotalDisplayRecords"):
+        if field in payload:
+            payload[field] = 0
+    return json.dumps(payload)
+
+
+def all_rows_post_data(post_data):
+    # Server-side DataTables pages with start/length; ask for everything
+    if not post_data:
+        return None
+    fields = parse_qsl(post_data, keep_blank_values=True)
+    if not any(k in ("length", "iDisplayLength") for k, v in fields):
+        return None
+    fields = [
+        (k, "-1") if k in ("length", "iDisplayLength") else (k, "0") if k in ("start", "iDisplayStart") else (k, v)
+        for k, v in fields
+    ]
+    return urlencode(fields)
+
+
+class TableCapture:
+    def __init__(self, page, skip_render=True, record_dir=None, url=TABLE_URL):
+        self.page = page
+        self.skip_render = skip_render
+        self.record_dir = record_dir
+        self.url = url
+        self.rows = None
+        page.route(url, self._handle)
+
+    def _handle(self, route):
+        request = route.request
+        post_data = all_rows_post_data(request.post_data)
+        if post_data:
+            response = route.fetch(post_data=post_data)
+        else:
+            response = route.fetch()
+        body = response.text()
+        content_type = response.headers.get("content-type", "")
+        self.rows = parse_payload(body, content_type)
+
+        if self.record_dir:
+            self._record(request, body, content_type)
+        if self.skip_render:
+            route.fulfill(response=response, body=empty_payload(body, content_type))
+        else:
+            route.fulfill(response=response)
+
+    def _record(self, request, body, content_type):
+        # Saved as <reg_centre>.html/.json for standin_server.py --payloads
+        centre = dict(parse_qsl(request.post_data or "")).get("reg_centre", "unknown")
+        ext = "json" if _is_json(body, content_type) else "html"
+        if not os.path.exists(self.record_dir):
+            os.makedirs(self.record_dir)
+        with open(os.path.join(self.record_dir, f"{centre}.{ext}"), "w", encoding="utf-8") as f:
+            f.write(body)
+
+    def submit(self, submit_btn, timeout=TIMEOUT):
+        # Click Submit and return the rows carried by the table response
+        self.rows = None
+        with self.page.expect_response(lambda r: VIEW_PATH in r.url, timeout=timeout):
+            submit_btn.click()
+        # A form post navigates; let the (row-less) page settle before reuse
+        self.page.wait_for_load_state("domcontentloaded")
+        return self.rows
+
+    def close(self):
+        self.page.unroute(self.url, self._handle)
+
+
+def verify(centres=4, payloads=None, render=False, headless=True):
+    # Capture each stand-in centre through the browser and compare the rows
+    # with a plain HTTP fetch of the same centre
+    server, base_url = start(payloads=payloads)
+    site = StandinSite()
+    session = make_session()
+    waits = Waiter()
+    jobs = [
+        (state_val, dist_val, mun_val, ward_val, center_val)
+        for state_val, _ in STATES
+        for dist_val, _ in DISTRICTS.get(state_val, [])
+        for mun_val, _ in site.municipalities(dist_val)
+        for ward_val, _ in site.wards(mun_val)
+        for center_val, _ in site.centres(ward_val)
+    ][:centres]
+
+    mismatches = 0
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=headless)
+        page = browser.new_page()
+        capture = TableCapture(page, skip_render=not render)
+        for values in jobs:
+            page.goto(base_url)
+            for selector, value in zip(("state", "district", "vdc_mun", "ward"), values):
+                waits.select(page, f"select#{selector}", value)
+            page.select_option("select#reg_centre", value=values[-1])
+            rows = capture.submit(page.query_selector("button.btn-success"))
+            expected = fetch_rows(session, *values, base_url=base_url)
+            ok = rows == expected
+            mismatches += not ok
+            drawn = page.evaluate("() => document.querySelectorAll('table#tbl_data tbody tr').length")
+            print(f"{values[-1]}: {len(rows)} rows captured, {drawn} drawn, {'ok' if ok else 'MISMATCH'}")
+        browser.close()
+    server.shutdown()
+    print(f"{len(jobs) - mismatches}/{len(jobs)} centres match")
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check network-mode table capture against the stand-in site.")
+    parser.add_argument("--centres", type=int, default=4)
+    parser.add_argument("--payloads", help="Serve recorded table responses from this folder")
+    parser.add_argument("--render", action="store_true", help="Let the page draw the rows too")
+    parser.add_argument("--headed", action="store_true")
+    args = parser.parse_args()
+    verify(args.centres, args.payloads, args.render, not args.headed)